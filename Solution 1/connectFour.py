@@ -1,47 +1,54 @@
 import os
+import sys
+import time
 import termcolor
 import game_play
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from connectfour import bitboard, engine, metrics, notation, render
 
 # Functions related to pre-game setup and playing the game
 # All functions take either all or a subset of these parameters:
-#   mapping       - 2D list which emulates the printed board on screen
+#   mapping       - Position (connectfour.bitboard) which emulates the printed board on screen.
+#                   It can be read like a 2D list: mapping[row][column]
 #   player        - Name of the current player
 #   player_index  - 1 or 2 for player 1 or player 2 respectively
 #   player_names  - List with both the player names
 #   board_size    - Width of the board as entered by the user at the start of the game
+#   rows          - Height of the board, the same as board_size unless the user entered both
+#   connect       - Coins in a row needed to win
 #   move_count    - Count of moves played up until this point
 
 
+# The size is a number for a square board, or width x height (e.g. 7x6)
+# Returns (board_size, rows)
 def get_board_size():
     attempts = 3
-    board_size = 0
+    allowed = "{0} to {1}, or width x height like 7x6".format(bitboard.MIN_SIZE, bitboard.MAX_SIDE)
     while True:
         try:
-            board_size = int(input("Enter the board size [5 - 10]: \n"))
-            if board_size < 5 or board_size > 10:
-                print("The input value is invalid! The allowed values are: {0}".format(str([5, 6, 7, 8, 9, 10])))
+            sides = [int(side) for side in input("Enter the board size [{0}]: \n".format(allowed)).lower().split('x')]
+            if len(sides) > 2:
+                raise ValueError
+            board_size, rows = sides[0], sides[-1]
+            if not all(bitboard.MIN_SIZE <= side <= bitboard.MAX_SIDE for side in sides):
+                print("The input value is invalid! The allowed values are: {0}".format(allowed))
                 continue
         except ValueError:
             attempts -= 1
             if attempts >= 0:
-                print("The input value is invalid! The allowed values are: {0}".format(str([5, 6, 7, 8, 9, 10])))
+                print("The input value is invalid! The allowed values are: {0}".format(allowed))
                 print("You have {} tries left. Failing which board size is defaulted to 7".format(attempts))
                 continue
             else:
                 print("Too many wrong entries. board size defaulted to 7!")
-                board_size = 7
+                board_size = rows = 7
                 break
         break
-    return board_size
+    return board_size, rows
 
 
-def build_mapping(board_size):
-    mapping = []
-    for i in range(board_size):
-        mapping.append([])
-        for j in range(board_size):
-            mapping[i].append(0)
-    return mapping
+def build_mapping(board_size, rows=0, connect=bitboard.CONNECT):
+    return bitboard.Position(board_size, rows, connect)
 
 
 def get_player_names():
@@ -53,25 +60,72 @@ def get_player_names():
     return player_names, player, player_index
 
 
-def play_game(mapping, player_names, player_index, player, board_size):
-    move_count = 0
-    game = game_play.state_of_game(mapping, 0, player_index, board_size, move_count)
-    while game == "ON":
-        os.system("clear")
-        game_play.print_board(mapping, board_size)
-        column, mapping, move_count = game_play.make_move(mapping, player, board_size, move_count, player_index)
-        if 0 <= column < board_size:
-            game = game_play.state_of_game(mapping, column, player_index, board_size, move_count)
-            if game not in ["OVER", "DRAW"]:
-                player, player_index = game_play.toggle(player, player_names)
+# The rules are played by connectfour.engine, this function only reads moves and prints the board
+# get_move is called as get_move(player, board_size) and returns a 1-based column
+# The board is drawn with the same layout as game_play.print_board, but after the first frame only
+# the coins which changed are written to the screen (see connectfour.render)
+# The time waited for each move and the time from the move to the redrawn board go to connectfour.metrics
+# With export (a file path) the game is added to a text record file (see connectfour.notation) when it
+# ends, or when it is interrupted so that it can be resumed
+# Returns the engine.Game played
+def play_game(mapping, player_names, player_index, player, board_size, get_move=game_play.get_move, export=None):
+    game = engine.Game.from_position(mapping, player_index)
+    renderer = render.TerminalRenderer(game_play.COLORS, top=3, indent=5)
+    entered = 0
+    while game.outcome == engine.ON:
+        renderer.draw(game.position)
+        if entered:
+            metrics.observe('move_seconds', time.perf_counter() - entered)
+        asked = time.perf_counter()
+        try:
+            column = get_move(player, board_size)
+        except (KeyboardInterrupt, EOFError):
+            if export:
+                notation.append_record(export, record_game(game, player_names))
+            raise
+        entered = time.perf_counter()
+        metrics.observe('input_wait_seconds', entered - asked)
+        if game.is_legal(column - 1):
+            if game.play(column - 1).outcome != engine.ON:
+                break
         else:
-            player, player_index = game_play.toggle(player, player_names)
-    if game == "OVER":
-        os.system("clear")
-        game_play.print_board(mapping, board_size)
+            game.skip()
+        player, player_index = game_play.toggle(player, player_names)
+    renderer.draw(game.position)
+    metrics.observe('move_seconds', time.perf_counter() - entered)
+    if game.outcome == engine.OVER:
         termcolor.cprint("Congrats {}!!!".format(player), "blue", end=" ")
         termcolor.cprint(" You've won the game!!", "green")
     else:
-        os.system("clear")
-        game_play.print_board(mapping, board_size)
         termcolor.cprint("It's a tie!", "magenta")
+    if export:
+        notation.append_record(export, record_game(game, player_names))
+    return game
+
+
+# Move log of a game, with the names and colors of the players, as kept in record files
+def record_game(game, player_names):
+    return notation.record_from_game(game, tuple((name, game_play.COLORS[index + 1])
+                                                 for index, name in enumerate(player_names)))
+
+
+# Show a recorded game move by move
+def replay_game(record, delay=1.0):
+    game = engine.Game(record.size, 1, record.rows, record.connect)
+    renderer = render.TerminalRenderer(game_play.COLORS, top=3, indent=5)
+    renderer.draw(game.position)
+    for col in record.moves:
+        time.sleep(delay)
+        if col == notation.PASS:
+            game.skip()
+        else:
+            game.play(col)
+        renderer.draw(game.position)
+    names = [name for name, color in record.players]
+    if game.outcome == engine.OVER:
+        termcolor.cprint("{} won the game".format(names[game.winner - 1]), "green")
+    elif game.outcome == engine.DRAW:
+        termcolor.cprint("It was a tie!", "magenta")
+
+
+metrics.hook(sys.modules[__name__], 'play_game', 'game_seconds', site='connectFour.play_game')
@@ -3,32 +3,31 @@ import game_state as gs
 
 # Functions related to game play steps
 # All functions take either all or a subset of these parameters:
-#   mapping       - 2D list which emulates the printed board on screen
+#   mapping       - Position (connectfour.bitboard) which emulates the printed board on screen.
+#                   It can be read like a 2D list: mapping[row][column]
 #   player        - Name of the current player
 #   player_index  - 1 or 2 for player 1 or player 2 respectively
 #   player_names  - List with both the player names
 #   board_size    - Width of the board as entered by the user at the start of the game
 #   move_count    - Count of moves played up until this point
+#   tracker       - WinTracker (connectfour.wincheck) counting the coins of each player in every line.
+#                   Optional, without it the lines through the latest coin are read from the mapping
+
+
+# Colors of an empty cell, player 1 and player 2
+COLORS = {0: "grey", 1: "red", 2: "yellow"}
+# Colored coin for each value of the mapping, built once
+COINS = {index: termcolor.colored("\u2B24", color) for index, color in COLORS.items()}
 
 
 # Generate playing board with updated color coding for game progression
+# The whole board is built as one string and printed at once, one line per row of the mapping
 def print_board(mapping, board_size=7):
-    text = "\u2B24"
-    print("\n\n")
-    for i in range(board_size):
-        print(' ' * 5, end='')
-        for j in range(board_size):
-            if mapping[i][j] == 1:
-                termcolor.cprint(text, "red", end='  ')
-            elif mapping[i][j] == 2:
-                termcolor.cprint(text, "yellow", end='  ')
-            else:
-                termcolor.cprint(text, "grey", end='  ')
-        print()
-    print(' '*5, end='')
-    for i in range(board_size):
-        print(i + 1, end='  ')
-    print()
+    lines = ["\n\n"]
+    for i in range(len(mapping)):
+        lines.append(' ' * 5 + ''.join(COINS[value] + '  ' for value in mapping[i]))
+    lines.append(' ' * 5 + ''.join(str(i + 1).ljust(3) for i in range(board_size)))
+    print('\n'.join(lines))
 
 
 # Get the column where the user wants to drop their coin
@@ -54,35 +53,33 @@ def get_move(player, board_size):
 
 
 # Based on the column chosen by current player, the mapping table is updated and move count incremented
-def make_move(mapping, player, board_size, move_count, player_index):
+# A full column counts as an invalid move and is returned as -1
+def make_move(mapping, player, board_size, move_count, player_index, tracker=None):
     column = get_move(player, board_size)
-    if column < 0 or column > board_size:
-        return column, mapping, move_count
+    if not mapping.can_play(column - 1):
+        return -1 if 1 <= column <= board_size else column, mapping, move_count
     else:
-        for i in reversed(range(0, board_size)):
-            if mapping[i][column - 1] == 0:
-                mapping[i][column - 1] = player_index
-                break
+        row = mapping.play(column - 1, player_index)
+        if tracker is not None:
+            tracker.place(row, column - 1, player_index)
         move_count += 1
     return column, mapping,  move_count
 
 
 # Checks and updates (if needed) the state of the game --> "ON", "DRAW", "OVER"
-def state_of_game(mapping, column, player_index, board_size, move_count):
-    if move_count <= 6:  # Minimum number of total moves == 7 for a chance at winning
+def state_of_game(mapping, column, player_index, board_size, move_count, tracker=None):
+    if move_count < 2 * mapping.connect - 1:  # Minimum number of total moves == 7 (for four) for a chance at winning
         return "ON"
     else:
-        pos = (-1, -1)  # Tuple holding the (row, column) of current input
-        for i in range(board_size):  # column = 3 | mapping_T[?][2] --> first occurrence of index
-            if mapping[i][column-1] == player_index:
-                pos = (i, column-1)
-                break
-        count = 0
-        count += gs.look_left_right(mapping, pos, player_index, board_size) +\
-                 gs.look_up_down(mapping, pos, player_index, board_size) + \
-                 gs.look_left_diagonal(mapping, pos, player_index, board_size) + \
-                 gs.look_right_diagonal(mapping, pos, player_index, board_size)
-    return "DRAW" if move_count == board_size ** 2 and count == 0 else "OVER" if count >= 3 else "ON"
+        pos = (mapping.top_row(column - 1), column - 1)  # Tuple holding the (row, column) of current input
+        if tracker is not None:  # Only the counters of the lines through pos are read
+            count = 0 if tracker.winning_line(pos[0], pos[1], player_index) is None else 3
+        else:
+            count = gs.look_left_right(mapping, pos, player_index, board_size) + \
+                    gs.look_up_down(mapping, pos, player_index, board_size) + \
+                    gs.look_left_diagonal(mapping, pos, player_index, board_size) + \
+                    gs.look_right_diagonal(mapping, pos, player_index, board_size)
+    return "DRAW" if move_count == mapping.cells and count == 0 else "OVER" if count >= 3 else "ON"
 
 
 # Switch between player 1 and player 2
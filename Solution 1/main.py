@@ -1,8 +1,38 @@
+import sys
 import termcolor
 import connectFour as conn4
+from connectfour import bitboard, engine, metrics, notation
 
-# Get board size from user
-board_size = conn4.get_board_size()
+# --metrics PATH records timings of the game loop, written as JSON lines (Prometheus text for *.prom) at exit
+if '--metrics' in sys.argv[:-1]:
+    metrics.enable(sys.argv[sys.argv.index('--metrics') + 1])
+
+# --connect N plays N in a row instead of four
+connect = int(sys.argv[sys.argv.index('--connect') + 1]) if '--connect' in sys.argv[:-1] else bitboard.CONNECT
+if not bitboard.MIN_CONNECT <= connect <= bitboard.MAX_CONNECT:
+    sys.exit("--connect must be from {0} to {1}".format(bitboard.MIN_CONNECT, bitboard.MAX_CONNECT))
+
+# --export PATH adds every game played (or left unfinished) to a text record file (see connectfour.notation)
+export = sys.argv[sys.argv.index('--export') + 1] if '--export' in sys.argv[:-1] else None
+
+# --load PATH [--game K] replays a finished game of a record file, or resumes an unfinished one
+if '--load' in sys.argv[:-1]:
+    game_number = int(sys.argv[sys.argv.index('--game') + 1]) if '--game' in sys.argv[:-1] else -1
+    record = notation.load_record(sys.argv[sys.argv.index('--load') + 1], game_number)
+    game = notation.game_from_record(record)
+    player_names = [name for name, color in record.players]
+    if game.outcome != engine.ON:
+        conn4.replay_game(record)
+    else:
+        conn4.play_game(game.position, player_names, game.player, player_names[game.player - 1], record.size,
+                        export=export)
+    sys.exit()
+
+# Get board size from user, the line to connect has to fit on the board
+board_size, rows = conn4.get_board_size()
+if connect > max(board_size, rows):
+    print("{0} in a row does not fit on this board, playing {1} in a row".format(connect, max(board_size, rows)))
+    connect = max(board_size, rows)
 
 # Print warning message regarding penalty for more than 3 incorrect move inputs
 acceptable_values = [x for x in range(1,board_size+1)]
@@ -11,13 +41,15 @@ print("While making a move be careful to enter only valid values!\n" +
       "Providing an incorrect value more than 3 times serves as a penalty and your turn ", end='')
 termcolor.cprint("WILL BE SKIPPED!", "red", attrs=["bold"])
 print("In this instance your board size is {0} and so the acceptable values are ONLY {1}\n"\
-      .format(board_size, acceptable_values))
+      .format(board_size if rows == board_size else "{0}x{1}".format(board_size, rows), acceptable_values))
+if connect != bitboard.CONNECT:
+    termcolor.cprint("Connect {0} in a row to win!\n".format(connect), "yellow", attrs=["bold"])
 
 # Build mapping table (a 2D list) which maintains the position each player has played
-mapping = conn4.build_mapping(board_size)
+mapping = conn4.build_mapping(board_size, rows, connect)
 
 # Get the player names, set the current player as Player1 and corresponding player index to 1
 player_names, player, player_index = conn4.get_player_names()
 
 # Begin playing the game
-conn4.play_game(mapping, player_names, player_index, player, board_size)
+conn4.play_game(mapping, player_names, player_index, player, board_size, export=export)
@@ -1,9 +1,10 @@
 import os
 import time
-import copy
+import sys
 import termcolor
 from collections import namedtuple
-# ToDO: Fix bug for directional lookup not searching till the end
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from connectfour import bitboard, engine, metrics, notation, render, replay
 # ToDo: Logging functionality
 
 
@@ -22,17 +23,24 @@ class Player:
     index = 0
     attempts = 4
 
-    def __new__(cls):
+    def __new__(cls, name: str = ''):
         """
         Update index and create a new player
         """
         cls.index += 1
         return object.__new__(cls)
 
-    def __init__(self):
+    def __init__(self, name: str = ''):
         """
         Retrieve the name of the player as user input
+
+        :param name: Name of the player, taken as it is (e.g. from a
+                     saved game). The user is only asked for a name
+                     when none is given
         """
+        if name:
+            self.name = name
+            self.attempts = 0
         while self.attempts:
             with self:
                 self.name = input(f"Player {self.index} Name: ")
@@ -101,32 +109,50 @@ class Board:
 
     Class Variables:
     ----------------
-    size --> Size of the game board. Valid values are 5-10
+    size --> Width of the game board. Valid values are 5-20
+    rows --> Height of the game board, the same as size unless the user
+             entered both (e.g. 7x6)
+    connect --> Coins in a row needed to win, four unless changed
     attempts --> Chances the user has to input a valid board size
-    is_player --> Definition of namedtuple for player information
+    is_player --> Definition of namedtuple for player information. agent
+                  is None for a person, else the computer player choosing
+                  the moves (see connectfour.solver.Solver.move)
     is_playing --> Definition of namedtuple for current/next player
+    archive --> Path of the replay archive finished games are added to,
+                games are not saved when None
+    records --> Path of the text record file (see connectfour.notation)
+                finished games are added to, not written when None
 
     Attributes:
     -----------
-    mapping --> 2-dimensional list recording the current state of
-                the game board >> type = list
+    game --> Rules and state of the game being played >> type = engine.Game
+    position --> Bitboard recording the current state of the game
+                 board (game.position) >> type = bitboard.Position
+    mapping --> 2-dimensional list view of position >> type = list
     p1 --> Player 1 info >> type = is_player
     p2 --> Player 2 info >> type = is_player
     plyr --> Current/next Player >> type = is_playing
-    replay --> List maintaining history of mapping matrix for each move
+    replay --> Move log of the game so far >> type = replay.GameRecord
 
     The class and it's functions are defined in such way that simply
     calling the class will start and run the game.
+    Board is the command line front-end of engine.Game: it turns the
+    input of the players into moves and prints the board, the rules
+    themselves live in the connectfour package.
     """
 
     size = 0
+    rows = 0
+    connect = bitboard.CONNECT
     attempts = 4
-    is_player = namedtuple("is_player", ["name", "index", "color"])
+    is_player = namedtuple("is_player", ["name", "index", "color", "agent"], defaults=[None])
     is_playing = namedtuple("is_playing", ["now", "next"])
+    archive = None
+    records = None
 
-    def __new__(cls):
+    def __new__(cls, size: int = 0, players: tuple = (), play: bool = True, opponent=None, rows: int = 0):
         """
-        Create a new board and it's corresponding mapping matrix
+        Create a new board and it's corresponding position
 
         This method is technically unnecessary but, exists conceptually.
         The concept being the board must exist in order for the game to
@@ -134,36 +160,38 @@ class Board:
             1. Creates a new instance of this class
             2. Accepts and validates the board size as user input by calling
                the class-method - build_board
-            3. Initializes and builds the mapping matrix
+            3. Initializes an empty position
             4. Displays the empty board on screen
 
         Additional Info:
         ----------------
-        The mapping matrix is a 2-dimensional list (a list within
-        a list) which maintains the current state of the board
-        displayed on screen
+        The position (see connectfour.bitboard) maintains the current
+        state of the board displayed on screen
         The p1 and p2 attributes are dummy values here. This is
-        needed to print the initial board
+        needed to print the initial board. They are set on the
+        instance, so boards made in one process never share players
+        When size is given the user is not asked for it and nothing
+        is displayed (see __init__ for players and play)
         """
 
-        print("Building your board!")
         self = object.__new__(cls)
-        while self.attempts:
-            cls.build_board(self)
-        self.mapping = []
-        for row in range(self.size):
-            self.mapping.append([])
-            for col in range(self.size):
-                self.mapping[row].append(0)
-        print("Okay")
-        print(self.mapping)
-        cls.p1 = cls.is_player('name', 1, 'grey')  # Dummy player 1 for initial printing of board
-        cls.p2 = cls.is_player('name', 2, 'grey')  # Dummy player 2 for initial printing of board
-
-        print(self)
+        if size:
+            self.size = size
+            self.rows = rows or size
+            self.attempts = 0
+        else:
+            print("Building your board!")
+            while self.attempts:
+                cls.build_board(self)
+        self.game = engine.Game(self.size, 1, self.rows, self.connect)
+        self.p1 = cls.is_player('name', 1, 'grey')  # Dummy player 1 for initial printing of board
+        self.p2 = cls.is_player('name', 2, 'grey')  # Dummy player 2 for initial printing of board
+        if not size:
+            print("Okay")
+            self.show()
         return self
 
-    def __init__(self):
+    def __init__(self, size: int = 0, players: tuple = (), play: bool = True, opponent=None, rows: int = 0):
         """
         Initiate gameplay
 
@@ -172,8 +200,7 @@ class Board:
             1.2. Generate index for player (done in class Player)
             1.3. Get choice of color as user input
         2. Setting up current player
-        3. Initialize and update replay[] list with blank mapping
-           matrix
+        3. Initialize the move log (see the replay property)
         4. Re-print the blank board -- to clear the player info
            from screen
         5. Call self as a function to run gameplay
@@ -187,17 +214,33 @@ class Board:
         The color 'grey' is the color used for an unoccupied position
         on the board and is therefore not a choice available to
         either player.
+
+        :param size: Width of the board, asked as user input when not given
+        :param players: ((name, color), (name, color)) for player 1 and 2,
+                        asked as user input when not given. A third value
+                        in a pair is used as the agent of that player
+        :param play: When False the board is set up but gameplay is not started
+        :param opponent: Agent to play as player 2 (named Computer) instead of
+                         asking for a second player
+        :param rows: Height of the board, the same as size by default
         """
 
         color_set = {'red', 'yellow', 'blue', 'magenta', 'green', 'cyan', 'white'}
-        self.p1 = self.is_player(Player().name, Player.index, self.set_color(color_set))
-        color_set -= {self.p1.color}
-        self.p2 = self.is_player(Player().name, Player.index, self.set_color(color_set))
+        if players:
+            (name1, color1, *agent1), (name2, color2, *agent2) = players
+            self.p1 = self.is_player(Player(name1).name, 1, color1, *agent1)
+            self.p2 = self.is_player(Player(name2).name, 2, color2, *agent2)
+        else:
+            self.p1 = self.is_player(Player().name, Player.index, self.set_color(color_set))
+            color_set -= {self.p1.color}
+            if opponent is not None:
+                self.p2 = self.is_player('Computer', 2, sorted(color_set)[0], opponent)
+            else:
+                self.p2 = self.is_player(Player().name, Player.index, self.set_color(color_set))
         self.plyr = self.is_playing(self.p1, self.p2)
-        self.replay = []
-        self.replay.append(copy.deepcopy(self.mapping))
-        print(self)
-        self()
+        if play:
+            self.show()
+            self()
 
     def __call__(self):
         """
@@ -205,35 +248,56 @@ class Board:
 
             When an instance is called:
             1. Appropriate player (1 or 2) makes a move
-            2. The mapping matrix is updated with the latest move
+            2. The position is updated with the latest move
             3. Board is updated and printed to screen
             4. Check to see if the player has won - if, yes mention the winner and the game is over
-            5. If not, toggle the player and repeat
+            5. Check to see if the board is full - if, yes the game is a tie
+            6. If not, toggle the player and repeat
 
         Additional Info:
         ----------------
             Any move made by a player is recognized as an
             intersection in the mapping matrix which is represented
-            by the tuple (row, col). This tuple representation
-            is used in the function- solution_map to validate
-            if a player has won
+            by the tuple (row, col). The move is handed to
+            engine.Game which reports if the player has won
+            A column which is full or not on the board is
+            refused and the same player is asked again
+            A computer player is asked for its move through
+            its agent instead of input
+            The time waited for a move and the time from the
+            move to the redrawn board go to connectfour.metrics
 
         """
 
         while True:
             print(f"{self.plyr.now.name}, it's your move")
-            _col = int(input("Place your coin by entering the column: ")) - 1
-            _row = -1
-            for i in reversed(range(self.size)):
-                if self.mapping[i][_col] == 0:
-                    _row = i
-                    break
-            self.mapping[_row][_col] = self.plyr.now.index
-            self.replay.append(copy.deepcopy(self.mapping))
-            print(self)
-            state = self.solution_map(_row, _col)
-            if state == 1:
+            try:
+                asked = time.perf_counter()
+                if self.plyr.now.agent is not None:
+                    _col = self.plyr.now.agent.move(self.game)
+                else:
+                    _col = int(input("Place your coin by entering the column: ")) - 1
+                entered = time.perf_counter()
+                result = self.game.play(_col)
+            except ValueError as exc_val:
+                termcolor.cprint(exc_val, 'red', 'on_yellow', attrs=['bold'])
+                continue
+            except (KeyboardInterrupt, EOFError):
+                # Keep the unfinished game in the record file so it can be resumed with --load
+                if self.records:
+                    notation.append_record(self.records, self.replay)
+                raise
+            self.show()
+            metrics.observe('input_wait_seconds' if self.plyr.now.agent is None else 'agent_seconds', entered - asked)
+            metrics.observe('move_seconds', time.perf_counter() - entered)
+            if result.outcome == engine.OVER:
                 print(f'{self.plyr.now.name} has won the game!')
+                self.save()
+                self.playback(input("Would you like to watch a replay? (y/n): "))
+                break
+            elif result.outcome == engine.DRAW:
+                print("It's a tie!")
+                self.save()
                 self.playback(input("Would you like to watch a replay? (y/n): "))
                 break
             else:
@@ -254,33 +318,14 @@ class Board:
         Used to display the mapping matrix
         """
 
-        text = ''
-        for row in range(self.size):
-            for col in range(self.size):
-                text += str(self.mapping[row][col])
-            text += '\n'
-        return text
+        return repr(self.position)
 
     def __str__(self):
         """
-        Print the game-board in current state
+        The game-board in current state
         """
 
-        color_table = {
-            0: 'grey',
-            1: self.p1.color,
-            2: self.p2.color
-        }
-        os.system('clear')
-        text = ''
-        for row in range(self.size):
-            for col in range(self.size):
-                text += termcolor.colored('\u2b24  ', color_table[self.mapping[row][col]])
-            text += '\n'
-        for row in range(self.size):
-            text += str(row+1) + '  '
-        text += '\n'
-        return text
+        return self.renderer.text(self.position)
 
     def __enter__(self):
         """
@@ -304,7 +349,8 @@ class Board:
 
         The user has three(3) attempts after the first incorrect input.
         Inputting an invalid value beyond the allowed attempts results in
-        defaulting the board size to seven(7).
+        defaulting the board size to seven(7), or to the length of the
+        line to connect when that is longer.
 
         """
         if exc_type is ValueError:
@@ -312,9 +358,9 @@ class Board:
             if self.attempts:
                 error = termcolor.colored(exc_val, 'red', 'on_yellow', attrs=['bold'])
                 print(error, f'\nYou have {self.attempts} attempts left. '
-                             f'After which board size will be defaulted to 7')
+                             f'After which board size will be defaulted to {max(7, self.connect)}')
             else:
-                self.size = 7
+                self.size = self.rows = max(7, self.connect)
                 os.system('clear')
                 termcolor.cprint('\n\nToo many incorrect inputs', 'red', attrs=['bold'])
                 time.sleep(1)
@@ -326,20 +372,62 @@ class Board:
                     time.sleep(1)
             return True
 
+    def show(self):
+        """
+        Draw the game-board on screen
+
+        Only the first call clears the screen and draws the whole board,
+        later calls rewrite just the cells which changed since the one
+        before (see connectfour.render)
+        """
+
+        self.renderer.draw(self.position)
+
+    @property
+    def renderer(self) -> render.TerminalRenderer:
+        """
+        Renderer using the colors of the players, built again when they change
+        """
+
+        color_table = {
+            0: 'grey',
+            1: self.p1.color,
+            2: self.p2.color
+        }
+        if getattr(self, '_renderer', None) is None or self._color_table != color_table:
+            self._color_table = color_table
+            self._renderer = render.TerminalRenderer(color_table)
+        return self._renderer
+
+    @property
+    def position(self) -> bitboard.Position:
+        return self.game.position
+
+    @property
+    def mapping(self) -> list:
+        """
+        The mapping matrix is a 2-dimensional list (a list within
+        a list) built from the position. Row 0 is the top of the board
+        """
+
+        return self.position.to_mapping()
+
+    @mapping.setter
+    def mapping(self, matrix: list):
+        self.game = engine.Game.from_position(bitboard.Position.from_mapping(matrix))
+
     def map_value(self, row: int, col: int) -> int:
         """
         Used to return the value in the mapping matrix if valid,
         else returns 0
 
-        :param row: The row index of the mapping matrix where the current user
-                    made the latest move
-        :param col: The column index of the mapping matrix where the current user
-                    made the latest move
-        :return: Value: 1 if the current player has won else Value: 0
+        :param row: The row index of the mapping matrix
+        :param col: The column index of the mapping matrix
+        :return: Value: 0/1/2 of the cell, 0 when the cell is off the board
 
         """
 
-        return self.mapping[row][col] if [0 <= x <= (self.size - 1) for x in [row, col]].count(True) == 2 else 0
+        return self.position.cell(row, col) if 0 <= row < self.rows and 0 <= col < self.size else 0
 
     def solution_map(self, row: int, col: int) -> bool:
         """
@@ -351,60 +439,68 @@ class Board:
                     made the latest move
         :return: Value: 1 if the current player has won else Value: 0
 
-        Dispatch Table --> path_table:
-        ------------------------------
-        The function uses a dispatch table to generate dictionaries which
-        hold the possible paths to look for a win situation
-
-        Keys:
-            1 --> Looking left - right
-            2 --> Looking up - down
-            3 --> Looking bottom-left to top-right
-            4 --> Looking bottom-right to top-left
-
-        For each key in path_table the corresponding value is a dictionary
-        which looks like {(r1, c1): 0, (r2, c2): 1 ... (rn, cn): 0}
-        where r1, r2 ... rn are all valid row indexes for the mapping
-        matrix and c1, c2...cn are all valid column indexes for the mapping
-        matrix.
-        The value for each pair (rn, cn) can either be 0 or 1 or 2 depending
-        on which player has occupied that intersection in the mapping matrix.
-
-        The return Statement:
-        ---------------------
-        The return statement is a one-liner which does -
-            1. Builds a list of all the solution path dictionaries obtained
-               from the dispatch table path_table e.g. [{(4,3): 1, (3,2): 0}]
-            2. Builds a list of the values of each key for each dictionary
-               obtained in (1.) e.g. [1,0]
-            3. Converts it into a list of string values rather than int.
-               e.g. '1,0'
-               Note:: While converting to string all ascii-whitespaces are
-                      removed
-            4. Checks if the "win-string" is a substring of the one obtained
-               in (3.) e.g. '1,0' in '1,0' --> True
-               At this point a list of True/False values is available indicating
-               if at least one path is a win solution.
-            5. The sum of the True/False list is checked against 0 to create the
-               final return value.
-        """
-
-        path_table = {
-            1: {(row, c): self.map_value(row, c) for c in range(max(0, col - 3), min(self.size, col + 4))},
-            2: {(r, col): self.map_value(r, col) for r in range(max(0, row - 3), min(self.size, row + 4))},
-            3: {**{(r, c): self.map_value(r, c) for (r, c) in [(row + i, col - i)
-                                                               for i in range(min(self.size - row, col))]},
-                **{(r, c): self.map_value(r, c) for (r, c) in [(row - i, col + i)
-                                                               for i in range(min(row, self.size - col))]}},
-            4: {**{(r, c): self.map_value(r, c) for (r, c) in [(row - i, col - i)
-                                                               for i in range(min(row, col) + 1)]},
-                **{(r, c): self.map_value(r, c) for (r, c) in [(row + i, col + i)
-                                                               for i in range(min(self.size - row, self.size - col))]}}
-        }
-        return sum(list(map(lambda z: ((str(self.plyr.now.index) + ',')*4)[:-1] in z,
-                            list(map(lambda s: str(s).replace(' ', ''),
-                                     list(map(lambda x: [y for y in x.values()],
-                                              [val for val in path_table.values()]))))))) >= 1
+        Additional Info:
+        ----------------
+        Only the player who made the latest move can have completed a
+        line, and only through the cell (row, col). The tracker already
+        counts the coins of each player in every line of four, so this
+        reads the counters of the (at most 4 * connect) lines through
+        that cell.
+        """
+
+        return self.game.tracker.winning_line(row, col, self.plyr.now.index) is not None
+
+    @property
+    def replay(self) -> replay.GameRecord:
+        """
+        Move log of the game: board shape, players and the columns played
+        """
+
+        return replay.GameRecord(self.size, ((self.p1.name, self.p1.color), (self.p2.name, self.p2.color)),
+                                 bytes(self.game.moves), self.game.winner, 0 if self.rows == self.size else self.rows,
+                                 self.connect)
+
+    def position_at(self, move: int) -> bitboard.Position:
+        """
+        Position after a number of moves, rebuilt from the move log
+
+        :param move: Number of moves to replay
+        :return: New position
+        """
+
+        return replay.position_at(self.replay, move)
+
+    def save(self, path: str = None):
+        """
+        Add the game to a replay archive, and to the text record file
+        when the class variable records is set
+
+        :param path: Archive to append to, by default the class variable archive
+        """
+
+        path = path or self.archive
+        if path:
+            with replay.ArchiveWriter(path) as archive:
+                archive.append(self.replay)
+        if self.records:
+            notation.append_record(self.records, self.replay)
+
+    def resume(self, record: notation.GameRecord):
+        """
+        Continue a recorded game, or replay it if it is over
+
+        :param record: Game to load, on a board of the same size
+        """
+
+        self.game = notation.game_from_record(record)
+        self.rows, self.connect = self.game.rows, self.game.connect
+        if self.game.player != self.plyr.now.index:
+            reversed(self)
+        self.show()
+        if self.game.outcome == engine.ON:
+            self()
+        else:
+            self.playback('y')
 
     def playback(self, watch: str):
         """
@@ -415,15 +511,21 @@ class Board:
 
         Additional Info:
         ----------------
-        The replay[] list maintains a deepcopy of the mapping matrix for every
-        move made on the board. This method simply loops over each matrix and
-        prints the board.
+        The game is replayed from its move log: the board is emptied and
+        the moves are played again one per frame, so the replay does not
+        keep a copy of the board for every move. Once the replay is over
+        the board is back in the state the game ended in.
         """
 
+        metrics.observe('replay_bytes', sys.getsizeof(self.game.moves))
         if watch == 'y':
-            for b_map in self.replay:
-                self.mapping = b_map
-                print(self)
+            moves = self.game.moves
+            self.game = engine.Game(self.size, 1, self.rows, self.connect)
+            self.show()
+            time.sleep(1)
+            for col in moves:
+                self.game.play(col)
+                self.show()
                 time.sleep(1)
 
     @classmethod
@@ -436,11 +538,18 @@ class Board:
         :return: Value: 1 if validation is passed
         """
         with self:
-            self.size = int(input("Enter the size of the board [5...10]: "))
-            if not 5 <= self.size <= 10:
-                raise ValueError(f"Oops! The value {self.size} is out of range!!")
-            else:
-                self.attempts = 0
+            sides = [int(side) for side in
+                     input(f"Enter the size of the board [{bitboard.MIN_SIZE}...{bitboard.MAX_SIDE}, "
+                           f"or width x height like 7x6]: ").lower().split('x')]
+            if len(sides) > 2:
+                raise ValueError("Oops! Enter one size, or a width and a height!!")
+            self.size, self.rows = sides[0], sides[-1]
+            for side in sides:
+                if not bitboard.MIN_SIZE <= side <= bitboard.MAX_SIDE:
+                    raise ValueError(f"Oops! The value {side} is out of range!!")
+            if self.connect > max(sides):
+                raise ValueError(f"Oops! {self.connect} in a row does not fit on a {self.size}x{self.rows} board!!")
+            self.attempts = 0
         return 1
 
     @staticmethod
@@ -454,4 +563,7 @@ class Board:
             print(str(index + 1) + '  ', end='')
         print()
         select = int(input('Choose your color [Enter the index of color]: ')) - 1
-        return list(colors)[select]
\ No newline at end of file
+        return list(colors)[select]
+
+
+metrics.hook(Board, 'playback', 'playback_seconds')
@@ -1,7 +1,62 @@
 import board
 import sys
+from connectfour import bitboard, book, mcts, metrics, notation, smp, solver, tablebase
+
+
+def option(name: str, default=None):
+    """
+    Value following an option on the command line, default when the
+    option is not given (or is given without a value)
+    """
+
+    if name not in sys.argv:
+        return None
+    index = sys.argv.index(name) + 1
+    return sys.argv[index] if index < len(sys.argv) and not sys.argv[index].startswith('--') else default
+
 
 if len(sys.argv) > 1 and (sys.argv[1] == '-h' or sys.argv[1] == '--help'):
     help(board.Board)
 else:
-    board.Board()
+    # --metrics PATH records timings of the game loop, written as JSON lines (Prometheus text for *.prom) at exit
+    if option('--metrics'):
+        metrics.enable(option('--metrics'))
+    # --save PATH adds finished games to a replay archive
+    board.Board.archive = option('--save')
+    # --export PATH adds finished (and interrupted) games to a text record file
+    board.Board.records = option('--export')
+    # --connect N plays to N in a row instead of four (the board has to be at least N wide or high)
+    if option('--connect'):
+        connect = int(option('--connect'))
+        if not bitboard.MIN_CONNECT <= connect <= bitboard.MAX_CONNECT:
+            sys.exit(f"--connect must be {bitboard.MIN_CONNECT} to {bitboard.MAX_CONNECT}")
+        board.Board.connect = connect
+    # --computer [SECONDS] plays against the computer, optionally followed by its thinking time per move
+    seconds = option('--computer', '2')
+    opponent = solver.Solver(time_limit=float(seconds)) if seconds else None
+    # --mcts [SECONDS] plays against tree search instead, the better choice on the big boards
+    if option('--mcts', '2'):
+        opponent = mcts.MCTS(time_limit=float(option('--mcts', '2')))
+    # --workers [N] lets the computer search on N processes sharing one table, on every core without N
+    elif seconds and '--workers' in sys.argv:
+        opponent = smp.ParallelSolver(int(option('--workers', '0')), time_limit=float(seconds))
+    # --tablebase PATH lets the computer play perfectly in the positions of a tablebase
+    if isinstance(opponent, (solver.Solver, smp.ParallelSolver)) and option('--tablebase'):
+        opponent.tablebase = tablebase.Tablebase(option('--tablebase'))
+    searcher = opponent
+    # --book PATH lets the computer play its first moves from an opening book
+    if opponent and option('--book'):
+        opponent = book.BookBot(book.OpeningBook(option('--book')), opponent)
+    # --load PATH [--game K] resumes the last (or k-th) game of a record file, or replays it when it is over
+    try:
+        if option('--load'):
+            record = notation.load_record(option('--load'), int(option('--game') or -1))
+            players = record.players if opponent is None else (record.players[0], record.players[1] + (opponent,))
+            board.Board.connect = record.connect
+            board.Board(record.size, players, play=False, rows=record.rows).resume(record)
+        else:
+            board.Board(opponent=opponent)
+    finally:
+        # Stop the search processes (and free the shared table) of the computer player
+        if hasattr(searcher, 'close'):
+            searcher.close()
@@ -0,0 +1,389 @@
+import os
+import sys
+import time
+import queue
+import threading
+import tkinter as tk
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from connectfour import bitboard, engine, metrics, notation, variations
+
+FPS = 60                # Frames a second
+SWITCH = 0.001          # Seconds the search thread keeps the interpreter before the window gets a turn
+GRAVITY = 60.0          # Fall acceleration of a coin, in cells per second squared
+BOARD = '#1f4fbf'
+EMPTY = 'white'
+COLORS = {1: 'red', 2: 'gold'}
+
+
+class Thinker:
+    """
+    Runs the search of a computer player on a background thread
+
+    Attributes:
+    -----------
+    bot --> Computer player, anything with move(game) such as
+            connectfour.solver.Solver or connectfour.mcts.MCTS
+    answers --> (token, column) of every finished search, or
+                (token, exception) when the search failed >> type = queue.Queue
+
+    Additional Info:
+    ----------------
+    The thread waits for a request, searches a copy of the game (so the
+    window never shares a position with the search) and puts the column
+    in answers, which the window reads from its frame timer. The token
+    sent with a request comes back with the answer, so the answer to a
+    game which was abandoned meanwhile can be told apart and dropped.
+
+    The search is pure Python, so it shares the interpreter lock with
+    the window. While it runs the lock changes hands every millisecond
+    (SWITCH) instead of every 5, which keeps the frames on time for a
+    few percent of the search speed.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.answers = queue.Queue()
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='connectfour-thinker', daemon=True)
+        self._thread.start()
+
+    def ask(self, game: engine.Game, token: int):
+        """
+        Start searching for the move of the player to move
+
+        :param game: Game to search, copied before the search starts
+        :param token: Returned with the answer
+        """
+
+        self._requests.put((token, engine.Game.from_moves(game.size, game.moves, 1, game.rows, game.connect)))
+
+    def _run(self):
+        while True:
+            token, game = self._requests.get()
+            if game is None:
+                return
+            interval = sys.getswitchinterval()
+            sys.setswitchinterval(SWITCH)
+            try:
+                answer = self.bot.move(game)
+            except Exception as error:
+                answer = error
+            finally:
+                sys.setswitchinterval(interval)
+            self.answers.put((token, answer))
+
+    def close(self):
+        """
+        Stop the thread once the current search is over
+        """
+
+        self._requests.put((0, None))
+        # A bot closed in the middle of a search would lose its processes or shared table under it
+        self._thread.join()
+        if hasattr(self.bot, 'close'):
+            self.bot.close()
+
+
+class App:
+    """
+    Window showing a game of Connect Four
+
+    Attributes:
+    -----------
+    root --> Top level window
+    game --> Rules and coins of the game >> type = engine.Game
+    tree --> Every move tried, for undo and redo >> type = variations.VariationTree
+    names --> Names of player 1 and 2
+    opponent --> Thinker playing as player 2, None for two players
+    records --> Path of the text record file finished games are added
+                to (see connectfour.notation), None for no record
+    cell --> Width of a cell in pixels
+    canvas --> Canvas the board is drawn on
+    cells --> Canvas item of every cell, by row and column
+    coin --> Canvas item of the coin being dropped
+    marker --> Canvas item of the coin above the column under the mouse
+    falling --> [column, row, y, speed, result] of the coin being dropped,
+                None when no coin is moving
+    token --> Changed by every new game and undo, sent to the thinker with
+              each request so that an answer which came too late is dropped
+    frames --> Frames drawn
+    late --> Frames which came more than half a frame late
+    worst --> Longest time between two frames, in seconds
+
+    Additional Info:
+    ----------------
+    The canvas items are made once, when the window opens. A move only
+    changes the fill of the cell the coin lands in, and a new game only
+    resets the fills, so nothing is redrawn from scratch.
+
+    Everything that moves is driven by one timer that runs FPS times a
+    second, each frame timed from when the last one was due. It moves
+    the falling coin a step and picks up the answer of the computer
+    player from its queue. Neither ever waits, so the window keeps
+    answering while a coin falls or the computer thinks.
+    The gap between frames is recorded as the frame_seconds metric (see
+    connectfour.metrics).
+    """
+
+    def __init__(self, root: tk.Tk, size: int = 7, rows: int = 0, connect: int = bitboard.CONNECT, opponent=None,
+                 names: tuple = ('Player 1', 'Player 2'), records: str = None):
+        """
+        Build the window and start the frame timer
+
+        :param root: Top level window
+        :param size: Width of the board. Valid values are 5-20
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win
+        :param opponent: Computer player for player 2 (see Thinker), None
+                         for two players at the same screen
+        :param names: Names of player 1 and 2
+        :param records: Text record file finished games are added to
+        """
+
+        self.root = root
+        self.game = engine.Game(size, 1, rows, connect)
+        self.tree = variations.VariationTree(size, rows, connect)
+        self.names = names
+        self.opponent = Thinker(opponent) if opponent is not None else None
+        self.records = records
+        self.falling = None
+        self.token = 0
+        self.frames = 0
+        self.late = 0
+        self.worst = 0.0
+        self._last = time.perf_counter()
+        self._due = self._last + 1 / FPS
+        self._job = None
+
+        rows = self.game.rows
+        self.cell = max(24, min(72, 720 // max(size, rows + 1)))
+        cell = self.cell
+        root.title(f"Connect {connect}" if connect != bitboard.CONNECT else "Connect Four")
+        self.status = tk.Label(root, font=('Helvetica', 14), anchor='w')
+        self.status.pack(fill='x', padx=8, pady=4)
+        # The top row of the canvas is left free for the coin above the board
+        self.canvas = tk.Canvas(root, width=size * cell, height=(rows + 1) * cell, bg=BOARD, highlightthickness=0)
+        self.canvas.pack()
+        self.canvas.create_rectangle(0, 0, size * cell, cell, fill=root.cget('bg'), width=0)
+        pad = cell // 10
+        self.cells = [[self.canvas.create_oval(col * cell + pad, (row + 1) * cell + pad,
+                                               (col + 1) * cell - pad, (row + 2) * cell - pad,
+                                               fill=EMPTY, outline=BOARD, width=2)
+                       for col in range(size)] for row in range(rows)]
+        self.coin = self.canvas.create_oval(0, 0, 0, 0, width=0, state='hidden')
+        self.marker = self.canvas.create_oval(0, 0, 0, 0, width=0, state='hidden')
+
+        self.canvas.bind('<Motion>', self.hover)
+        self.canvas.bind('<Leave>', lambda event: self.canvas.itemconfigure(self.marker, state='hidden'))
+        self.canvas.bind('<Button-1>', self.click)
+        root.bind('<Key>', self.key)
+        root.protocol('WM_DELETE_WINDOW', self.close)
+        self.show_status()
+        self._job = root.after(1000 // FPS, self.frame)
+
+    @property
+    def thinking(self) -> bool:
+        """
+        True while the computer player is choosing its move
+        """
+
+        return self.opponent is not None and self.game.outcome == engine.ON and self.game.player == 2 \
+            and self.falling is None
+
+    def show_status(self):
+        game = self.game
+        if game.outcome == engine.OVER:
+            text = f"{self.names[game.winner - 1]} has won the game!   (n: new game, u: undo)"
+        elif game.outcome == engine.DRAW:
+            text = "The game is a tie!   (n: new game, u: undo)"
+        elif self.thinking:
+            text = f"{self.names[1]} is thinking..."
+        else:
+            text = f"{self.names[game.player - 1]}, it's your move"
+        self.status.configure(text=text, fg=COLORS[game.player] if game.outcome == engine.ON else 'black')
+
+    def hover(self, event):
+        """
+        Show the coin of the player to move above the column under the mouse
+        """
+
+        col = event.x // self.cell
+        if self.falling is not None or self.thinking or not self.game.is_legal(col):
+            self.canvas.itemconfigure(self.marker, state='hidden')
+            return
+        pad = self.cell // 10
+        self.canvas.coords(self.marker, col * self.cell + pad, pad, (col + 1) * self.cell - pad, self.cell - pad)
+        self.canvas.itemconfigure(self.marker, fill=COLORS[self.game.player], state='normal')
+
+    def click(self, event):
+        if self.falling is None and not self.thinking:
+            self.drop(event.x // self.cell)
+
+    def key(self, event):
+        """
+        n starts a new game, u (or Backspace) takes back a move and r plays
+        it again, q or Escape closes the window and the digits 1-9 drop a
+        coin in that column
+        """
+
+        if event.keysym in ('q', 'Escape'):
+            self.close()
+        elif event.keysym == 'n':
+            self.new_game()
+        elif event.keysym in ('u', 'BackSpace'):
+            self.undo()
+        elif event.keysym == 'r':
+            self.redo()
+        elif event.char.isdigit() and event.char != '0' and self.falling is None and not self.thinking:
+            self.drop(int(event.char) - 1)
+
+    def drop(self, col: int):
+        """
+        Play a coin in a column and start its fall
+
+        The move is made on the game at once, the board catches up when
+        the coin lands (see land)
+
+        :param col: Column index (0-based)
+        """
+
+        if not self.game.is_legal(col):
+            self.root.bell()
+            return
+        result = self.game.play(col)
+        self.tree.play(col)
+        self.canvas.itemconfigure(self.marker, state='hidden')
+        self.canvas.itemconfigure(self.coin, fill=COLORS[result.player], state='normal')
+        self.falling = [col, result.row, 0.0, 0.0, result]
+        self._place_coin()
+
+    def _place_coin(self):
+        col, _, y, _, _ = self.falling
+        pad = self.cell // 10
+        top = y * self.cell
+        self.canvas.coords(self.coin, col * self.cell + pad, top + pad, (col + 1) * self.cell - pad,
+                           top + self.cell - pad)
+
+    def land(self):
+        """
+        Fill the cell of the coin which finished falling and go on with the game
+        """
+
+        col, row, _, _, result = self.falling
+        self.falling = None
+        self.canvas.itemconfigure(self.coin, state='hidden')
+        self.canvas.itemconfigure(self.cells[row][col], fill=COLORS[result.player])
+        if result.line:
+            for row, col in result.line:
+                self.canvas.itemconfigure(self.cells[row][col], outline='white', width=4)
+        if self.game.outcome != engine.ON:
+            self.save()
+        elif self.thinking:
+            self.opponent.ask(self.game, self.token)
+        self.show_status()
+
+    def frame(self):
+        """
+        Move the falling coin a step and play the computer's answer,
+        then wait for the next frame
+        """
+
+        now = time.perf_counter()
+        # A frame which comes late does not push back the ones after it, unless it missed a whole frame
+        self._due = self._due + 1 / FPS if now - self._due < 1 / FPS else now + 1 / FPS
+        self._job = self.root.after(max(1, round((self._due - now) * 1000)), self.frame)
+        gap = now - self._last
+        self._last = now
+        self.frames += 1
+        self.worst = max(self.worst, gap)
+        if gap > 1.5 / FPS:
+            self.late += 1
+        metrics.observe('frame_seconds', gap)
+
+        if self.falling is not None:
+            falling = self.falling
+            falling[3] += GRAVITY * gap
+            falling[2] = min(falling[2] + falling[3] * gap, falling[1] + 1)
+            self._place_coin()
+            if falling[2] == falling[1] + 1:
+                self.land()
+        elif self.opponent is not None:
+            try:
+                token, answer = self.opponent.answers.get_nowait()
+            except queue.Empty:
+                return
+            if token != self.token or not self.thinking:
+                return
+            if isinstance(answer, Exception):
+                self.status.configure(text=f"{self.names[1]} failed: {answer}", fg='black')
+                return
+            self.drop(answer)
+
+    def new_game(self):
+        """
+        Empty the board, reusing its canvas items
+        """
+
+        game = self.game
+        self.game = engine.Game(game.size, 1, game.rows, game.connect)
+        self.tree = variations.VariationTree(game.size, game.rows, game.connect)
+        self.token += 1
+        self.falling = None
+        self.canvas.itemconfigure(self.coin, state='hidden')
+        for row in self.cells:
+            for item in row:
+                self.canvas.itemconfigure(item, fill=EMPTY, outline=BOARD, width=2)
+        self.show_status()
+
+    def undo(self):
+        """
+        Take back the last move, and against the computer its reply too,
+        so that it is a person's turn again
+        """
+
+        if self.falling is not None or not self.game.moves:
+            self.root.bell()
+            return
+        self.token += 1
+        while self.game.moves:
+            if self.game.line:
+                for row, col in self.game.line:
+                    self.canvas.itemconfigure(self.cells[row][col], outline=BOARD, width=2)
+            col = self.game.moves[-1]
+            self.canvas.itemconfigure(self.cells[self.game.position.top_row(col)][col], fill=EMPTY)
+            self.game.undo()
+            self.tree.undo()
+            if self.opponent is None or self.game.player == 1:
+                break
+        self.show_status()
+
+    def redo(self):
+        """
+        Play again the move last taken back (see variations.VariationTree.redo)
+        """
+
+        col = self.tree.redo_column()
+        if col < 0 or self.falling is not None or self.thinking:
+            self.root.bell()
+            return
+        self.drop(col)
+
+    def save(self):
+        if self.records:
+            players = tuple((name, COLORS[index]) for index, name in enumerate(self.names, 1))
+            notation.append_record(self.records, notation.record_from_game(self.game, players))
+
+    def close(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+        if self.opponent is not None:
+            self.opponent.close()
+        self.root.destroy()
+
+    def report(self) -> str:
+        """
+        Frames drawn, late frames and the longest gap between two frames
+        """
+
+        return f"{self.frames} frames, {self.late} late, longest gap {self.worst * 1000:.1f}ms"
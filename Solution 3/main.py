@@ -0,0 +1,61 @@
+import argparse
+import tkinter as tk
+import gui
+from connectfour import bitboard, mcts, metrics, smp, solver
+
+
+def board_shape(text: str) -> tuple:
+    """
+    Width and height of a board given as one size (7) or as width x height (7x6)
+    """
+
+    try:
+        sides = [int(side) for side in text.lower().split('x')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a board size") from None
+    if len(sides) > 2 or not all(bitboard.MIN_SIZE <= side <= bitboard.MAX_SIDE for side in sides):
+        raise argparse.ArgumentTypeError(f"board sides must be {bitboard.MIN_SIZE} to {bitboard.MAX_SIDE}")
+    return sides[0], sides[-1]
+
+
+parser = argparse.ArgumentParser(description='Connect Four in a window')
+parser.add_argument('--size', type=board_shape, default=(7, 7), help='board size, e.g. 7 or 7x6 (default: 7)')
+parser.add_argument('--connect', type=int, default=bitboard.CONNECT, choices=range(bitboard.MIN_CONNECT,
+                                                                                   bitboard.MAX_CONNECT + 1),
+                    metavar='N', help='coins in a row to win (default: 4)')
+parser.add_argument('--computer', type=float, nargs='?', const=2.0, metavar='SECONDS',
+                    help='play against the computer, optionally with its thinking time per move')
+parser.add_argument('--mcts', type=float, nargs='?', const=2.0, metavar='SECONDS',
+                    help='play against tree search instead, the better choice on the big boards')
+parser.add_argument('--workers', type=int, nargs='?', const=0, metavar='N',
+                    help='let the computer search on N processes sharing one table (every core without N)')
+parser.add_argument('--export', metavar='PATH', help='add finished games to a text record file')
+parser.add_argument('--metrics', metavar='PATH', help='record timings, the frame times included, at exit')
+parser.add_argument('--fps', action='store_true', help='print how steady the frames were when the window closes')
+args = parser.parse_args()
+
+(size, rows), connect = args.size, args.connect
+if connect > max(size, rows):
+    parser.error(f"{connect} in a row does not fit on a {size}x{rows} board")
+if args.metrics:
+    metrics.enable(args.metrics)
+opponent = None
+if args.mcts is not None:
+    opponent = mcts.MCTS(time_limit=args.mcts)
+elif args.computer is not None and args.workers is not None:
+    opponent = smp.ParallelSolver(args.workers, time_limit=args.computer)
+elif args.computer is not None:
+    opponent = solver.Solver(time_limit=args.computer)
+
+try:
+    root = tk.Tk()
+    root.resizable(False, False)
+    app = gui.App(root, size, rows, connect, opponent, ('Player 1', 'Computer' if opponent else 'Player 2'),
+                  args.export)
+    root.mainloop()
+finally:
+    # Stop the search processes (and free the shared table) of the computer player
+    if hasattr(opponent, 'close'):
+        opponent.close()
+if args.fps:
+    print(app.report())
@@ -0,0 +1,364 @@
+"""
+Benchmarks of the hot paths of both solutions
+
+Every benchmark runs headless: input() is fed from a script, clear is
+not run and everything printed goes to a buffer. Each one is run for
+every board size from 5 to 10 and the results are written as JSON with
+the operations per second and the 50th/90th/99th percentile time of one
+operation.
+
+    python benchmarks/bench.py --out bench.json
+    python benchmarks/bench.py --out new.json --compare bench.json --threshold 0.1
+
+With --compare the run is checked against a saved result and every
+benchmark which got slower by more than the threshold is reported as a
+regression (the exit status is then 1).
+"""
+
+import io
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import platform
+import builtins
+import contextlib
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+for folder in ('Solution 1', 'Solution 2', ''):
+    sys.path.insert(1, os.path.join(ROOT, folder))
+
+import board
+import game_play
+import game_state
+from connectfour import Position, WinTracker
+from connectfour.engine import Game, ON
+
+SIZES = range(5, 11)
+PLAYERS = (('Alice', 'red'), ('Bob', 'yellow'))
+
+
+@contextlib.contextmanager
+def headless(answers=()):
+    """
+    Run with input() answered from a list, no clear and no output
+
+    :param answers: Iterable of the strings input() returns, in order
+    """
+
+    answers = iter(answers)
+    with mock.patch.object(builtins, 'input', lambda prompt='': next(answers)), \
+            mock.patch.object(os, 'system', lambda command: 0), \
+            mock.patch.object(time, 'sleep', lambda seconds: None), \
+            contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def random_game(size: int, seed: int) -> list:
+    """
+    Columns (0-based) of a random game played to the end
+    """
+
+    rng = random.Random(seed)
+    game = Game(size)
+    while game.outcome == ON:
+        game.play(rng.choice(game.legal_moves()))
+    return list(game.moves)
+
+
+def midgame(size: int, seed: int = 0) -> Position:
+    """
+    Position about half way through a random game
+    """
+
+    moves = random_game(size, seed)
+    position = Position(size)
+    for col in moves[:len(moves) // 2]:
+        position.play(col)
+    return position
+
+
+def measure(func, number: int, repeat: int) -> dict:
+    """
+    Time func() in repeat samples of number calls
+
+    :return: ops/sec from the median sample and the percentiles of the
+             time of one call in microseconds
+    """
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    samples.sort()
+
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1e6, 3)
+
+    return {
+        'ops_per_sec': round(1 / samples[len(samples) // 2], 1),
+        'p50_us': percentile(50),
+        'p90_us': percentile(90),
+        'p99_us': percentile(99),
+    }
+
+
+def new_board(size: int, moves=()) -> board.Board:
+    with headless():
+        b = board.Board(size, PLAYERS, play=False)
+        for col in moves:
+            b.game.play(col)
+    return b
+
+
+# Each benchmark takes a board size and returns the function to time
+def bench_solution_map(size):
+    position = midgame(size)
+    b = new_board(size, position.moves)
+    col = position.moves[-1]
+    row = b.position.top_row(col)
+    return lambda: b.solution_map(row, col)
+
+
+def bench_map_value(size):
+    b = new_board(size, midgame(size).moves)
+    cells = [(row, col) for row in range(-1, size + 1) for col in range(-1, size + 1)]
+    return lambda: [b.map_value(row, col) for row, col in cells]
+
+
+def bench_board_call(size):
+    """
+    A whole game through Board.__call__, input() answering the columns
+    """
+
+    moves = random_game(size, 1)
+    answers = [str(col + 1) for col in moves] + ['n']
+
+    def run():
+        b = new_board(size)
+        with headless(answers):
+            b()
+    return run
+
+
+def bench_make_move(size):
+    moves = random_game(size, 2)
+    answers = [col + 1 for col in moves]
+
+    def run():
+        mapping = Position(size)
+        count = 0
+        with mock.patch.object(game_play, 'get_move', lambda player, board_size: answers[count]):
+            for index, col in enumerate(answers):
+                count = index
+                game_play.make_move(mapping, 'Alice', size, index, 1 + index % 2)
+    return run
+
+
+def bench_state_of_game(size):
+    position = midgame(size)
+    tracker = WinTracker.from_position(position)
+    col = position.moves[-1] + 1
+    player = position.cell(position.top_row(col - 1), col - 1)
+    count = position.count + 7
+    return lambda: (game_play.state_of_game(position, col, player, size, count),
+                    game_play.state_of_game(position, col, player, size, count, tracker))
+
+
+def bench_look(size):
+    position = midgame(size)
+    col = position.moves[-1]
+    pos = (position.top_row(col), col)
+    player = position.cell(*pos)
+    looks = (game_state.look_left_right, game_state.look_up_down,
+             game_state.look_left_diagonal, game_state.look_right_diagonal)
+    return lambda: [look(position, pos, player, size) for look in looks]
+
+
+def bench_print_board(size):
+    position = midgame(size)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            game_play.print_board(position, size)
+    return run
+
+
+def bench_board_str(size):
+    b = new_board(size, midgame(size).moves)
+    return lambda: str(b)
+
+
+def bench_replay_deepcopy(size):
+    """
+    What Board used to do after every move: keep a deep copy of the mapping
+    """
+
+    mapping = midgame(size).to_mapping()
+    return lambda: copy.deepcopy(mapping)
+
+
+def bench_replay_log(size):
+    """
+    What Board does now: build the move log and rebuild a position from it
+    """
+
+    b = new_board(size, midgame(size).moves)
+    return lambda: b.position_at(len(b.replay.moves))
+
+
+def leaves(size: int, count: int = 256) -> list:
+    """
+    Positions a search would score at its leaves: random games stopped
+    at every point from the opening to the end
+    """
+
+    positions = []
+    for seed in range(count):
+        moves = random_game(size, seed)
+        position = Position(size)
+        for col in moves[:seed % len(moves)]:
+            position.play(col)
+        positions.append(position)
+    return positions
+
+
+def bench_leaf_scalar(size):
+    """
+    256 leaves scored one at a time by evaluation.evaluate
+    """
+
+    from connectfour.evaluation import evaluate
+    positions = leaves(size)
+    return lambda: [evaluate(position, position.turn) for position in positions]
+
+
+def bench_leaf_numpy(size):
+    """
+    256 leaves scored one at a time by the numpy evaluator
+    """
+
+    from connectfour.leafeval import LeafEvaluator
+    evaluator = LeafEvaluator(size)
+    boards = [([position.boards[position.turn]], [position.boards[3 - position.turn]]) for position in leaves(size)]
+    return lambda: [evaluator.evaluate_boards(movers, others) for movers, others in boards]
+
+
+def bench_leaf_batch(size):
+    """
+    The same 256 leaves scored in one batch
+    """
+
+    from connectfour.leafeval import LeafEvaluator
+    evaluator = LeafEvaluator(size)
+    positions = leaves(size)
+    movers = [position.boards[position.turn] for position in positions]
+    others = [position.boards[3 - position.turn] for position in positions]
+    return lambda: evaluator.evaluate_boards(movers, others)
+
+
+BENCHMARKS = {
+    'Board.solution_map': (bench_solution_map, 2000),
+    'Board.map_value': (bench_map_value, 100),
+    'Board.__call__ (game)': (bench_board_call, 5),
+    'game_play.make_move (game)': (bench_make_move, 20),
+    'game_play.state_of_game': (bench_state_of_game, 1000),
+    'game_state.look_*': (bench_look, 1000),
+    'game_play.print_board': (bench_print_board, 100),
+    'Board.__str__': (bench_board_str, 100),
+    'replay deepcopy': (bench_replay_deepcopy, 200),
+    'replay move log': (bench_replay_log, 200),
+    # Each call scores 256 leaves (the last two need numpy)
+    'leaves evaluate()': (bench_leaf_scalar, 5),
+    'leaves numpy one by one': (bench_leaf_numpy, 5),
+    'leaves numpy batched': (bench_leaf_batch, 50),
+}
+
+
+def run(names=None, sizes=SIZES, repeat: int = 30, scale: float = 1.0, report=print) -> dict:
+    """
+    Run the benchmarks
+
+    :param names: Benchmarks to run, all by default
+    :param sizes: Board sizes
+    :param repeat: Samples per benchmark
+    :param scale: Multiplier of the calls per sample
+    :return: JSON-ready results
+    """
+
+    results = {}
+    for name, (setup, number) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for size in sizes:
+            key = f'{name}[{size}]'
+            results[key] = measure(setup(size), max(1, int(number * scale)), repeat)
+            report(f"{key:<36}{results[key]['ops_per_sec']:>14,.1f} ops/s   p50 {results[key]['p50_us']:>10.2f}us"
+                   f"   p99 {results[key]['p99_us']:>10.2f}us")
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'scale': scale,
+        },
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float, report=print) -> list:
+    """
+    Find the benchmarks slower than in the baseline
+
+    :param threshold: Allowed drop in ops/sec, e.g. 0.1 for 10%
+    :return: Names of the regressed benchmarks
+    """
+
+    regressions = []
+    for key, result in current['results'].items():
+        old = baseline['results'].get(key)
+        if not old:
+            continue
+        change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        report(f"{key:<36}{old['ops_per_sec']:>14,.1f} -> {result['ops_per_sec']:>14,.1f} ops/s {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the hot paths of both solutions')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slow-down before flagging (0.10 = 10%%)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=30, help='samples per benchmark')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of the calls per sample')
+    args = parser.parse_args(argv)
+
+    current = run(args.only, args.sizes, args.repeat, args.scale)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(current, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(current, json.load(file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
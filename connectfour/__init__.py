@@ -0,0 +1,11 @@
+"""
+Game rules shared by the Connect Four solutions
+
+The modules in this package do not read input or print to the screen,
+they only implement the rules so the command line games (and anything
+else) can build on top of them.
+"""
+
+from .bitboard import Position, MIN_SIZE, MAX_SIZE, MAX_SIDE
+from .wincheck import WinTracker, line_table
+from .engine import Game, Result, ON, OVER, DRAW
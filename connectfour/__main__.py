@@ -0,0 +1,39 @@
+"""
+Command line tools
+
+python -m connectfour <command> [options]   (--help after a command lists its options)
+"""
+
+import sys
+import importlib
+
+COMMANDS = {
+    'analyse': 'connectfour.analysis',
+    'book': 'connectfour.book',
+    'dataset': 'connectfour.dataset',
+    'client': 'connectfour.client',
+    'loadgen': 'connectfour.loadgen',
+    'mcts': 'connectfour.mcts',
+    'perft': 'connectfour.perft',
+    'records': 'connectfour.notation',
+    'server': 'connectfour.server',
+    'sessions': 'connectfour.sessions',
+    'smp': 'connectfour.smp',
+    'tablebase': 'connectfour.tablebase',
+    'solver': 'connectfour.solver',
+    'tournament': 'connectfour.tournament',
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(__doc__.strip())
+        print('Commands:', ', '.join(COMMANDS))
+        return 2
+    importlib.import_module(COMMANDS[argv[0]]).main(argv[1:])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
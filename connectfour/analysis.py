@@ -0,0 +1,344 @@
+"""
+Batch position analysis
+
+Analyser scores every legal column of many positions at once. A
+position is given as the moves played (a string of 1-based columns as
+on the command line), as a 0/1/2 mapping matrix or as a Position.
+
+Answers are kept in a ResultCache keyed by the canonical key of the
+position, so a position and its mirror image are searched once, and
+only the positions missing from the cache are searched, in batches on
+a pool of worker processes. The cache holds a bounded number of
+answers, dropping the least recently used, and can be saved to a file
+and loaded again by the next run.
+
+    python -m connectfour analyse positions.txt --size 7 --depth 10 --cache analysis7.c4a
+    echo '[[0,0,0,0,0],[0,0,0,0,0],[0,0,0,0,0],[0,0,1,0,0],[0,2,1,0,0]]' | python -m connectfour analyse -
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from .bitboard import Position, MIN_SIZE, MAX_SIZE
+from .engine import parse_moves
+from .solver import Solver, centre_order
+
+MAGIC = b'C4CACHE1'
+HEADER = struct.Struct('<8sI')                       # magic, number of records
+RECORD = struct.Struct(f'<QQBBB{MAX_SIZE}h')        # key (low, high 64 bits), size, player, depth, scores
+NO_MOVE = -32768                                    # Score slot of a full column
+
+Analysis = namedtuple("Analysis", ["scores", "best", "cached"])
+Analysis.__doc__ = """
+Answer for one position
+
+scores --> {column: score for the player to move} of every legal
+           column (0-based), empty when the game is over
+best --> Best column, centre first among equal scores, -1 when the
+         game is over
+cached --> True when the answer came from the cache
+"""
+
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "evictions", "entries", "capacity"])
+CacheStats.__doc__ = """
+Counters of a ResultCache
+
+hits --> Lookups answered from the cache
+misses --> Lookups which needed a search
+evictions --> Answers dropped to stay within the capacity
+entries --> Answers held
+capacity --> Most answers held
+"""
+
+
+class ResultCache:
+    """
+    Least recently used cache of position scores
+
+    Attributes:
+    -----------
+    capacity --> Most answers held
+    entries --> (size, canonical key, player, depth) --> tuple of the
+                scores of every column of the canonical position, None
+                for a full column >> type = OrderedDict, oldest first
+
+    Additional Info:
+    ----------------
+    A cache file is a header followed by one fixed-size record per
+    answer, oldest first, so loading it back keeps the order in which
+    the answers were last used.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self.entries
+
+    def get(self, key: tuple):
+        """
+        Look up an answer, counting a hit or a miss
+
+        :return: The scores, None when they are not in the cache
+        """
+
+        scores = self.entries.get(key)
+        if scores is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return scores
+
+    def put(self, key: tuple, scores: tuple):
+        self.entries[key] = scores
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> CacheStats:
+        return CacheStats(self.hits, self.misses, self.evictions, len(self.entries), self.capacity)
+
+    def save(self, path: str):
+        """
+        Write the cache to a file (written aside and renamed, so an
+        interrupted save leaves the old file in place)
+        """
+
+        with open(path + '.tmp', 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(self.entries)))
+            for (size, key, player, depth), scores in self.entries.items():
+                slots = [NO_MOVE if score is None else score for score in scores]
+                slots += [NO_MOVE] * (MAX_SIZE - size)
+                file.write(RECORD.pack(key & 0xffffffffffffffff, key >> 64, size, player, depth, *slots))
+        os.replace(path + '.tmp', path)
+
+    def load(self, path: str) -> int:
+        """
+        Add the answers of a cache file
+
+        :return: Number of answers read
+        """
+
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an analysis cache")
+        _, count = HEADER.unpack_from(data, 0)
+        for low, high, size, player, depth, *slots in RECORD.iter_unpack(data[HEADER.size:HEADER.size
+                                                                                 + count * RECORD.size]):
+            self.put((size, high << 64 | low, player, depth),
+                     tuple(None if score == NO_MOVE else score for score in slots[:size]))
+        return count
+
+
+def to_position(item, size: int = 7) -> Position:
+    """
+    Position of a batch item
+
+    :param item: Moves as 1-based columns ("4435" or "4,4,10"), a mapping
+                 matrix (list of lists of 0/1/2) or a Position
+    :param size: Width of the board for moves
+    """
+
+    if isinstance(item, Position):
+        return item
+    if isinstance(item, str):
+        position = Position(size)
+        for col in parse_moves(item):
+            if not position.can_play(col):
+                raise ValueError(f"Column {col + 1} is not available in {item!r}")
+            position.play(col)
+        return position
+    return Position.from_mapping(item)
+
+
+def analyse_batch(task: tuple) -> list:
+    """
+    Score the positions of a batch in a worker process
+
+    :param task: (depth, seconds per column, table bits, list of cache keys)
+    :return: List of (cache key, scores) in the order of the keys
+    """
+
+    depth, seconds, table_bits, keys = task
+    solver = Solver(table_bits=table_bits, max_depth=depth, time_limit=seconds)
+    answers = []
+    for key in keys:
+        size, code, player, _ = key
+        position = Position.from_key(code, size)
+        if position.has_won(1) or position.has_won(2) or position.is_full():
+            scores = {}
+        else:
+            # Depth-limited scores depend on what the table holds, so each position starts from an empty one
+            solver.table.clear()
+            scores = solver.analyse(position, player, depth)
+        answers.append((key, tuple(scores.get(col) for col in range(size))))
+    return answers
+
+
+class Analyser:
+    """
+    Scores batches of positions through a result cache
+
+    Attributes:
+    -----------
+    depth --> Search depth below each position (see Solver.analyse)
+    seconds --> Time allowed per column searched (0 for no limit)
+    workers --> Processes searching the positions missing from the cache
+    batch --> Positions sent to a worker at a time
+    cache --> ResultCache of the answers
+    path --> Cache file, read when the analyser is made and written by
+             close(). None keeps the cache in memory only
+
+    Additional Info:
+    ----------------
+    The depth is part of the cache key, so answers of different depths
+    never mix. With a time limit the answers depend on the speed of the
+    machine, and the first answer found for a position is the one kept.
+    """
+
+    def __init__(self, depth: int = 8, seconds: float = 0, workers: int = 1, cache_size: int = 1 << 16,
+                 path: str = None, batch: int = 32, table_bits: int = 18):
+        self.depth = depth
+        self.seconds = seconds
+        self.workers = workers
+        self.batch = batch
+        self.table_bits = table_bits
+        self.cache = ResultCache(cache_size)
+        self.path = path
+        if path and os.path.exists(path):
+            self.cache.load(path)
+        self._pool = ProcessPoolExecutor(workers) if workers > 1 else None
+
+    def analyse(self, items, size: int = 7, players=None) -> list:
+        """
+        Score every legal column of a batch of positions
+
+        :param items: Positions, each as moves, a mapping matrix or a Position
+        :param size: Width of the board for the items given as moves
+        :param players: Index of the player to move in each position, by
+                        default the player whose turn it is when the
+                        players alternate
+        :return: List of Analysis in the order of the items
+        """
+
+        keys = []
+        for index, item in enumerate(items):
+            position = to_position(item, size)
+            if not position.classic or position.size > MAX_SIZE:
+                raise ValueError(f"Only square boards of {MIN_SIZE} to {MAX_SIZE} with four to connect are analysed")
+            player = players[index] if players else position.turn
+            code, mirrored = position.canonical_key()
+            keys.append(((position.size, code, player, self.depth), mirrored))
+
+        # Every distinct position missing from the cache is searched once
+        found = {}
+        missing = []
+        for key, _ in keys:
+            if key in found:
+                self.cache.hits += 1
+                continue
+            scores = self.cache.get(key)
+            found[key] = scores
+            if scores is None:
+                missing.append(key)
+        fresh = set(missing)
+        for key, scores in self._search(missing):
+            found[key] = scores
+            self.cache.put(key, scores)
+
+        answers = []
+        for key, mirrored in keys:
+            size = key[0]
+            scores = {size - 1 - col if mirrored else col: score
+                      for col, score in enumerate(found[key]) if score is not None}
+            best = max(centre_order(size), key=lambda col: scores.get(col, NO_MOVE)) if scores else -1
+            answers.append(Analysis(scores, best, key not in fresh))
+            fresh.discard(key)
+        return answers
+
+    def _search(self, keys: list):
+        tasks = [(self.depth, self.seconds, self.table_bits, keys[i:i + self.batch])
+                 for i in range(0, len(keys), self.batch)]
+        if self._pool is None:
+            for task in tasks:
+                yield from analyse_batch(task)
+        else:
+            for answers in self._pool.map(analyse_batch, tasks):
+                yield from answers
+
+    def close(self):
+        """
+        Save the cache to its file and stop the worker processes
+        """
+
+        if self.path:
+            self.cache.save(self.path)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_items(lines):
+    """
+    Positions of an input file: one per line, as moves or a JSON
+    mapping matrix. Blank lines and lines starting with # are skipped
+    """
+
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield json.loads(line) if line.startswith('[') else line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour analyse',
+                                     description='Score every column of a list of positions')
+    parser.add_argument('source', help="file of positions, one per line as moves or a JSON grid ('-' for stdin)")
+    parser.add_argument('--size', type=int, default=7, help='board size of the positions given as moves [5...10]')
+    parser.add_argument('--depth', type=int, default=8, help='search depth per position')
+    parser.add_argument('--time', type=float, default=0, help='seconds per column (0 for no limit)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    parser.add_argument('--cache', help='cache file, read before and written after the run')
+    parser.add_argument('--cache-size', type=int, default=1 << 16, help='most answers kept in the cache')
+    args = parser.parse_args(argv)
+
+    file = sys.stdin if args.source == '-' else open(args.source, encoding='utf-8')
+    with file:
+        items = list(read_items(file))
+    start = time.perf_counter()
+    with Analyser(args.depth, args.time, args.workers, args.cache_size, args.cache) as analyser:
+        answers = analyser.analyse(items, args.size)
+        for item, answer in zip(items, answers):
+            print(json.dumps({'position': item, 'best': answer.best + 1,
+                              'scores': {col + 1: score for col, score in sorted(answer.scores.items())}}))
+    stats = analyser.cache.stats()
+    lookups = stats.hits + stats.misses
+    print(f"{len(items)} positions in {time.perf_counter() - start:.2f}s  hits {stats.hits}  misses {stats.misses}"
+          f"  ({stats.hits / lookups if lookups else 0:.0%} hit rate)  cache {stats.entries}/{stats.capacity}",
+          file=sys.stderr)
+    return answers
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Win/draw/legal-move check for many boards at once (needs numpy)
+
+Boards are stacked in an (N, size, size) int8 array using the encoding
+of the mapping matrix: 0 for an empty cell, 1 and 2 for the players,
+row 0 at the top. Instead of walking the cells of each board, every
+direction is checked for all N boards together by and-ing shifted
+slices of the array.
+
+Running this module compares the batch check with the scalar checks
+on random boards:  python -m connectfour.batch
+"""
+
+import random
+from collections import namedtuple
+import numpy as np
+from .bitboard import Position
+from .wincheck import CONNECT, STEPS, brute_force_winner
+
+BOTH = 3  # Winner value of a board where both players have a line
+
+BatchResult = namedtuple("BatchResult", ["winner", "draw", "legal"])
+BatchResult.__doc__ = """
+Result of evaluate_batch for N boards
+
+winner --> (N,) int8: 0 no winner, 1 or 2 the winning player, BOTH when
+           both players have a line (only possible on made-up boards)
+draw --> (N,) bool: board is full and nobody has won
+legal --> (N, size) bool: column can be played (top cell empty and the
+          game is not over)
+"""
+
+
+def has_line(mask: np.ndarray) -> np.ndarray:
+    """
+    Find boards with CONNECT true cells in a row
+
+    :param mask: (N, rows, cols) bool array, e.g. boards == player
+    :return: (N,) bool array
+    """
+
+    count, rows, cols = mask.shape
+    span = CONNECT - 1
+    found = np.zeros(count, dtype=bool)
+    for dr, dc in STEPS:
+        height = rows - span * dr
+        width = cols - span * abs(dc)
+        if height <= 0 or width <= 0:
+            continue
+        c0 = span if dc < 0 else 0
+        run = mask[:, :height, c0:c0 + width].copy()
+        for k in range(1, CONNECT):
+            r = k * dr
+            c = c0 + k * dc
+            run &= mask[:, r:r + height, c:c + width]
+        found |= run.reshape(count, -1).any(axis=1)
+    return found
+
+
+def evaluate_batch(boards) -> BatchResult:
+    """
+    Winner, draw flag and legal moves of a stack of boards
+
+    :param boards: (N, size, size) array (or a single (size, size) board)
+                   of 0/1/2 values
+    :return: BatchResult
+    """
+
+    boards = np.asarray(boards, dtype=np.int8)
+    if boards.ndim == 2:
+        boards = boards[np.newaxis]
+    one = has_line(boards == 1)
+    two = has_line(boards == 2)
+    winner = (one * 1 + two * 2).astype(np.int8)
+    top = boards[:, 0, :]
+    open_game = winner == 0
+    draw = open_game & (top != 0).all(axis=1)
+    legal = (top == 0) & open_game[:, np.newaxis]
+    return BatchResult(winner, draw, legal)
+
+
+def stack_positions(positions) -> np.ndarray:
+    """
+    Stack positions (bitboard.Position) of one size into an int8 array
+    """
+
+    return np.array([position.to_mapping() for position in positions], dtype=np.int8)
+
+
+def random_boards(count: int, size: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Random 0/1/2 boards, coins are not required to rest on each other
+    """
+
+    return rng.integers(0, 3, size=(count, size, size), dtype=np.int8)
+
+
+def selfcheck(count: int = 2000, seed: int = 0):
+    """
+    Compare evaluate_batch with the scalar checks of wincheck and bitboard
+
+    Made-up random boards are checked against brute_force_winner, and
+    boards from random games against Position.has_won as well.
+    """
+
+    rng = np.random.default_rng(seed)
+    games = random.Random(seed)
+    for size in range(5, 11):
+        boards = random_boards(count, size, rng)
+        positions = []
+        for _ in range(count):
+            position = Position(size)
+            for _ in range(games.randint(0, size * size)):
+                player = position.turn
+                position.play(games.choice(position.legal_moves()))
+                if position.has_won(player) or position.is_full():
+                    break
+            positions.append(position)
+        boards = np.concatenate([boards, stack_positions(positions)])
+        result = evaluate_batch(boards)
+        for index, board in enumerate(boards.tolist()):
+            winners = brute_force_winner(board)
+            expected = BOTH if len(winners) == 2 else winners.pop() if winners else 0
+            assert result.winner[index] == expected, (size, board)
+            assert result.draw[index] == (not expected and all(board[0])), (size, board)
+            assert result.legal[index].tolist() == [not expected and not cell for cell in board[0]]
+            if index >= count:
+                position = positions[index - count]
+                assert bool(result.winner[index] & 1) == position.has_won(1)
+                assert bool(result.winner[index] & 2) == position.has_won(2)
+    return True
+
+
+if __name__ == '__main__':
+    selfcheck()
+    print('evaluate_batch agrees with the scalar win checks on all board sizes')
@@ -0,0 +1,372 @@
+"""
+Bitboard position engine shared by both solutions
+
+A position keeps one integer per player with a bit set for every
+stone that player has on the board, plus the height of every column.
+Dropping a coin, taking it back and checking for a win are all a
+handful of integer operations regardless of the board size.
+
+Boards are square with four to connect unless asked otherwise: any
+width and height from MIN_SIZE to MAX_SIDE can be played, with
+MIN_CONNECT to MAX_CONNECT coins in a row to win.
+"""
+
+MIN_SIZE = 5
+MAX_SIZE = 10       # Largest square board of the classic game (tools like the book and tablebase stop here)
+MAX_SIDE = 20       # Largest width or height of a board
+MIN_CONNECT = 3
+MAX_CONNECT = 10
+CONNECT = 4
+
+
+def run_steps(connect: int) -> tuple:
+    """
+    Shifts (in cells) which reduce a board to the runs of connect coins
+
+    Additional Info:
+    ----------------
+    And-ing a board of runs of n coins with itself shifted by m <= n
+    cells leaves the runs of n + m coins, so a run of connect coins is
+    found in about log2(connect) steps: (1, 2) for four, (1, 2, 2) for
+    six.
+    """
+
+    steps = []
+    length = 1
+    while length < connect:
+        step = min(length, connect - length)
+        steps.append(step)
+        length += step
+    return tuple(steps)
+
+
+class Position:
+    """
+    Connect Four position stored as integer bitboards
+
+    Attributes:
+    -----------
+    size --> Width of the board (number of columns)
+    rows --> Height of the board, the same as size unless given
+    connect --> Coins in a row needed to win
+    stride --> Bits used per column. One more than rows so that an
+               always empty sentinel row separates the columns
+    boards --> [unused, player 1 stones, player 2 stones] >> type = list
+    heights --> Bit index of the next free cell of each column
+    tops --> Bit index of the sentinel cell of each column
+    moves --> Columns played so far, in order >> type = list
+    bottom --> Bit of the bottom cell of every column set
+    cells --> Number of cells on the board
+    runs --> For every direction the shifts (in bits) which reduce a
+             board to its runs of connect coins (see run_steps)
+
+    Additional Info:
+    ----------------
+    The bits are laid out column-major starting at the bottom left
+    corner of the board:
+
+        column 0 --> bits 0 .. rows-1, sentinel at bit rows
+        column 1 --> bits stride .. stride+rows-1, sentinel ...
+
+    Row 0 of a mapping matrix is the top row of the board, therefore
+    cell (row, col) of the mapping lives at bit col*stride + rows-1-row.
+    Indexing a position (position[row][col]) returns the same 0/1/2
+    values as the mapping matrix so it can be read like one.
+    """
+
+    __slots__ = ('size', 'rows', 'connect', 'stride', 'boards', 'heights', 'tops', 'moves', 'shifts', 'bottom',
+                 'cells', 'runs')
+
+    def __init__(self, size: int = 7, rows: int = 0, connect: int = CONNECT):
+        """
+        Build an empty position
+
+        :param size: Width of the board. Valid values are 5-20
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win, from 3 up to the
+                        longer side of the board (at most 10)
+        """
+
+        rows = rows or size
+        for side in (size, rows):
+            if not MIN_SIZE <= side <= MAX_SIDE:
+                raise ValueError(f"Oops! The value {side} is out of range!!")
+        if not MIN_CONNECT <= connect <= min(MAX_CONNECT, max(size, rows)):
+            raise ValueError(f"Oops! Connect {connect} does not fit a {rows}x{size} board!!")
+        self.size = size
+        self.rows = rows
+        self.connect = connect
+        self.stride = rows + 1
+        self.boards = [0, 0, 0]
+        self.heights = [col * self.stride for col in range(size)]
+        self.tops = [col * self.stride + rows for col in range(size)]
+        self.moves = []
+        # Bit distance between neighbouring cells for the four directions:
+        # up-down, left-right, and the two diagonals
+        self.shifts = (1, self.stride, self.stride + 1, self.stride - 1)
+        self.bottom = sum(1 << bit for bit in self.heights)
+        self.cells = size * rows
+        steps = run_steps(connect)
+        self.runs = tuple(tuple(step * shift for step in steps) for shift in self.shifts)
+
+    def __getitem__(self, row: int) -> list:
+        """
+        Read a row of the position like a row of the mapping matrix
+
+        :param row: Row index where 0 is the top of the board
+        :return: List of 0/1/2 values for the row
+        """
+
+        return [self.cell(row, col) for col in range(self.size)]
+
+    def __len__(self):
+        return self.rows
+
+    def __repr__(self):
+        text = ''
+        for row in range(self.rows):
+            for col in range(self.size):
+                text += str(self.cell(row, col))
+            text += '\n'
+        return text
+
+    @property
+    def count(self) -> int:
+        """
+        Number of coins on the board
+        """
+
+        return len(self.moves)
+
+    @property
+    def turn(self) -> int:
+        """
+        Index of the player to move when the players alternate
+        """
+
+        return 1 + (len(self.moves) & 1)
+
+    def cell(self, row: int, col: int) -> int:
+        """
+        Value of a cell in mapping coordinates
+
+        :param row: Row index where 0 is the top of the board
+        :param col: Column index
+        :return: 0 if the cell is empty else the index of the player
+        """
+
+        bit = 1 << (col * self.stride + self.rows - 1 - row)
+        if self.boards[1] & bit:
+            return 1
+        return 2 if self.boards[2] & bit else 0
+
+    def can_play(self, col: int) -> bool:
+        """
+        Check if a coin can be dropped in a column
+
+        :param col: Column index
+        :return: True if the column exists and is not full
+        """
+
+        return 0 <= col < self.size and self.heights[col] < self.tops[col]
+
+    def legal_moves(self) -> list:
+        """
+        List of the columns which are not full
+        """
+
+        return [col for col in range(self.size) if self.heights[col] < self.tops[col]]
+
+    def is_full(self) -> bool:
+        return len(self.moves) == self.cells
+
+    @property
+    def shape(self) -> tuple:
+        """
+        (columns, rows, connect) of the board
+        """
+
+        return self.size, self.rows, self.connect
+
+    @property
+    def classic(self) -> bool:
+        """
+        True on a square board with four to connect
+        """
+
+        return self.rows == self.size and self.connect == CONNECT
+
+    def play(self, col: int, player: int = 0) -> int:
+        """
+        Drop a coin in a column
+
+        :param col: Column index
+        :param player: Index of the player making the move. When not given
+                       the player whose turn it is makes the move
+        :return: Row index (in mapping coordinates) where the coin landed
+        """
+
+        if not self.can_play(col):
+            raise ValueError(f"Column {col + 1} is not available")
+        bit = self.heights[col]
+        self.boards[player or 1 + (len(self.moves) & 1)] |= 1 << bit
+        self.heights[col] = bit + 1
+        self.moves.append(col)
+        return self.tops[col] - 1 - bit
+
+    def undo(self) -> int:
+        """
+        Take back the last move
+
+        :return: Column index of the move taken back
+        """
+
+        col = self.moves.pop()
+        self.heights[col] -= 1
+        bit = 1 << self.heights[col]
+        if self.boards[1] & bit:
+            self.boards[1] ^= bit
+        else:
+            self.boards[2] ^= bit
+        return col
+
+    def top_row(self, col: int) -> int:
+        """
+        Row index (in mapping coordinates) of the top coin of a column
+
+        :param col: Column index
+        :return: Row index or -1 if the column is empty
+        """
+
+        filled = self.heights[col] - col * self.stride
+        return self.rows - filled if filled else -1
+
+    def has_won(self, player: int) -> bool:
+        """
+        Check if a player has connect coins in a row anywhere on the board
+
+        :param player: Index of the player
+        :return: True if the player has won
+
+        Additional Info:
+        ----------------
+        For every direction the board is and-ed with itself shifted by
+        one cell, which leaves a bit for every pair of neighbours. Doing
+        the same with the pairs shifted by two cells leaves a bit for every
+        run of four, and so on for longer runs (see run_steps). The
+        sentinel row keeps runs from wrapping around from one column into
+        the next.
+        """
+
+        board = self.boards[player]
+        if self.connect == CONNECT:
+            for shift in self.shifts:
+                pairs = board & (board >> shift)
+                if pairs & (pairs >> 2 * shift):
+                    return True
+            return False
+        for steps in self.runs:
+            run = board
+            for step in steps:
+                run &= run >> step
+            if run:
+                return True
+        return False
+
+    def key(self) -> int:
+        """
+        Number identifying the coins on the board
+
+        Additional Info:
+        ----------------
+        Each column contributes stride bits: the coins of player 1 with
+        a 1 just above the top coin marking the height of the column.
+        It equals boards[1] + (all coins) + bottom, and two positions
+        have the same key only if they have the same coins.
+        """
+
+        return self.boards[1] + (self.boards[1] | self.boards[2]) + self.bottom
+
+    def canonical_key(self) -> tuple:
+        """
+        Key shared by a position and its left-right mirror image
+
+        :return: (smaller of the two keys, True if it is the mirror's)
+        """
+
+        key = self.key()
+        mirrored = mirror_key(key, self.size, self.rows)
+        return (mirrored, True) if mirrored < key else (key, False)
+
+    def to_mapping(self) -> list:
+        """
+        Build a mapping matrix (list of lists) of the position
+        """
+
+        return [self[row] for row in range(self.rows)]
+
+    @classmethod
+    def from_mapping(cls, mapping: list, connect: int = CONNECT):
+        """
+        Build a position from a mapping matrix
+
+        :param mapping: 2-dimensional list of 0/1/2 values
+        :param connect: Coins in a row needed to win
+        :return: New position
+
+        Additional Info:
+        ----------------
+        A mapping matrix does not record the order of the moves so the
+        move list is rebuilt column by column from the bottom up. Taking
+        back moves from such a position empties the columns right to left.
+        """
+
+        self = cls(len(mapping[0]), len(mapping), connect)
+        for col in range(self.size):
+            for row in reversed(range(self.rows)):
+                if mapping[row][col] == 0:
+                    break
+                self.play(col, mapping[row][col])
+        return self
+
+    @classmethod
+    def from_key(cls, key: int, size: int, rows: int = 0, connect: int = CONNECT):
+        """
+        Build the position with the coins a key describes
+
+        :param key: Position.key() of the position
+        :param size: Width of the board
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win
+
+        Additional Info:
+        ----------------
+        As with from_mapping the order of the moves is not known, so the
+        move list is rebuilt column by column from the bottom up.
+        """
+
+        self = cls(size, rows, connect)
+        column = (1 << self.stride) - 1
+        for col in range(size):
+            code = key >> (col * self.stride) & column
+            for height in range(code.bit_length() - 1):
+                self.play(col, 1 if code >> height & 1 else 2)
+        return self
+
+
+def mirror_key(key: int, size: int, rows: int = 0) -> int:
+    """
+    Key of the left-right mirror image of a position
+
+    :param key: Position.key() of the position
+    :param size: Width of the board
+    :param rows: Height of the board, the same as the width by default
+    :return: Key with the order of the columns reversed
+    """
+
+    stride = (rows or size) + 1
+    column = (1 << stride) - 1
+    mirrored = 0
+    for col in range(size):
+        mirrored = mirrored << stride | (key >> (col * stride) & column)
+    return mirrored
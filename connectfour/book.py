@@ -0,0 +1,230 @@
+"""
+Opening book
+
+The book holds the best move and score of every position reachable in
+the first few plies of a game, found by searching each one deeply
+ahead of time. Positions are keyed on Position.canonical_key(), so a
+position and its mirror image share one record.
+
+The book file is a header followed by fixed-size records sorted by
+key. OpeningBook memory-maps it and finds a position by binary search,
+so a lookup reads O(log n) records and the file is never loaded whole.
+
+    python -m connectfour book build --size 7 --plies 6 --depth 12 --out book7.c4b
+    python -m connectfour book probe --book book7.c4b --moves 44
+"""
+
+import os
+import mmap
+import time
+import struct
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from .bitboard import Position
+from .engine import parse_moves
+from .solver import Solver
+
+MAGIC = b'C4BOOK01'
+HEADER = struct.Struct('<8sBBHI')   # magic, board size, plies, unused, number of records
+RECORD = struct.Struct('<QQbhB')    # key (low, high 64 bits), move, score, depth
+
+BookEntry = namedtuple("BookEntry", ["move", "score", "depth"])
+BookEntry.__doc__ = """
+Book answer for a position
+
+move --> Best column (0-based) for the player to move
+score --> Solver score of the move for the player to move
+depth --> Depth the position was searched to
+"""
+
+
+def opening_positions(size: int, plies: int) -> list:
+    """
+    Every position after 0 to plies moves, mirror images counted once
+
+    :return: List of the move lists reaching each position. Positions
+             where the game is already over are left out
+    """
+
+    level = {Position(size).canonical_key()[0]: []}
+    positions = []
+    for ply in range(plies + 1):
+        positions.extend(level.values())
+        if ply == plies:
+            break
+        following = {}
+        for moves in level.values():
+            position = Position(size)
+            for col in moves:
+                position.play(col)
+            player = position.turn
+            for col in position.legal_moves():
+                position.play(col)
+                if not position.has_won(player) and not position.is_full():
+                    following.setdefault(position.canonical_key()[0], moves + [col])
+                position.undo()
+        level = following
+    return positions
+
+
+def search_batch(task: tuple) -> list:
+    """
+    Search a batch of positions in a worker process
+
+    :param task: (size, depth, seconds per position, list of move lists)
+    :return: List of (canonical key, move, score, depth), the move being
+             the one to play on the canonical (possibly mirrored) board
+    """
+
+    size, depth, seconds, batch = task
+    solver = Solver(table_bits=18, max_depth=depth, time_limit=seconds)
+    records = []
+    for moves in batch:
+        position = Position(size)
+        for col in moves:
+            position.play(col)
+        key, mirrored = position.canonical_key()
+        result = solver.search(position)
+        move = size - 1 - result.move if mirrored else result.move
+        records.append((key, move, result.score, result.depth))
+    return records
+
+
+def build(size: int, plies: int, path: str, depth: int = 12, seconds: float = 0, workers: int = None,
+          batch: int = 64, report=print) -> int:
+    """
+    Search every opening position and write the book
+
+    :param size: Width of the board
+    :param plies: Positions up to this many moves are searched
+    :param path: Book file to write
+    :param depth: Search depth per position
+    :param seconds: Search time per position (0 for no limit)
+    :param workers: Worker processes, one per CPU by default
+    :param batch: Positions per task sent to a worker
+    :return: Number of records written
+    """
+
+    start = time.perf_counter()
+    positions = opening_positions(size, plies)
+    report(f"{len(positions)} positions up to {plies} plies on {size}x{size}")
+    tasks = [(size, depth, seconds, positions[i:i + batch]) for i in range(0, len(positions), batch)]
+    records = []
+    with ProcessPoolExecutor(workers) as pool:
+        for done in pool.map(search_batch, tasks):
+            records.extend(done)
+    records.sort()
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, size, plies, 0, len(records)))
+        for key, move, score, searched in records:
+            file.write(RECORD.pack(key & 0xffffffffffffffff, key >> 64, move, score, searched))
+    report(f"{len(records)} records written to {path} in {time.perf_counter() - start:.1f}s")
+    return len(records)
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file
+
+    Attributes:
+    -----------
+    size --> Width of the board the book is for
+    plies --> Number of moves the book covers
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.fstat(self._file.fileno()).st_size else b''
+        if len(self._map) < HEADER.size or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an opening book")
+        _, self.size, self.plies, _, self._count = HEADER.unpack_from(self._map, 0)
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, index: int) -> int:
+        low, high = struct.unpack_from('<QQ', self._map, HEADER.size + index * RECORD.size)
+        return high << 64 | low
+
+    def probe(self, position: Position):
+        """
+        Look up a position
+
+        :param position: Position with the players alternating
+        :return: BookEntry, None when the position is not in the book
+        """
+
+        if not position.classic or position.size != self.size or position.count > self.plies:
+            return None
+        key, mirrored = position.canonical_key()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count or self._key(low) != key:
+            return None
+        _, _, move, score, depth = RECORD.unpack_from(self._map, HEADER.size + low * RECORD.size)
+        return BookEntry(self.size - 1 - move if mirrored else move, score, depth)
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BookBot:
+    """
+    Plays from an opening book while the game is in it, then lets
+    another bot choose the moves
+    """
+
+    def __init__(self, book: OpeningBook, fallback):
+        self.book = book
+        self.fallback = fallback
+
+    def move(self, game) -> int:
+        if game.player == game.position.turn:
+            entry = self.book.probe(game.position)
+            if entry is not None and game.position.can_play(entry.move):
+                return entry.move
+        return self.fallback.move(game)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour book', description='Build or read an opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='search the opening positions and write a book')
+    build_parser.add_argument('--size', type=int, default=7, help='board size [5...10]')
+    build_parser.add_argument('--plies', type=int, default=4, help='moves covered by the book')
+    build_parser.add_argument('--depth', type=int, default=12, help='search depth per position')
+    build_parser.add_argument('--time', type=float, default=0, help='seconds per position (0 for no limit)')
+    build_parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    build_parser.add_argument('--out', required=True, help='book file to write')
+    probe_parser = commands.add_parser('probe', help='look up a position')
+    probe_parser.add_argument('--book', required=True, help='book file')
+    probe_parser.add_argument('--moves', default='', help='moves played so far as 1-based columns')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        return build(args.size, args.plies, args.out, args.depth, args.time, args.workers)
+    with OpeningBook(args.book) as book:
+        position = Position(book.size)
+        for col in parse_moves(args.moves):
+            position.play(col)
+        entry = book.probe(position)
+        print('not in the book' if entry is None else
+              f"best column {entry.move + 1}  score {entry.score}  depth {entry.depth}")
+        return entry
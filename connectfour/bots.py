@@ -0,0 +1,110 @@
+"""
+Computer players
+
+Every bot has the same move-selection interface as the computer player
+of Board: move(game) receives an engine.Game and returns the column
+(0-based) to play. make_bot builds a bot from a short description such
+as "random", "greedy", "solver:4" or "mcts:2000" so bots can be named
+on the command line and rebuilt inside worker processes.
+"""
+
+import random
+from .solver import Solver
+from .evaluation import Evaluator
+from .mcts import MCTS
+
+
+class RandomBot:
+    """
+    Plays any legal column
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def move(self, game) -> int:
+        return self.rng.choice(game.legal_moves())
+
+
+class GreedyBot:
+    """
+    Looks one move ahead
+
+    Plays a winning column if there is one, else blocks a column the
+    opponent would win with, else the column with the best heuristic
+    score (ties broken at random).
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def move(self, game) -> int:
+        position = game.position
+        player = game.player
+        evaluator = Evaluator.from_position(position)
+        for columns in (evaluator.winning_columns(player), evaluator.forced_blocks(player)):
+            if columns:
+                return columns[0]
+        best = None
+        choices = []
+        for col in game.legal_moves():
+            row = position.play(col, player)
+            evaluator.place(row, col, player)
+            score = evaluator.score(player)
+            evaluator.remove(row, col, player)
+            position.undo()
+            if best is None or score > best:
+                best = score
+                choices = [col]
+            elif score == best:
+                choices.append(col)
+        return self.rng.choice(choices)
+
+
+class SolverBot(Solver):
+    """
+    Solver searching a fixed depth (or time) per move
+    """
+
+    def __init__(self, depth: int = 4, time_limit: float = 0, table_bits: int = 16, seed=None, tablebase=None):
+        """
+        :param tablebase: tablebase.Tablebase answering the positions it holds
+        """
+
+        super().__init__(table_bits=table_bits, max_depth=depth, time_limit=time_limit, tablebase=tablebase)
+
+
+class MCTSBot(MCTS):
+    """
+    Tree search running a fixed number of playouts (or a time) per move
+    """
+
+    def __init__(self, playouts: int = 1000, time_limit: float = 0, seed=None):
+        super().__init__(time_limit=time_limit, playouts=playouts, seed=seed)
+
+
+BOTS = {
+    'random': RandomBot,
+    'greedy': GreedyBot,
+    'solver': SolverBot,
+    'mcts': MCTSBot,
+}
+
+
+def make_bot(spec: str, seed=None):
+    """
+    Build a bot from its description
+
+    :param spec: Bot name from BOTS, optionally followed by ':' and the
+                 depth of the search e.g. "solver:6" (playouts per move
+                 for "mcts")
+    :param seed: Seed for the bots which make random choices
+    :return: New bot
+    """
+
+    name, _, arg = spec.partition(':')
+    if name not in BOTS:
+        raise ValueError(f"Unknown bot {name!r}. The bots are: {', '.join(BOTS)}")
+    if arg:
+        return BOTS[name](int(arg), seed=seed)
+    return BOTS[name](seed=seed)
@@ -0,0 +1,89 @@
+"""
+Command line client for the game server
+
+    python -m connectfour client --size 7            create a match and wait for an opponent
+    python -m connectfour client --match 12          join match 12
+    python -m connectfour client --size 12 --rows 10 --connect 5   create a 12 wide, 10 high match of five in a row
+
+The board is drawn after every move; type a column (1-based) when it is
+your turn.
+"""
+
+import asyncio
+import argparse
+from .bitboard import Position, CONNECT
+from .engine import ON, DRAW
+from .render import TerminalRenderer
+from .server import Client
+
+COLORS = {0: 'white', 1: 'red', 2: 'yellow'}
+
+
+def show(renderer: TerminalRenderer, state: dict, player: int):
+    position = Position(state["size"], state["rows"], state["connect"])
+    for col in state["moves"]:
+        position.play(col)
+    renderer.draw(position)
+    names = state["players"]
+    if state["outcome"] != ON:
+        print('Draw!' if state["outcome"] == DRAW else f"{names[state['winner'] - 1]} wins!")
+    elif names[1] is None:
+        print(f"Match {state['match']}: waiting for an opponent...")
+    elif state["turn"] == player:
+        print(f"{names[player - 1]}, your move")
+    else:
+        print(f"Waiting for {names[state['turn'] - 1]}...")
+
+
+async def play(host: str, port: int, name: str, size: int, match: str, rows: int = 0, connect: int = CONNECT):
+    client = await Client().connect(host, port)
+    loop = asyncio.get_running_loop()
+    renderer = TerminalRenderer(COLORS, top=1, indent=5)
+    try:
+        if match:
+            answer = await client.request("join", match=match, name=name)
+        else:
+            answer = await client.request("create", size=size, rows=rows, connect=connect, name=name)
+        if not answer["ok"]:
+            print(answer["error"])
+            return
+        player, state = answer["player"], answer["state"]
+        show(renderer, state, player)
+        while state["outcome"] == ON:
+            if state["turn"] != player or state["players"][1] is None:
+                await client.events.get()
+                state = (await client.request("state", match=state["match"]))["state"]
+                show(renderer, state, player)
+                continue
+            text = await loop.run_in_executor(None, input, 'Column: ')
+            if not text.strip().isdigit():
+                print("Type a column number")
+                continue
+            answer = await client.request("move", match=state["match"], col=int(text) - 1)
+            if not answer["ok"]:
+                print(answer["error"])
+                continue
+            state = answer["state"]
+            show(renderer, state, player)
+    finally:
+        await client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour client', description='Play on a game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--name', default='Player')
+    parser.add_argument('--size', type=int, default=7, help='board width of a new match [5...20]')
+    parser.add_argument('--rows', type=int, default=0, help='board height of a new match (default: the width)')
+    parser.add_argument('--connect', type=int, default=CONNECT, help='coins in a row to win a new match')
+    parser.add_argument('--match', default='', help='id of the match to join (a new one is created without it)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(play(args.host, args.port, args.name, args.size, args.match, args.rows, args.connect))
+    except (KeyboardInterrupt, EOFError):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,452 @@
+"""
+Self-play training data (needs numpy)
+
+Bots play games against each other on a board shape, every position
+met before a move becomes a training example, and the examples are
+written to fixed-size shards of NumPy arrays:
+
+    planes --> (N, 2, rows, size) int8: the coins of the player to move,
+               then those of the opponent, row 0 at the top
+    outcome --> (N,) int8: 1 if the player to move went on to win the
+                game, 0 for a draw, -1 for a loss
+    ply --> (N,) int16: coins on the board
+    value --> (N,) int16: the solver's score for the player to move
+              (see solver.WIN), only when labelling with --depth
+
+A position and its mirror image are kept once: the canonical key of
+every example goes through a Bloom filter, which takes a fixed number
+of bits however many positions have been seen. A false positive drops
+a new position now and then (one in a thousand at the capacity), it
+never keeps a duplicate.
+
+Games are played in chunks on a pool of worker processes, each chunk
+seeded from the run's seed and its number, and the chunks are added in
+order. manifest.json in the output directory lists the shards and how
+many chunks of each shape are done, so running the same command again
+carries on where an interrupted run stopped:
+
+    python -m connectfour dataset data/ --sizes 7 7x6 --games 100000 --bots greedy solver:4 --workers 8
+    python -m connectfour dataset data/ --sizes 9 --games 20000 --bots random --depth 6
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .bitboard import MIN_SIZE, MAX_SIDE, MIN_CONNECT, MAX_CONNECT, CONNECT
+from .engine import Game, ON
+from .bots import make_bot
+from .solver import Solver
+
+FORMAT = 1
+MANIFEST = 'manifest.json'
+FIELDS = ('planes', 'outcome', 'ply', 'value')
+CHECKPOINT_SECONDS = 60
+# Settings a run has to share with the run it resumes
+SETTINGS = ('bots', 'games', 'chunk', 'opening', 'explore', 'depth', 'seed', 'shard_size', 'capacity')
+
+
+def shape_name(size: int, rows: int, connect: int) -> str:
+    return f"{size}x{rows}c{connect}"
+
+
+def to_planes(boards: list, size: int, rows: int) -> np.ndarray:
+    """
+    Unpack bitboards (layout of bitboard.Position) into 0/1 planes
+
+    :return: (N, rows, size) int8 array, row 0 at the top
+    """
+
+    stride = rows + 1
+    width = (size * stride + 7) // 8
+    raw = np.frombuffer(b''.join(board.to_bytes(width, 'little') for board in boards), dtype=np.uint8)
+    bits = np.unpackbits(raw.reshape(len(boards), width), axis=1, bitorder='little')
+    # [position, col, bit] with bit rows - 1 - row, reversed so the index is the row
+    cells = bits[:, :size * stride].reshape(len(boards), size, stride)[:, :, rows - 1::-1]
+    return cells.transpose(0, 2, 1).astype(np.int8)
+
+
+def digest(key: int) -> bytes:
+    """
+    16 byte hash of a canonical key, what the Bloom filter is fed
+    """
+
+    return hashlib.blake2b(key.to_bytes((key.bit_length() + 7) // 8 or 1, 'little'), digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    Set of hashes answering "seen" or "surely not seen" in fixed memory
+
+    Attributes:
+    -----------
+    bits --> Bit array >> type = numpy uint8 array
+    size --> Number of bits
+    hashes --> Bits set per item
+
+    Additional Info:
+    ----------------
+    The bits of an item are h1 + i * h2 (i < hashes) for the two halves
+    of its 16 byte digest, so a whole batch is looked up and added with
+    a few array operations.
+    """
+
+    def __init__(self, capacity: int, error: float = 0.001, bits: np.ndarray = None):
+        """
+        :param capacity: Items the filter is sized for
+        :param error: Chance of a false positive once it holds capacity items
+        :param bits: Bit array of a saved filter of the same capacity
+        """
+
+        size = max(64, int(-capacity * np.log(error) / np.log(2) ** 2))
+        self.size = (size + 7) // 8 * 8
+        self.hashes = max(1, round(self.size / capacity * np.log(2)))
+        self.bits = np.zeros(self.size // 8, dtype=np.uint8) if bits is None else bits
+
+    def _positions(self, digests: np.ndarray) -> np.ndarray:
+        halves = digests.view('<u8').reshape(-1, 2)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        # uint64 arithmetic wraps around, which is what the hash needs
+        return (halves[:, :1] + steps * (halves[:, 1:] | np.uint64(1))) % np.uint64(self.size)
+
+    def add_new(self, digests: np.ndarray) -> np.ndarray:
+        """
+        Add a batch of digests and tell which ones were new
+
+        :param digests: (N, 16) uint8 array
+        :return: (N,) bool array, False for the digests already in the
+                 filter or earlier in the batch
+        """
+
+        fresh = np.zeros(len(digests), dtype=bool)
+        if not len(digests):
+            return fresh
+        _, first = np.unique(digests.view('V16').ravel(), return_index=True)
+        positions = self._positions(digests[first])
+        seen = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8) & 1).all(axis=1)
+        new = first[~seen]
+        positions = positions[~seen].ravel()
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+        fresh[new] = True
+        return fresh
+
+
+def play_chunk(task: tuple) -> dict:
+    """
+    Play a chunk of games in a worker process
+
+    :param task: (size, rows, connect, bot specs, seed, games, opening
+                  plies, exploration rate, solver depth or 0)
+    :return: {field: array} of every position met, in the order they
+             were met, plus 'digests' ((N, 16) uint8) for the dedupe
+    """
+
+    size, rows, connect, specs, seed, games, opening, explore, depth = task
+    rows = rows or size
+    rng = random.Random(seed)
+    bots = [make_bot(spec, rng.random()) for spec in specs]
+    solver = Solver(table_bits=18, max_depth=depth) if depth else None
+    movers, others, plies, outcomes, values, digests = [], [], [], [], [], []
+    scores = {}
+    for _ in range(games):
+        game = Game(size, 1, rows, connect)
+        players = (None, rng.choice(bots), rng.choice(bots))
+        random_plies = rng.randint(0, opening)
+        first = len(movers)
+        while game.outcome == ON:
+            position = game.position
+            player = game.player
+            key, _ = position.canonical_key()
+            movers.append(position.boards[player])
+            others.append(position.boards[3 - player])
+            plies.append(position.count)
+            digests.append(digest(key))
+            if solver is not None:
+                if key not in scores:
+                    scores[key] = solver.search(position, player).score
+                values.append(scores[key])
+            if position.count < random_plies or rng.random() < explore:
+                game.play(rng.choice(game.legal_moves()))
+            else:
+                game.play(players[player].move(game))
+        # Positions alternate players, the last one was the winner's move
+        for index in range(first, len(movers)):
+            if not game.winner:
+                outcomes.append(0)
+            else:
+                outcomes.append(1 if (len(movers) - 1 - index) % 2 == 0 else -1)
+    return {
+        'planes': np.stack([to_planes(movers, size, rows), to_planes(others, size, rows)], axis=1),
+        'outcome': np.array(outcomes, dtype=np.int8),
+        'ply': np.array(plies, dtype=np.int16),
+        'value': np.array(values if solver is not None else [0] * len(movers), dtype=np.int16),
+        'digests': np.frombuffer(b''.join(digests), dtype=np.uint8).reshape(-1, 16),
+    }
+
+
+class DatasetWriter:
+    """
+    Writes the examples of one board shape into shards and keeps the
+    manifest up to date
+
+    Attributes:
+    -----------
+    directory --> Output directory
+    name --> Shape name, e.g. 7x6c4, the prefix of its files
+    shape --> (size, rows, connect)
+    settings --> Run settings, the same for every shape of a directory
+    manifest --> Contents of manifest.json
+    entry --> manifest['shapes'][name]: chunks done, positions kept and
+              duplicates dropped so far, and the state file
+    bloom --> BloomFilter of the positions kept
+    pending --> {field: list of arrays} of the examples kept but not yet
+                in a shard, each list starting with an empty array
+
+    Additional Info:
+    ----------------
+    A checkpoint writes the Bloom filter and the pending examples to a
+    new state file, then the manifest, then deletes the old state file.
+    Every file is written aside and renamed, so whenever the run stops
+    the manifest names a complete set of files, and the chunks after
+    its count are simply played again.
+    """
+
+    def __init__(self, directory: str, shape: tuple, settings: dict):
+        self.directory = directory
+        self.shape = shape
+        self.name = shape_name(*shape)
+        self.settings = settings
+        self.manifest = read_manifest(directory) if os.path.exists(os.path.join(directory, MANIFEST)) else \
+            {'format': FORMAT, 'settings': settings, 'shards': [], 'shapes': {}}
+        if self.manifest['settings'] != settings:
+            changed = [key for key in SETTINGS if self.manifest['settings'].get(key) != settings.get(key)]
+            raise ValueError(f"{directory} was made with other settings ({', '.join(changed)}), "
+                             f"use another directory")
+        self.entry = self.manifest['shapes'].setdefault(self.name, {
+            'size': shape[0], 'rows': shape[1], 'connect': shape[2], 'chunks_done': 0, 'positions': 0,
+            'duplicates': 0, 'shards': 0, 'complete': False, 'state': None})
+        self.bloom = BloomFilter(settings['capacity'])
+        empty = {'planes': np.zeros((0, 2, shape[1], shape[0]), dtype=np.int8),
+                 'outcome': np.zeros(0, dtype=np.int8), 'ply': np.zeros(0, dtype=np.int16),
+                 'value': np.zeros(0, dtype=np.int16)}
+        self.pending = {field: [empty[field]] for field in FIELDS}
+        self._pending_count = 0
+        self._saved = time.monotonic()
+        if self.entry['state']:
+            with np.load(os.path.join(directory, self.entry['state'])) as state:
+                self.bloom = BloomFilter(settings['capacity'], bits=state['bloom'].copy())
+                for field in FIELDS:
+                    self.pending[field].append(state[field])
+                self._pending_count = len(state['outcome'])
+
+    def _joined(self) -> dict:
+        return {field: np.concatenate(parts) for field, parts in self.pending.items()}
+
+    def _take(self, count: int) -> dict:
+        """
+        Remove the first count pending examples
+        """
+
+        taken = {}
+        for field, array in self._joined().items():
+            taken[field] = array[:count]
+            self.pending[field] = [array[count:]]
+        self._pending_count -= count
+        return taken
+
+    def add(self, examples: dict):
+        """
+        Add the examples of the next chunk, writing shards as they fill up
+        """
+
+        fresh = self.bloom.add_new(examples['digests'])
+        kept = int(fresh.sum())
+        for field in FIELDS:
+            self.pending[field].append(examples[field][fresh])
+        self._pending_count += kept
+        self.entry['positions'] += kept
+        self.entry['duplicates'] += len(fresh) - kept
+        self.entry['chunks_done'] += 1
+        wrote = False
+        while self._pending_count >= self.settings['shard_size']:
+            self._write_shard(self._take(self.settings['shard_size']))
+            wrote = True
+        if wrote or time.monotonic() - self._saved > CHECKPOINT_SECONDS:
+            self.checkpoint()
+
+    def finish(self):
+        """
+        Write the last, partly filled shard and mark the shape as done
+        """
+
+        if self._pending_count:
+            self._write_shard(self._take(self._pending_count))
+        self.entry['complete'] = True
+        self.checkpoint()
+
+    def _write_shard(self, arrays: dict):
+        file = f"{self.name}-{self.entry['shards']:05d}.npz"
+        path = os.path.join(self.directory, file)
+        with open(path + '.tmp', 'wb') as out:
+            np.savez_compressed(out, **arrays)
+        os.replace(path + '.tmp', path)
+        self.manifest['shards'].append({'file': file, 'shape': self.name, 'positions': len(arrays['outcome'])})
+        self.entry['shards'] += 1
+
+    def checkpoint(self):
+        """
+        Save the Bloom filter, the pending examples and the manifest
+        """
+
+        old = self.entry['state']
+        self.entry['state'] = None
+        if not self.entry['complete']:
+            state = f"{self.name}-state-{self.entry['chunks_done']:07d}.npz"
+            path = os.path.join(self.directory, state)
+            with open(path + '.tmp', 'wb') as out:
+                np.savez(out, bloom=self.bloom.bits, **self._joined())
+            os.replace(path + '.tmp', path)
+            self.entry['state'] = state
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as out:
+            json.dump(self.manifest, out, indent=1)
+        os.replace(path + '.tmp', path)
+        if old and old != self.entry['state']:
+            os.remove(os.path.join(self.directory, old))
+        self._saved = time.monotonic()
+
+
+def read_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"{directory} does not hold a dataset this version reads")
+    return manifest
+
+
+def iter_shards(directory: str, shape: str = None):
+    """
+    Load the shards of a dataset one at a time
+
+    :param directory: Output directory of a run
+    :param shape: Shape name (e.g. 7x6c4) to load, every shape by default
+    :return: Generator of (shape name, {field: array}) per shard
+    """
+
+    for shard in read_manifest(directory)['shards']:
+        if shape is None or shard['shape'] == shape:
+            with np.load(os.path.join(directory, shard['file'])) as arrays:
+                yield shard['shape'], {field: arrays[field] for field in FIELDS}
+
+
+def generate(directory: str, shape: tuple, settings: dict, workers: int = 1, progress=None) -> dict:
+    """
+    Play the games of one board shape and write their positions
+
+    :param directory: Output directory, made if missing
+    :param shape: (size, rows, connect)
+    :param settings: Run settings, see SETTINGS
+    :param workers: Processes playing the games
+    :param progress: Called with the manifest entry of the shape after every chunk
+    :return: The manifest entry of the shape
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    writer = DatasetWriter(directory, shape, settings)
+    entry = writer.entry
+    if entry['complete']:
+        return entry
+    chunks = -(-settings['games'] // settings['chunk'])
+
+    def task(chunk: int) -> tuple:
+        seed = random.Random(f"{settings['seed']}/{writer.name}/{chunk}").getrandbits(32)
+        games = min(settings['chunk'], settings['games'] - chunk * settings['chunk'])
+        return (*shape, settings['bots'], seed, games, settings['opening'], settings['explore'], settings['depth'])
+
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        if pool is None:
+            for chunk in range(entry['chunks_done'], chunks):
+                writer.add(play_chunk(task(chunk)))
+                if progress:
+                    progress(entry)
+        else:
+            # A few chunks per worker in flight: enough to keep them busy, and the memory stays bounded
+            futures = deque()
+            chunk = entry['chunks_done']
+            while chunk < chunks or futures:
+                while chunk < chunks and len(futures) < 2 * workers:
+                    futures.append(pool.submit(play_chunk, task(chunk)))
+                    chunk += 1
+                writer.add(futures.popleft().result())
+                if progress:
+                    progress(entry)
+        writer.finish()
+    finally:
+        # An interrupted run carries on from the last checkpoint
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return entry
+
+
+def board_shape(text: str) -> tuple:
+    sides = [int(side) for side in text.lower().split('x')]
+    if len(sides) > 2 or not all(MIN_SIZE <= side <= MAX_SIDE for side in sides):
+        raise argparse.ArgumentTypeError(f"board sides must be {MIN_SIZE} to {MAX_SIDE}")
+    return sides[0], sides[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour dataset',
+                                     description='Write self-play positions to sharded NumPy files')
+    parser.add_argument('directory', help='output directory, a run there is resumed')
+    parser.add_argument('--sizes', type=board_shape, nargs='+', default=[(7, 7)], help='board shapes, e.g. 7 7x6')
+    parser.add_argument('--connect', type=int, default=CONNECT, choices=range(MIN_CONNECT, MAX_CONNECT + 1),
+                        metavar='N', help='coins in a row to win')
+    parser.add_argument('--games', type=int, default=1000, help='games per board shape')
+    parser.add_argument('--bots', nargs='+', default=['greedy'],
+                        help='bots picked at random for each side of a game (random, greedy, solver:D, mcts:P)')
+    parser.add_argument('--opening', type=int, default=4, help='up to this many random moves open each game')
+    parser.add_argument('--explore', type=float, default=0.05, help='chance of a random move instead of the bot\'s')
+    parser.add_argument('--depth', type=int, default=0, help='also label every position with a search this deep')
+    parser.add_argument('--shard-size', type=int, default=1 << 16, help='positions per shard')
+    parser.add_argument('--capacity', type=int, default=10_000_000,
+                        help='distinct positions per shape the dedupe filter is sized for')
+    parser.add_argument('--chunk', type=int, default=32, help='games per worker task')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    args = parser.parse_args(argv)
+
+    for bot in args.bots:
+        make_bot(bot)
+    settings = {'bots': args.bots, 'games': args.games, 'chunk': args.chunk, 'opening': args.opening,
+                'explore': args.explore, 'depth': args.depth, 'seed': args.seed, 'shard_size': args.shard_size,
+                'capacity': args.capacity}
+    entries = []
+    for size, rows in args.sizes:
+        if args.connect > max(size, rows):
+            parser.error(f"{args.connect} in a row does not fit on a {size}x{rows} board")
+        start = time.perf_counter()
+        name = shape_name(size, rows, args.connect)
+        try:
+            entry = generate(args.directory, (size, rows, args.connect), settings, args.workers,
+                             lambda entry: print(f"\r{name}: {min(entry['chunks_done'] * args.chunk, args.games)} "
+                                                 f"games  {entry['positions']} positions  {entry['duplicates']} "
+                                                 f"duplicates", end='', flush=True))
+        except ValueError as error:
+            parser.error(str(error))
+        seconds = time.perf_counter() - start
+        print(f"\r{name}: {entry['positions']} positions in {entry['shards']} shards, {entry['duplicates']} "
+              f"duplicates dropped ({seconds:.1f}s)")
+        entries.append(entry)
+    return entries
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Headless Connect Four game
+
+Game takes moves as column indexes and returns what happened as a
+Result, without reading input, printing or colouring anything. The
+command line solutions are front-ends which turn user input into
+calls to Game.play and draw the board from Game.position.
+"""
+
+from collections import namedtuple
+from .bitboard import Position, CONNECT
+from .wincheck import WinTracker
+
+# Outcome of a game, same values as Solution 1's state_of_game
+ON = "ON"
+OVER = "OVER"
+DRAW = "DRAW"
+
+
+def parse_moves(text: str) -> list:
+    """
+    Read a list of moves written with 1-based columns
+
+    :param text: Columns separated by commas or spaces ("4,4,10") or,
+                 when every column is below 10, written one after the
+                 other ("4435")
+    :return: List of 0-based column indexes
+    """
+
+    text = text.strip()
+    parts = text.replace(',', ' ').split() if (',' in text or ' ' in text) else list(text)
+    return [int(part) - 1 for part in parts]
+
+
+Result = namedtuple("Result", ["row", "col", "player", "outcome", "line"])
+Result.__doc__ = """
+Outcome of a move
+
+row --> Row index (mapping coordinates) where the coin landed
+col --> Column index of the move
+player --> Index of the player who made the move
+outcome --> ON, OVER (the player won) or DRAW
+line --> Winning line as a tuple of (row, col) cells, None unless OVER
+"""
+
+
+class Game:
+    """
+    Rules of one game of Connect Four
+
+    Attributes:
+    -----------
+    size --> Width of the board
+    rows --> Height of the board
+    connect --> Coins in a row needed to win
+    position --> Coins on the board >> type = bitboard.Position
+    tracker --> Coins of each player in every line >> type = wincheck.WinTracker
+    player --> Index of the player to move
+    outcome --> ON, OVER or DRAW
+    winner --> Index of the winning player, 0 if there is none
+    line --> Winning line, None if there is none
+    players --> Index of the player who made each move, in order
+
+    Additional Info:
+    ----------------
+    Players normally alternate but a turn can be given away with
+    skip(), which is how Solution 1 penalises repeated invalid input.
+    Columns are 0-based here, the front-ends show them 1-based.
+    """
+
+    __slots__ = ('size', 'rows', 'connect', 'position', 'tracker', 'player', 'outcome', 'winner', 'line', 'players')
+
+    def __init__(self, size: int = 7, player: int = 1, rows: int = 0, connect: int = CONNECT):
+        """
+        Start a game on an empty board
+
+        :param size: Width of the board. Valid values are 5-20
+        :param player: Index of the player who moves first
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win
+        """
+
+        self.position = Position(size, rows, connect)
+        self.size = size
+        self.rows = self.position.rows
+        self.connect = connect
+        self.tracker = WinTracker(size, self.rows, connect)
+        self.player = player
+        self.players = []
+        self.outcome = ON
+        self.winner = 0
+        self.line = None
+
+    def __repr__(self):
+        shape = f"size={self.size}" if self.position.classic else \
+            f"size={self.size}, rows={self.rows}, connect={self.connect}"
+        return f"Game({shape}, moves={self.position.moves}, outcome={self.outcome})"
+
+    @property
+    def moves(self) -> list:
+        """
+        Columns played so far, in order
+        """
+
+        return self.position.moves
+
+    def legal_moves(self) -> list:
+        """
+        Columns a coin can be dropped in, empty once the game is over
+        """
+
+        return self.position.legal_moves() if self.outcome == ON else []
+
+    def is_legal(self, col: int) -> bool:
+        return self.outcome == ON and self.position.can_play(col)
+
+    def play(self, col: int) -> Result:
+        """
+        Drop a coin for the player to move
+
+        :param col: Column index (0-based)
+        :return: Result of the move
+        """
+
+        if self.outcome != ON:
+            raise ValueError("The game is over")
+        player = self.player
+        row = self.position.play(col, player)
+        line = self.tracker.place(row, col, player)
+        self.players.append(player)
+        if line is not None:
+            self.outcome = OVER
+            self.winner = player
+            self.line = line
+        elif self.position.is_full():
+            self.outcome = DRAW
+        else:
+            self.player = 3 - player
+        return Result(row, col, player, self.outcome, line)
+
+    def skip(self):
+        """
+        Give the turn to the other player without making a move
+        """
+
+        if self.outcome == ON:
+            self.player = 3 - self.player
+
+    def undo(self) -> int:
+        """
+        Take back the last move
+
+        :return: Column index of the move taken back
+        """
+
+        col = self.position.moves[-1]
+        row = self.position.top_row(col)
+        player = self.players.pop()
+        self.tracker.remove(row, col, player)
+        self.position.undo()
+        self.player = player
+        self.outcome = ON
+        self.winner = 0
+        self.line = None
+        return col
+
+    @classmethod
+    def from_moves(cls, size: int, moves, player: int = 1, rows: int = 0, connect: int = CONNECT):
+        """
+        Replay a list of columns on an empty board
+
+        :param size: Width of the board
+        :param moves: Column indexes (0-based), players alternating
+        :param player: Index of the player who moved first
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win
+        :return: New game
+        """
+
+        self = cls(size, player, rows, connect)
+        for col in moves:
+            self.play(col)
+        return self
+
+    @classmethod
+    def from_position(cls, position: Position, player: int = 0):
+        """
+        Continue a game from an existing position
+
+        :param position: Position to continue from. It is used as is, not copied
+        :param player: Index of the player to move, by default the player
+                       whose turn it is when the players alternate
+        :return: New game
+        """
+
+        self = cls(position.size, player or position.turn, position.rows, position.connect)
+        self.position = position
+        self.tracker = WinTracker.from_position(position)
+        filled = [0] * position.size
+        for col in position.moves:
+            self.players.append(position.cell(position.rows - 1 - filled[col], col))
+            filled[col] += 1
+        for player in (1, 2):
+            if self.outcome == ON and position.has_won(player):
+                self.outcome = OVER
+                self.winner = player
+                self.line = next(line for line in self.tracker.table.lines
+                                 if all(position.cell(r, c) == player for r, c in line))
+        if self.outcome == ON and position.is_full():
+            self.outcome = DRAW
+        return self
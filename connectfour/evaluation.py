@@ -0,0 +1,327 @@
+"""
+Incremental position evaluation
+
+An Evaluator is a WinTracker (coins of each player in every line of the
+board) which also keeps, as coins are placed and taken back:
+
+    - the heuristic score of the position (the value of evaluate()), as a
+      running total of what every line is worth
+    - the threats of each player: the empty cells which would complete
+      a line of theirs, as a bitboard in the layout of bitboard.Position
+
+Placing or removing a coin only visits the lines through its cell, and
+reading the score, the winning columns or the columns the opponent has
+to be stopped in does not visit anything:
+
+    evaluator = Evaluator.from_position(position)
+    evaluator.place(row, col, player)
+    evaluator.score(player), evaluator.winning_columns(player), evaluator.forced_blocks(player)
+
+Running this module checks it against evaluate() and a scan of
+every column on random games:  python -m connectfour.evaluation
+"""
+
+import random
+import functools
+from .bitboard import Position, CONNECT
+from .wincheck import WinTracker, VARIANTS, line_table
+
+# Heuristic value of a window of four holding 1, 2 or 3 coins of one player only
+WINDOW_WEIGHTS = (0, 1, 4, 32, 0)
+# Heuristic scores are kept below the scores of forced wins (solver.WIN_BOUND)
+EVALUATION_BOUND = 4500
+
+
+@functools.lru_cache(maxsize=None)
+def window_masks(size: int, rows: int = 0, connect: int = CONNECT) -> tuple:
+    """
+    Bitboard mask of every line of connect cells on a board shape
+    """
+
+    rows = rows or size
+    stride = rows + 1
+    masks = []
+    for line in line_table(size, rows, connect).lines:
+        mask = 0
+        for row, col in line:
+            mask |= 1 << (col * stride + rows - 1 - row)
+        masks.append(mask)
+    return tuple(masks)
+
+
+@functools.lru_cache(maxsize=None)
+def window_weights(connect: int) -> tuple:
+    """
+    Heuristic value of a window holding 0 to connect coins of one
+    player only, WINDOW_WEIGHTS for four in a row
+
+    Each extra coin is worth four times the one before, and a window
+    one coin short of a line twice that again.
+    """
+
+    weights = [0] + [4 ** (coins - 1) for coins in range(1, connect)] + [0]
+    weights[connect - 1] *= 2
+    return tuple(weights)
+
+
+def evaluate(position: Position, player: int) -> int:
+    """
+    Heuristic score of a position for a player, read from the whole board
+
+    :param position: Position to score
+    :param player: Index of the player the score is for
+    :return: Sum of the window weights over the windows only the player
+             has coins in, minus the same for the opponent. Kept within
+             EVALUATION_BOUND, which only the big boards with long lines
+             can reach
+    """
+
+    mine = position.boards[player]
+    theirs = position.boards[3 - player]
+    weights = window_weights(position.connect)
+    score = 0
+    for mask in window_masks(position.size, position.rows, position.connect):
+        m = mask & mine
+        t = mask & theirs
+        if m and not t:
+            score += weights[m.bit_count()]
+        elif t and not m:
+            score -= weights[t.bit_count()]
+    return max(-EVALUATION_BOUND, min(EVALUATION_BOUND, score))
+
+
+@functools.lru_cache(maxsize=None)
+def cell_bits(size: int, rows: int = 0) -> tuple:
+    """
+    Bit of every cell (row * size + col) in the layout of bitboard.Position
+    """
+
+    rows = rows or size
+    return tuple(1 << (col * (rows + 1) + rows - 1 - row) for row in range(rows) for col in range(size))
+
+
+class Evaluator(WinTracker):
+    """
+    Line counters with the heuristic score and the threats kept up to date
+
+    Attributes:
+    -----------
+    weights --> Worth of a line holding 0 to connect coins of one player
+                only (see window_weights)
+    total --> Heuristic score for player 1: the worth of the lines only
+              player 1 has coins in, minus the same for player 2
+    filled --> Bitboard of the occupied cells
+    threats --> [unused, player 1 threats, player 2 threats] as
+                bitboards of the empty cells completing a line
+    threat_counts --> [unused, player 1 counts, player 2 counts] with,
+                      for every cell, the lines it would complete
+    bits --> Bit of every cell (see cell_bits)
+    full --> Bitboard of every cell of the board
+    bottom --> Bitboard of the bottom cell of every column
+
+    Additional Info:
+    ----------------
+    A line changes worth only when a coin lands in it, so placing a coin
+    takes the old worth of each line through the cell off the total and
+    adds the new one. A line becomes a threat when it holds connect - 1
+    coins of one player and none of the other, and stops being one when
+    its last cell is filled by either player.
+
+    A threat only wins now when its cell is the next free cell of its
+    column: adding the bottom row to the filled cells carries into
+    exactly those cells, so the winning cells are one and-ing away.
+    """
+
+    __slots__ = ('weights', 'total', 'filled', 'threats', 'threat_counts', 'bits', 'full', 'bottom')
+
+    def __init__(self, size: int, rows: int = 0, connect: int = CONNECT):
+        super().__init__(size, rows, connect)
+        rows = rows or size
+        self.weights = window_weights(connect)
+        self.total = 0
+        self.filled = 0
+        self.threats = [0, 0, 0]
+        self.threat_counts = [None, [0] * (size * rows), [0] * (size * rows)]
+        self.bits = cell_bits(size, rows)
+        self.full = sum(self.bits)
+        self.bottom = sum(1 << (col * (rows + 1)) for col in range(size))
+
+    def place(self, row: int, col: int, player: int):
+        """
+        Record a coin and report if it completed a line
+
+        :param row: Row index (mapping coordinates) of the coin
+        :param col: Column index of the coin
+        :param player: Index of the player owning the coin
+        :return: The completed line as a tuple of (row, col) cells, else None
+        """
+
+        cell = row * self.size + col
+        mine = self.counts[player]
+        theirs = self.counts[3 - player]
+        weights = self.weights
+        connect = self.connect
+        sign = 1 if player == 1 else -1
+        self.filled |= self.bits[cell]
+        won = -1
+        for line in self.table.through[cell]:
+            had = mine[line]
+            other = theirs[line]
+            if other:
+                if not had:
+                    # The line was the opponent's only and is worth nothing to either player now
+                    self.total += sign * weights[other]
+                    if other == connect - 1:
+                        self._threat(3 - player, cell, -1)
+            else:
+                self.total += sign * (weights[had + 1] - weights[had])
+                if had == connect - 2:
+                    self._threat(player, self._empty_cell(line, -1), 1)
+                elif had == connect - 1:
+                    self._threat(player, cell, -1)
+            mine[line] = had + 1
+            if had + 1 == connect:
+                won = line
+        return self.table.lines[won] if won >= 0 else None
+
+    def remove(self, row: int, col: int, player: int):
+        """
+        Forget a coin, used when a move is taken back
+        """
+
+        cell = row * self.size + col
+        mine = self.counts[player]
+        theirs = self.counts[3 - player]
+        weights = self.weights
+        connect = self.connect
+        sign = 1 if player == 1 else -1
+        self.filled &= ~self.bits[cell]
+        for line in self.table.through[cell]:
+            had = mine[line] - 1
+            other = theirs[line]
+            mine[line] = had
+            if other:
+                if not had:
+                    self.total -= sign * weights[other]
+                    if other == connect - 1:
+                        self._threat(3 - player, cell, 1)
+            else:
+                self.total -= sign * (weights[had + 1] - weights[had])
+                if had == connect - 2:
+                    self._threat(player, self._empty_cell(line, cell), -1)
+                elif had == connect - 1:
+                    self._threat(player, cell, 1)
+
+    def _empty_cell(self, line: int, skip: int) -> int:
+        """
+        The empty cell of a line holding connect - 1 coins, not counting
+        the cell skip (a coin being taken back)
+        """
+
+        size = self.size
+        for row, col in self.table.lines[line]:
+            cell = row * size + col
+            if cell != skip and not self.filled & self.bits[cell]:
+                return cell
+        raise AssertionError("the line has no empty cell")
+
+    def _threat(self, player: int, cell: int, change: int):
+        counts = self.threat_counts[player]
+        counts[cell] += change
+        if counts[cell] == (1 if change > 0 else 0):
+            self.threats[player] ^= self.bits[cell]
+
+    def score(self, player: int) -> int:
+        """
+        Heuristic score of the position for a player, the value of
+        evaluate() without scanning the board
+        """
+
+        total = self.total if player == 1 else -self.total
+        return max(-EVALUATION_BOUND, min(EVALUATION_BOUND, total))
+
+    def playable(self) -> int:
+        """
+        Bitboard of the next free cell of every column which is not full
+        """
+
+        return (self.filled + self.bottom) & self.full
+
+    def wins(self, player: int) -> int:
+        """
+        Bitboard of the cells a player wins by dropping a coin in now
+        """
+
+        return self.threats[player] & (self.filled + self.bottom) & self.full
+
+    def winning_columns(self, player: int) -> list:
+        """
+        Columns a player wins with right away
+        """
+
+        return self.columns_of(self.wins(player))
+
+    def forced_blocks(self, player: int) -> list:
+        """
+        Columns a player has to play to stop the opponent winning on the
+        next move. More than one means the opponent cannot be stopped
+        """
+
+        return self.columns_of(self.wins(3 - player))
+
+    def columns_of(self, cells: int) -> list:
+        """
+        Columns of the cells of a bitboard, left to right
+        """
+
+        stride = self.table.rows + 1
+        columns = []
+        while cells:
+            low = cells & -cells
+            columns.append((low.bit_length() - 1) // stride)
+            cells ^= low
+        return columns
+
+
+def selfcheck(games: int = 200, seed: int = 7):
+    """
+    Play random games, placing and taking back coins, and compare the
+    evaluator with evaluate() and with trying every column
+    """
+
+    rng = random.Random(seed)
+    shapes = [(size, size, CONNECT) for size in range(5, 11)] + list(VARIANTS)
+    for size, rows, connect in shapes:
+        for _ in range(games if size * rows <= 100 else games // 10):
+            position = Position(size, rows, connect)
+            evaluator = Evaluator(size, rows, connect)
+            while True:
+                for player in (1, 2):
+                    assert evaluator.score(player) == evaluate(position, player), (position.moves, player)
+                    expected = []
+                    for col in position.legal_moves():
+                        position.play(col, player)
+                        if position.has_won(player):
+                            expected.append(col)
+                        position.undo()
+                    assert evaluator.winning_columns(player) == expected, (position.moves, player)
+                legal = position.legal_moves()
+                if not legal:
+                    break
+                col = rng.choice(legal)
+                player = position.turn
+                row = position.play(col)
+                line = evaluator.place(row, col, player)
+                if rng.random() < 0.2:
+                    evaluator.remove(row, col, player)
+                    position.undo()
+                    continue
+                if line is not None:
+                    assert position.has_won(player)
+                    break
+        print(f"{size}x{rows} connect {connect} ok")
+    print('Evaluator agrees with evaluate() and the winning moves on every board shape')
+
+
+if __name__ == '__main__':
+    selfcheck()
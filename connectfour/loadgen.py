@@ -0,0 +1,107 @@
+"""
+Load generator for the game server
+
+Plays many matches at once between random players, two connections per
+match, and times every move from sending the request to reading the
+answer. Without --port a server is started in the same process on a
+free localhost port.
+
+    python -m connectfour loadgen --matches 2000 --concurrency 500 --size 7
+"""
+
+import time
+import random
+import asyncio
+import argparse
+from .engine import ON
+from .server import GameServer, Client
+
+
+async def play_match(host: str, port: int, size: int, rng: random.Random, latencies: list):
+    """
+    Play one match with random moves
+
+    :param latencies: Seconds taken by every move, appended to
+    :return: Number of moves played
+    """
+
+    first = await Client().connect(host, port)
+    second = await Client().connect(host, port)
+    try:
+        answer = await first.request("create", size=size, name="load1")
+        match = answer["match"]
+        await second.request("join", match=match, name="load2")
+        clients = (None, first, second)
+        state = answer["state"]
+        while state["outcome"] == ON:
+            legal = [col for col in range(size) if state["moves"].count(col) < state["rows"]]
+            start = time.perf_counter()
+            answer = await clients[state["turn"]].request("move", match=match, col=rng.choice(legal))
+            latencies.append(time.perf_counter() - start)
+            if not answer["ok"]:
+                raise RuntimeError(answer["error"])
+            state = answer["state"]
+        return len(state["moves"])
+    finally:
+        await first.close()
+        await second.close()
+
+
+async def run(host: str, port: int, matches: int, concurrency: int, size: int, seed: int, report=print) -> dict:
+    """
+    Play the matches, at most concurrency of them at a time
+
+    :return: Totals and move latency percentiles in milliseconds
+    """
+
+    server = None
+    if not port:
+        server = await GameServer().serve(host, 0)
+        port = server.sockets[0].getsockname()[1]
+    rng = random.Random(seed)
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with limit:
+            return await play_match(host, port, size, rng, latencies)
+
+    start = time.perf_counter()
+    moves = sum(await asyncio.gather(*(one() for _ in range(matches))))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1e3, 3)
+
+    stats = {
+        'matches': matches,
+        'moves': moves,
+        'seconds': round(elapsed, 3),
+        'moves_per_sec': round(moves / elapsed, 1),
+        'p50_ms': percentile(50),
+        'p99_ms': percentile(99),
+    }
+    report(f"{matches} matches ({concurrency} at a time), {moves} moves in {elapsed:.2f}s = "
+           f"{stats['moves_per_sec']:,.0f} moves/s   move latency p50 {stats['p50_ms']}ms  p99 {stats['p99_ms']}ms")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour loadgen', description='Load test a game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='server port (default: start a server in this process)')
+    parser.add_argument('--matches', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=250, help='matches played at the same time')
+    parser.add_argument('--size', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args.host, args.port, args.matches, args.concurrency, args.size, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,481 @@
+"""
+Monte Carlo tree search player
+
+Instead of searching every move to a depth, MCTS grows a tree one node
+per playout: it walks down the tree choosing children by UCT, adds the
+children of the node it reaches, plays the game out at random from one
+of them and credits the result to every node on the way. The more
+playouts fit in the time budget the better the move, which makes it a
+useful anytime player on the big boards where alpha-beta cannot see
+far enough.
+
+    python -m connectfour mcts --size 9 --time 2
+    python -m connectfour mcts --size 10 --moves 55 --time 2 --workers 4
+    python -m connectfour mcts --size 20 --rows 20 --connect 6 --time 2
+    python -m connectfour mcts --size 20 --rows 20 --connect 6 --time 2 --evaluate
+"""
+
+import math
+import time
+import random
+import argparse
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+from .bitboard import Position, CONNECT
+from .engine import parse_moves
+
+MCTSResult = namedtuple("MCTSResult", ["move", "visits", "value", "playouts", "seconds", "pps"])
+MCTSResult.__doc__ = """
+Answer of a search
+
+move --> Column picked (0-based), the most visited child of the root
+visits --> Playouts through the picked column
+value --> Share of those playouts won by the player to move (draws count half)
+playouts --> Playouts run, by every process
+seconds --> Time spent searching
+pps --> Playouts per second
+"""
+
+ONGOING, WON, DRAWN = range(3)
+
+
+class MCTS:
+    """
+    UCT search with the tree kept between moves
+
+    Attributes:
+    -----------
+    time_limit --> Seconds allowed per move (the search stops a little
+                   before to leave time to answer)
+    playouts --> Playouts per move, no limit when 0
+    exploration --> UCT exploration constant
+    workers --> Processes searching each move. Extra processes search
+                their own trees and their root statistics are added in
+    max_nodes --> The tree is started again when it grows past this
+    evaluator --> leafeval.LeafEvaluator scoring the leaves instead of
+                  random playouts, None to play them out
+    batch --> Leaves scored together by the evaluator
+    last --> MCTSResult of the last search
+
+    Additional Info:
+    ----------------
+    The tree is stored as parallel arrays indexed by node number
+    instead of one object per node:
+
+        parent, first (first child, -1 if not expanded), count (children),
+        column, state (ONGOING, WON by the player who moved, DRAWN),
+        visits, score (2 per win and 1 per draw of the player who moved,
+        twice the chance of winning for a leaf the evaluator scored)
+
+    The children of a node are created together and sit next to each
+    other. When the game moves on, the node of the new position becomes
+    the root and its subtree, with its statistics, is kept.
+    """
+
+    MARGIN = 0.005  # Seconds of the budget kept back for answering
+
+    def __init__(self, time_limit: float = 1.0, playouts: int = 0, exploration: float = 1.4, workers: int = 1,
+                 max_nodes: int = 1 << 20, seed=None, evaluator=None, batch: int = 64):
+        self.time_limit = time_limit
+        self.playouts = playouts
+        self.exploration = exploration
+        self.workers = workers
+        self.max_nodes = max_nodes
+        self.evaluator = evaluator
+        self.batch = batch
+        self.rng = random.Random(seed)
+        self.last = None
+        self._pool = None
+        self._reset(None, [], 1)
+        if workers > 1:
+            self._pool = ProcessPoolExecutor(workers - 1)
+            # Start the processes now rather than inside the first move's budget
+            wait([self._pool.submit(int) for _ in range(workers - 1)])
+
+    def _reset(self, shape, history: list, player: int):
+        self.parent = array('i', [-1])
+        self.first = array('i', [-1])
+        self.count = array('B', [0])
+        self.column = array('b', [-1])
+        self.state = array('B', [ONGOING])
+        self.visits = array('I', [0])
+        self.score = array('d', [0])
+        self.root = 0
+        self._shape = shape
+        self._history = history
+        self._player = player
+
+    def _follow(self, position: Position, history: list, player: int):
+        """
+        Make the node of a position the root, starting a new tree when
+        the position is not below the current root
+        """
+
+        known = len(self._history)
+        if position.shape != self._shape or history[:known] != self._history or len(self.parent) > self.max_nodes:
+            self._reset(position.shape, history, player)
+            return
+        node = self.root
+        mover = self._player
+        for col, who in history[known:]:
+            if who != mover or self.first[node] < 0:
+                self._reset(position.shape, history, player)
+                return
+            children = range(self.first[node], self.first[node] + self.count[node])
+            node = next(child for child in children if self.column[child] == col)
+            mover = 3 - mover
+        if mover != player:
+            self._reset(position.shape, history, player)
+            return
+        self.root = node
+        self._history = history
+        self._player = player
+
+    def move(self, game) -> int:
+        """
+        Pick the column to play in an engine.Game
+        """
+
+        return self.search(game.position, game.player, list(zip(game.position.moves, game.players))).move
+
+    def search(self, position: Position, player: int = 0, history=None) -> MCTSResult:
+        """
+        Find the best move for the player to move
+
+        :param position: Position to search (not changed)
+        :param player: Index of the player to move, by default the player
+                       whose turn it is when the players alternate
+        :param history: (column, player) of every move so far, used to
+                        find the position in the tree of the last search.
+                        Assumed to alternate when not given
+        :return: MCTSResult
+        """
+
+        start = time.perf_counter()
+        player = player or position.turn
+        if history is None:
+            history = [(col, 1 + (index & 1)) for index, col in enumerate(position.moves)]
+        deadline = start + self.time_limit - self.MARGIN if self.time_limit else 0.0
+        self._follow(position, history, player)
+
+        futures = []
+        if self._pool is not None:
+            # The workers stop on the wall clock, a margin before this process, so their answers are back in time
+            stop = time.time() + deadline - start - self.MARGIN if deadline else 0.0
+            task = (position.shape, position.boards[1], position.boards[2], list(position.heights), player,
+                    stop, self.playouts, self.exploration, self.evaluator, self.batch)
+            futures = [self._pool.submit(_search_task, task + (self.rng.getrandbits(32),))
+                       for _ in range(self.workers - 1)]
+        playouts = self._run(position, player, deadline, self.playouts)
+        if self.first[self.root] < 0:
+            # Not even one playout fitted in the budget: run one anyway so the root has children to pick from
+            playouts += self._run(position, player, 0.0, 1)
+
+        root = self.root
+        children = range(self.first[root], self.first[root] + self.count[root])
+        totals = {self.column[child]: [self.visits[child], self.score[child]] for child in children}
+        if futures:
+            wait(futures)
+            for future in futures:
+                stats, count = future.result()
+                playouts += count
+                for col, (visits, score) in stats.items():
+                    totals[col][0] += visits
+                    totals[col][1] += score
+        # A winning move is played whatever its statistics
+        wins = [self.column[child] for child in children if self.state[child] == WON]
+        move = wins[0] if wins else max(totals, key=lambda col: totals[col][0])
+        visits, score = totals[move]
+        seconds = time.perf_counter() - start
+        self.last = MCTSResult(move, visits, score / 2 / visits if visits else 0.0, playouts, seconds,
+                               playouts / seconds if seconds else 0.0)
+        return self.last
+
+    def _descend(self, position: Position, player: int) -> tuple:
+        """
+        Walk from the root to a leaf by UCT, expanding it when it is
+        reached for the first time
+
+        :return: (node, depth below the root, boards, column heights,
+                  coins on the board, player to move) at the leaf
+        """
+
+        size = position.size
+        parent, first, count, column = self.parent, self.first, self.count, self.column
+        state, visits, score = self.state, self.visits, self.score
+        exploration = self.exploration
+        boards = [0, position.boards[1], position.boards[2]]
+        heights = list(position.heights)
+        filled = position.count
+        to_move = player
+        node = self.root
+        depth = 0
+
+        # Selection: descend by UCT while the node is expanded
+        while first[node] >= 0 and state[node] == ONGOING:
+            log_visits = math.log(visits[node] + 1)
+            best, best_value = -1, -1.0
+            for child in range(first[node], first[node] + count[node]):
+                if state[child] == WON:
+                    best = child
+                    break
+                n = visits[child]
+                if not n:
+                    best = child
+                    break
+                value = score[child] / (2 * n) + exploration * math.sqrt(log_visits / n)
+                if value > best_value:
+                    best, best_value = child, value
+            node = best
+            col = column[node]
+            boards[to_move] |= 1 << heights[col]
+            heights[col] += 1
+            filled += 1
+            depth += 1
+            to_move = 3 - to_move
+
+        # Expansion: add every child, noting the ones which end the game
+        if state[node] == ONGOING:
+            tops = position.tops
+            runs = position.runs
+            first[node] = len(parent)
+            mover = to_move
+            added = 0
+            for col in range(size):
+                if heights[col] == tops[col]:
+                    continue
+                stones = boards[mover] | 1 << heights[col]
+                end = ONGOING
+                for steps in runs:
+                    run = stones
+                    for step in steps:
+                        run &= run >> step
+                    if run:
+                        end = WON
+                        break
+                else:
+                    if filled + 1 == position.cells:
+                        end = DRAWN
+                parent.append(node)
+                first.append(-1)
+                count.append(0)
+                column.append(col)
+                state.append(end)
+                visits.append(0)
+                score.append(0)
+                added += 1
+            count[node] = added
+            node = first[node] + self.rng.randrange(added)
+            col = column[node]
+            boards[to_move] |= 1 << heights[col]
+            heights[col] += 1
+            filled += 1
+            depth += 1
+            to_move = 3 - to_move
+        return node, depth, boards, heights, filled, to_move
+
+    def _run(self, position: Position, player: int, deadline: float, limit: int) -> int:
+        """
+        Run playouts from the root until the deadline or the limit
+
+        :return: Number of playouts run
+        """
+
+        if self.evaluator is not None:
+            return self._run_batched(position, player, deadline, limit)
+        size = position.size
+        cells = position.cells
+        tops = position.tops
+        runs = position.runs
+        parent, visits, score, state = self.parent, self.visits, self.score, self.state
+        randrange = self.rng.randrange
+        root = self.root
+        clock = time.perf_counter
+        playouts = 0
+        while not limit or playouts < limit:
+            # Checking the clock every playout keeps the budget strict; it costs well under a microsecond
+            if deadline and clock() >= deadline:
+                break
+            node, depth, boards, heights, filled, to_move = self._descend(position, player)
+
+            # Playout: random moves to the end of the game
+            if state[node] == WON:
+                winner = 3 - to_move
+            elif state[node] == DRAWN:
+                winner = 0
+            else:
+                winner = 0
+                open_ = [col for col in range(size) if heights[col] < tops[col]]
+                while filled < cells:
+                    index = randrange(len(open_))
+                    col = open_[index]
+                    stones = boards[to_move] | 1 << heights[col]
+                    boards[to_move] = stones
+                    heights[col] += 1
+                    if heights[col] == tops[col]:
+                        open_[index] = open_[-1]
+                        open_.pop()
+                    filled += 1
+                    for steps in runs:
+                        run = stones
+                        for step in steps:
+                            run &= run >> step
+                        if run:
+                            winner = to_move
+                            break
+                    if winner:
+                        break
+                    to_move = 3 - to_move
+
+            # Backpropagation: the player who moved into a node is the opposite of its parent's
+            mover = player if depth & 1 else 3 - player
+            while True:
+                visits[node] += 1
+                if winner == mover:
+                    score[node] += 2
+                elif not winner:
+                    score[node] += 1
+                if node == root:
+                    break
+                node = parent[node]
+                mover = 3 - mover
+            playouts += 1
+        return playouts
+
+    def _run_batched(self, position: Position, player: int, deadline: float, limit: int) -> int:
+        """
+        Run playouts scoring the leaves with the evaluator instead of
+        playing them out, a batch of leaves at a time
+
+        :return: Number of playouts run
+
+        Additional Info:
+        ----------------
+        A leaf waiting for its score already counts as visited all the
+        way up (a virtual loss), so the next descents of the batch go
+        elsewhere, and the score is credited when the batch comes back.
+        Leaves which end the game are credited at once.
+        """
+
+        evaluator = self.evaluator
+        state = self.state
+        clock = time.perf_counter
+        playouts = 0
+        while not limit or playouts < limit:
+            if deadline and clock() >= deadline:
+                break
+            leaves, movers, others = [], [], []
+            for _ in range(self.batch if not limit else min(self.batch, limit - playouts)):
+                node, depth, boards, heights, filled, to_move = self._descend(position, player)
+                if state[node] == WON:
+                    self._credit(node, 1.0, True)
+                elif state[node] == DRAWN:
+                    self._credit(node, 0.5, True)
+                else:
+                    self._credit(node, None, True)
+                    leaves.append(node)
+                    movers.append(boards[to_move])
+                    others.append(boards[3 - to_move])
+                playouts += 1
+            if leaves:
+                # The chance of the player to move at a leaf, credited to the player who moved into it
+                chances = evaluator.win_chance(evaluator.evaluate_boards(movers, others))
+                for node, chance in zip(leaves, chances.tolist()):
+                    self._credit(node, 1.0 - chance, False)
+        return playouts
+
+    def _credit(self, node: int, value: float, visit: bool):
+        """
+        Add a result to a node and every node above it up to the root
+
+        :param value: Share of a win for the player who moved into the
+                      node (1 win, 0.5 draw, 0 loss), the other player
+                      gets the rest at every level up. None only counts
+                      the visit
+        :param visit: Also count a visit, False when the visit was
+                      counted as the leaf was picked
+        """
+
+        parent, visits, score = self.parent, self.visits, self.score
+        root = self.root
+        while True:
+            if visit:
+                visits[node] += 1
+            if value is not None:
+                score[node] += 2 * value
+                value = 1.0 - value
+            if node == root:
+                break
+            node = parent[node]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def _search_task(task: tuple) -> tuple:
+    """
+    Search a position in a worker process with a fresh tree
+
+    :param task: ((columns, rows, connect), player 1 stones, player 2 stones,
+                  column heights, player to move, time.time() to stop
+                  at (0 for none), playout limit, exploration, leaf
+                  evaluator or None, batch, seed)
+    :return: ({column: (visits, score)} of the root's children, playouts)
+    """
+
+    shape, board1, board2, heights, player, stop, limit, exploration, evaluator, batch, seed = task
+    position = Position(*shape)
+    size = position.size
+    position.boards[1], position.boards[2] = board1, board2
+    position.heights[:] = heights
+    # Only the coin count of the move list is used by the search
+    position.moves.extend(col for col in range(size) for _ in range(heights[col] - col * position.stride))
+    seconds = max(0.0, stop - time.time()) if stop else 0.0
+    bot = MCTS(seconds, limit, exploration, seed=seed, evaluator=evaluator, batch=batch)
+    bot._reset(shape, [], player)
+    bot._run(position, player, time.perf_counter() + seconds if stop else 0.0, limit)
+    root = bot.root
+    stats = {bot.column[child]: (bot.visits[child], bot.score[child])
+             for child in range(bot.first[root], bot.first[root] + bot.count[root])}
+    return stats, bot.visits[root]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour mcts', description='Pick a move by tree search')
+    parser.add_argument('--size', type=int, default=7, help='board width [5...20]')
+    parser.add_argument('--rows', type=int, default=0, help='board height (default: the width)')
+    parser.add_argument('--connect', type=int, default=CONNECT, help='coins in a row to win')
+    parser.add_argument('--moves', default='', help='moves played so far as 1-based columns')
+    parser.add_argument('--time', type=float, default=1.0, help='seconds to search')
+    parser.add_argument('--playouts', type=int, default=0, help='playouts to run (0 for no limit)')
+    parser.add_argument('--workers', type=int, default=1, help='processes searching')
+    parser.add_argument('--exploration', type=float, default=1.4, help='UCT exploration constant')
+    parser.add_argument('--evaluate', nargs='?', const='', metavar='WEIGHTS',
+                        help='score leaves with the window evaluator (weights from an .npz file, else the heuristic) '
+                             'instead of random playouts (needs numpy)')
+    parser.add_argument('--batch', type=int, default=64, help='leaves the evaluator scores at once')
+    args = parser.parse_args(argv)
+
+    position = Position(args.size, args.rows, args.connect)
+    for col in parse_moves(args.moves):
+        position.play(col)
+    evaluator = None
+    if args.evaluate is not None:
+        from .leafeval import LeafEvaluator
+        evaluator = LeafEvaluator.load(args.evaluate) if args.evaluate else \
+            LeafEvaluator(args.size, args.rows, args.connect)
+    bot = MCTS(args.time, args.playouts, args.exploration, args.workers, evaluator=evaluator, batch=args.batch)
+    try:
+        result = bot.search(position)
+    finally:
+        bot.close()
+    print(f"best column {result.move + 1}  visits {result.visits}  value {result.value:.3f}")
+    print(f"{result.playouts} playouts in {result.seconds:.3f}s  ({result.pps:,.0f} playouts/sec)")
+    return result
+
+
+if __name__ == '__main__':
+    main()
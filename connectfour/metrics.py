@@ -0,0 +1,244 @@
+"""
+Runtime metrics for the game loops
+
+Metrics are off unless enable() is called or the CONNECTFOUR_METRICS
+environment variable names an output file. While they are off nothing
+is measured: the hook sites are the original functions, and observe()
+returns at once.
+
+Front-ends mark the functions to time with hook(owner, name, metric).
+enable() swaps each for a wrapper recording its duration in a
+histogram, disable() puts the originals back. Values which are not
+durations (e.g. the bytes a replay keeps) are recorded with observe().
+
+The histograms are written when the program exits, or by export(), as
+JSON lines (one line per series) or, for a file ending in .prom, in the
+Prometheus text format ready for the node exporter's textfile collector.
+
+    CONNECTFOUR_METRICS=metrics.prom python3 main.py
+    python3 main.py --metrics metrics.jsonl
+"""
+
+import os
+import json
+import time
+import atexit
+import bisect
+import functools
+
+# Upper bounds of the buckets, the last bucket (+Inf) is implied
+SECONDS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536, 262144, 1048576)
+PREFIX = 'connectfour_'
+
+HELP = {
+    'move_seconds': 'Time from a move being entered to the board being redrawn',
+    'input_wait_seconds': 'Time spent waiting for a player to enter a move',
+    'agent_seconds': 'Time a computer player took to choose its move',
+    'win_check_seconds': 'Time spent checking for a win',
+    'render_seconds': 'Time spent drawing the board',
+    'playback_seconds': 'Time spent replaying a finished game',
+    'game_seconds': 'Length of a whole game',
+    'frame_seconds': 'Time between two frames of the GUI',
+    'replay_bytes': 'Memory kept for replaying a game',
+}
+
+registry = None  # Registry while metrics are on, None while they are off
+_hooks = []      # (owner, attribute, metric, labels, original function)
+_exporting = False
+
+
+class Histogram:
+    """
+    Counts of the observed values per bucket, with their sum
+
+    Attributes:
+    -----------
+    bounds --> Upper bound of each bucket but the last (+Inf)
+    counts --> Values observed per bucket (not cumulative)
+    """
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th quantile
+        """
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0.0
+
+
+class Registry:
+    """
+    Every histogram, by metric name and labels
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.series = {}
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        histogram = self.series.get((name, labels))
+        if histogram is None:
+            histogram = self.series[(name, labels)] = Histogram(BYTES if name.endswith('_bytes') else SECONDS)
+        histogram.observe(value)
+
+    def jsonl(self) -> str:
+        stamp = time.time()
+        lines = []
+        for (name, labels), histogram in sorted(self.series.items()):
+            lines.append(json.dumps({
+                'time': stamp,
+                'metric': PREFIX + name,
+                'labels': dict(labels),
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'p50': histogram.quantile(0.5),
+                'p99': histogram.quantile(0.99),
+                'buckets': dict(zip([str(bound) for bound in histogram.bounds] + ['+Inf'], histogram.counts)),
+            }))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def prometheus(self) -> str:
+        lines = []
+        done = set()
+        for (name, labels), histogram in sorted(self.series.items()):
+            metric = PREFIX + name
+            if name not in done:
+                done.add(name)
+                lines.append(f'# HELP {metric} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {metric} histogram')
+            label_text = ''.join(f'{key}="{value}",' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label_text}le="{bound}"}} {cumulative}')
+            braces = '{' + label_text.rstrip(',') + '}' if labels else ''
+            lines.append(f'{metric}_sum{braces} {histogram.sum!r}')
+            lines.append(f'{metric}_count{braces} {histogram.count}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def export(self, path: str = None):
+        """
+        Write the histograms, in the Prometheus text format when the file
+        ends in .prom (replacing it) else as JSON lines (appended)
+        """
+
+        path = path or self.path
+        if not path:
+            return
+        if path.endswith('.prom'):
+            # Written aside and renamed so a collector never reads half a file
+            with open(path + '.tmp', 'w') as file:
+                file.write(self.prometheus())
+            os.replace(path + '.tmp', path)
+        else:
+            with open(path, 'a') as file:
+                file.write(self.jsonl())
+
+
+def observe(name: str, value: float, **labels):
+    """
+    Record a value, nothing happens while metrics are off
+    """
+
+    if registry is not None:
+        registry.observe(name, value, tuple(sorted(labels.items())))
+
+
+def _timed(function, name: str, labels: tuple):
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if registry is not None:
+                registry.observe(name, time.perf_counter() - start, labels)
+    return timed
+
+
+def hook(owner, attribute: str, name: str, **labels):
+    """
+    Time every call of a function into a histogram while metrics are on
+
+    :param owner: Module or class holding the function
+    :param attribute: Name of the function in owner
+    :param name: Metric the durations are recorded in
+    :param labels: Labels of the series, e.g. site="Board.show"
+    """
+
+    # A class attribute is read from __dict__ so that static and class methods are not unwrapped
+    function = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+    entry = (owner, attribute, name, tuple(sorted(labels.items())), function)
+    _hooks.append(entry)
+    if registry is not None:
+        _install(entry)
+
+
+def _install(entry: tuple):
+    owner, attribute, name, labels, function = entry
+    if isinstance(function, (staticmethod, classmethod)):
+        wrapped = type(function)(_timed(function.__func__, name, labels))
+    else:
+        wrapped = _timed(function, name, labels)
+    setattr(owner, attribute, wrapped)
+
+
+def enable(path: str = None) -> Registry:
+    """
+    Turn metrics on
+
+    :param path: File the metrics are written to at exit (see Registry.export)
+    :return: The registry
+    """
+
+    global registry, _exporting
+    if registry is None:
+        registry = Registry(path)
+        for entry in _hooks:
+            _install(entry)
+        if not _exporting:
+            atexit.register(export)
+            _exporting = True
+    elif path:
+        registry.path = path
+    return registry
+
+
+def disable():
+    """
+    Turn metrics off, putting back the original functions
+    """
+
+    global registry
+    for owner, attribute, _, _, function in _hooks:
+        setattr(owner, attribute, function)
+    registry = None
+
+
+def export(path: str = None):
+    if registry is not None:
+        registry.export(path)
+
+
+if os.environ.get('CONNECTFOUR_METRICS'):
+    enable(os.environ['CONNECTFOUR_METRICS'])
@@ -0,0 +1,363 @@
+"""
+Text notation for game records
+
+A game is written as tag lines followed by the columns played (1-based)
+and the result, with a blank line after it:
+
+    [Size "7"]
+    [Player1 "Alice"]
+    [Color1 "red"]
+    [Player2 "Bob"]
+    [Color2 "yellow"]
+    [Result "1-0"]
+    4 4 3 3 5 5 2 1-0
+
+The result is 1-0 or 0-1 for a win of player 1 or 2, 1/2-1/2 for a tie
+and * for a game which is not over. A board which is not square, or
+not played to four in a row, also has [Rows "6"] and [Connect "5"]
+tags after the size (the width of the board). A turn given away (Solution 1 skips
+the turn of a player after repeated invalid input) is written as --.
+
+read_records() and RecordWriter work one game at a time, so files of
+any size are read, converted and checked in constant memory:
+
+    python -m connectfour records convert games.c4r games.c4n
+    python -m connectfour records convert games.c4n big7.c4n --size 7 --min-moves 30
+    python -m connectfour records validate games.c4n
+"""
+
+import re
+import sys
+import argparse
+from .bitboard import MIN_SIZE, MAX_SIDE, MIN_CONNECT, MAX_CONNECT, CONNECT
+from .engine import Game, ON
+from .replay import GameRecord, PASS, ArchiveReader, ArchiveWriter
+
+RESULTS = {'1-0': 1, '0-1': 2, '1/2-1/2': 0, '*': 0}
+PASS_TOKEN = '--'
+LINE_WIDTH = 80
+CHUNK = 1 << 16
+
+TAG = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+
+
+class NotationError(ValueError):
+    """
+    A record which cannot be read, with the line it was found on
+    """
+
+    def __init__(self, message: str, line: int = 0):
+        super().__init__(f"line {line}: {message}" if line else message)
+        self.line = line
+
+
+def quote(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def result_of(record: GameRecord) -> str:
+    """
+    Result token of a record: a win, a tie (full board) or * (not over)
+    """
+
+    if record.winner:
+        return '1-0' if record.winner == 1 else '0-1'
+    played = sum(col != PASS for col in record.moves)
+    return '1/2-1/2' if played == record.size * (record.rows or record.size) else '*'
+
+
+def format_record(record: GameRecord) -> str:
+    """
+    A record in the text notation, blank line included
+    """
+
+    (name1, color1), (name2, color2) = (pair[:2] for pair in record.players)
+    result = result_of(record)
+    lines = [f'[Size "{record.size}"]']
+    if record.rows not in (0, record.size) or record.connect != CONNECT:
+        lines += [f'[Rows "{record.rows or record.size}"]', f'[Connect "{record.connect}"]']
+    lines += [f'[Player1 "{quote(name1)}"]', f'[Color1 "{quote(color1)}"]',
+              f'[Player2 "{quote(name2)}"]', f'[Color2 "{quote(color2)}"]', f'[Result "{result}"]']
+    tokens = [PASS_TOKEN if col == PASS else str(col + 1) for col in record.moves] + [result]
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_WIDTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+def read_records(lines, on_error=None):
+    """
+    Read games one at a time
+
+    :param lines: Iterable of text lines, e.g. an open file
+    :param on_error: Called with the NotationError of a game which
+                     cannot be read, which is then skipped. Without it
+                     the error is raised
+    :return: Generator of GameRecord
+    """
+
+    tags = {}
+    moves = bytearray()
+    skipping = False
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            skipping = False
+            continue
+        if skipping:
+            continue
+        try:
+            if line.startswith('['):
+                match = TAG.match(line)
+                if match is None:
+                    raise NotationError(f"bad tag {line!r}", number)
+                tags[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+                continue
+            for token in line.split():
+                if token in RESULTS:
+                    yield _record(tags, moves, token, number)
+                    tags = {}
+                    moves = bytearray()
+                elif token == PASS_TOKEN:
+                    moves.append(PASS)
+                elif token.isdigit() and 1 <= int(token) <= MAX_SIDE:
+                    moves.append(int(token) - 1)
+                else:
+                    raise NotationError(f"bad move {token!r}", number)
+        except NotationError as error:
+            if on_error is None:
+                raise
+            on_error(error)
+            tags = {}
+            moves = bytearray()
+            skipping = True
+    if tags or moves:
+        error = NotationError("the last game has no result")
+        if on_error is None:
+            raise error
+        on_error(error)
+
+
+def _record(tags: dict, moves: bytearray, result: str, line: int) -> GameRecord:
+    try:
+        size = int(tags.get('Size', ''))
+        rows = int(tags.get('Rows', size))
+        connect = int(tags.get('Connect', CONNECT))
+    except ValueError:
+        raise NotationError("missing or bad Size, Rows or Connect tag", line) from None
+    if not (MIN_SIZE <= size <= MAX_SIDE and MIN_SIZE <= rows <= MAX_SIDE):
+        raise NotationError(f"board size {rows}x{size} is out of range", line)
+    if not MIN_CONNECT <= connect <= min(MAX_CONNECT, max(size, rows)):
+        raise NotationError(f"connect {connect} does not fit a {rows}x{size} board", line)
+    if 'Result' in tags and tags['Result'] != result:
+        raise NotationError(f"Result tag {tags['Result']} does not match {result}", line)
+    players = ((tags.get('Player1', 'Player1'), tags.get('Color1', 'red')),
+               (tags.get('Player2', 'Player2'), tags.get('Color2', 'yellow')))
+    return GameRecord(size, players, bytes(moves), RESULTS[result], 0 if rows == size else rows, connect)
+
+
+class RecordWriter:
+    """
+    Write games in the text notation, buffered in chunks
+
+    The text of the games is collected until it reaches chunk characters
+    and then written with one call, so writing many small games costs
+    few writes.
+    """
+
+    def __init__(self, file, chunk: int = CHUNK):
+        self.file = file
+        self.chunk = chunk
+        self._parts = []
+        self._length = 0
+        self.count = 0
+
+    def write(self, record: GameRecord):
+        text = format_record(record)
+        self._parts.append(text)
+        self._length += len(text)
+        self.count += 1
+        if self._length >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.file.write(''.join(self._parts))
+            self._parts = []
+            self._length = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_records(records, file, chunk: int = CHUNK) -> int:
+    """
+    Write every record of an iterable
+
+    :return: Number of records written
+    """
+
+    with RecordWriter(file, chunk) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.count
+
+
+def append_record(path: str, record: GameRecord):
+    """
+    Add one game to the end of a text record file
+    """
+
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(format_record(record))
+
+
+def load_record(path: str, game: int = -1) -> GameRecord:
+    """
+    Read one game of a record file, the last one by default
+
+    :param path: Text record file, or a binary replay archive (.c4r)
+    :param game: Index of the game in the file
+    """
+
+    if path.endswith('.c4r'):
+        with ArchiveReader(path) as archive:
+            return archive[game]
+    found = None
+    with open(path, encoding='utf-8') as file:
+        for index, record in enumerate(read_records(file)):
+            if index == game:
+                return record
+            found = record
+    if found is None or game >= 0:
+        raise IndexError(f"There is no game {game} in {path}")
+    return found
+
+
+def record_from_game(game: Game, players: tuple) -> GameRecord:
+    """
+    Record of an engine.Game, with a PASS for every turn given away
+
+    :param game: Game to record
+    :param players: ((name, color), (name, color)) of player 1 and 2
+    """
+
+    moves = bytearray()
+    turn = 1
+    for col, player in zip(game.position.moves, game.players):
+        if player != turn:
+            moves.append(PASS)
+        moves.append(col)
+        turn = 3 - player
+    if game.outcome == ON and game.player != turn:
+        moves.append(PASS)
+    return GameRecord(game.size, players, bytes(moves), game.winner, 0 if game.rows == game.size else game.rows,
+                      game.connect)
+
+
+def game_from_record(record: GameRecord) -> Game:
+    """
+    Play a record on a new engine.Game, the turns given away included
+
+    Raises ValueError for an illegal move or a move after the end
+    """
+
+    game = Game(record.size, 1, record.rows, record.connect)
+    for col in record.moves:
+        if col == PASS:
+            game.skip()
+        else:
+            game.play(col)
+    return game
+
+
+def check(record: GameRecord):
+    """
+    Replay a record and check it against the rules
+
+    :return: None when the record is valid, else what is wrong with it
+    """
+
+    try:
+        game = game_from_record(record)
+    except ValueError as error:
+        return str(error)
+    if game.winner != record.winner:
+        return f"the result says {record.winner or 'no winner'} but the moves give {game.winner or 'no winner'}"
+    return None
+
+
+def _open_records(path: str, on_error=None):
+    """
+    Games of a text file or a binary archive, one at a time
+    """
+
+    if path.endswith('.c4r'):
+        with ArchiveReader(path) as archive:
+            yield from archive
+    else:
+        with open(path, encoding='utf-8') as file:
+            yield from read_records(file, on_error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour records', description='Convert or check game records')
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help='copy games, optionally filtered, between files (.c4r is binary)')
+    convert.add_argument('source')
+    convert.add_argument('target', help="output file, '-' for standard output")
+    convert.add_argument('--size', type=int, help='only games on boards this wide')
+    convert.add_argument('--winner', type=int, choices=(0, 1, 2), help='only games won by this player (0: none)')
+    convert.add_argument('--min-moves', type=int, default=0)
+    convert.add_argument('--max-moves', type=int, default=0)
+    validate = commands.add_parser('validate', help='replay every game and report the invalid ones')
+    validate.add_argument('source')
+    args = parser.parse_args(argv)
+
+    problems = []
+    if args.command == 'validate':
+        games = 0
+        for games, record in enumerate(_open_records(args.source, problems.append), 1):
+            problem = check(record)
+            if problem:
+                problems.append(f"game {games}: {problem}")
+        for problem in problems[:20]:
+            print(problem)
+        print(f"{games} games read, {len(problems)} invalid")
+        return len(problems)
+
+    selected = (record for record in _open_records(args.source, problems.append)
+                if (args.size is None or record.size == args.size)
+                and (args.winner is None or record.winner == args.winner)
+                and len(record.moves) >= args.min_moves
+                and (not args.max_moves or len(record.moves) <= args.max_moves))
+    if args.target.endswith('.c4r'):
+        with ArchiveWriter(args.target) as archive:
+            count = 0
+            for count, record in enumerate(selected, 1):
+                archive.append(record)
+    elif args.target == '-':
+        count = write_records(selected, sys.stdout)
+    else:
+        with open(args.target, 'w', encoding='utf-8') as file:
+            count = write_records(selected, file)
+    for problem in problems[:20]:
+        print(problem, file=sys.stderr)
+    print(f"{count} games written", file=sys.stderr)
+    return count
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Game tree enumeration (perft)
+
+Counts every sequence of moves from a position to a given depth, and how
+many of them end the game at each ply: a win for player 1, a win for
+player 2 or a draw. Games stop at the move which ends them, so a
+finished game is never extended.
+
+Two ways of counting are given and must agree:
+
+    walk --> Depth-first over Position.play/undo/has_won, one visit per
+             move sequence. Its nodes/sec measures the primitives the
+             games are built on.
+    merge --> Ply by ply, keeping every distinct position once with the
+              number of move sequences reaching it. Its own bit
+              arithmetic on the position keys makes it an independent
+              check of the engine, and the merging of transpositions
+              makes full-depth counts on small boards possible.
+
+The root moves (or the positions a few plies below the root) are
+counted in worker processes and the results added up.
+
+With merge the whole 5x5 tree (3.1e14 move sequences, about 5e7
+distinct positions) is counted in a few minutes. A full 6x6 count has
+far more distinct positions than fit in memory as a dict, so on 6x6 and
+larger count to a depth, or from a position some moves in.
+
+    python -m connectfour perft --size 5 --depth 8
+    python -m connectfour perft --size 5 --depth 25 --merge
+"""
+
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from .bitboard import Position, CONNECT
+from .engine import parse_moves
+
+NODES, WIN1, WIN2, DRAW = range(4)
+
+PerftResult = namedtuple("PerftResult", ["plies", "visited", "seconds"])
+PerftResult.__doc__ = """
+Result of a perft run
+
+plies --> [nodes, player 1 wins, player 2 wins, draws] for every ply
+          below the start, plies[0] being the first move
+visited --> Positions the counting actually expanded (move sequences
+            for walk, distinct positions for merge)
+seconds --> Wall time
+"""
+
+
+def walk(position: Position, depth: int, counts: list, ply: int = 0) -> int:
+    """
+    Count the move sequences below a position depth-first
+
+    :param position: Position with the players alternating, restored on return
+    :param depth: Moves left to play
+    :param counts: Per-ply counters added to, one [nodes, win1, win2, draw] per ply
+    :param ply: Index of the next move in counts
+    :return: Number of positions visited
+    """
+
+    player = position.turn
+    row = counts[ply]
+    visited = 0
+    for col in range(position.size):
+        if not position.can_play(col):
+            continue
+        position.play(col)
+        visited += 1
+        row[NODES] += 1
+        if position.has_won(player):
+            row[player] += 1
+        elif position.is_full():
+            row[DRAW] += 1
+        elif depth > 1:
+            visited += walk(position, depth - 1, counts, ply + 1)
+        position.undo()
+    return visited
+
+
+def merge(position: Position, depth: int, counts: list) -> int:
+    """
+    Count the move sequences below a position ply by ply, merging
+    transpositions
+
+    :param position: Position with the players alternating
+    :param depth: Moves left to play
+    :param counts: Per-ply counters added to, as with walk
+    :return: Number of distinct positions expanded
+
+    Additional Info:
+    ----------------
+    A level maps (stones of the player to move, all stones) to the number
+    of move sequences reaching it. The next free cell of a column is the
+    lowest unset bit above the column's bottom, so (all + bottom of the
+    column) masked to the column gives the coin a move would add.
+    """
+
+    size, stride, shifts, runs = position.size, position.stride, position.shifts, position.runs
+    four = position.connect == CONNECT
+    columns = [((1 << position.rows) - 1) << (col * stride) for col in range(size)]
+    bottoms = [1 << (col * stride) for col in range(size)]
+    full = sum(columns)
+    player = position.turn
+    level = {(position.boards[player], position.boards[1] | position.boards[2]): 1}
+    visited = 0
+    for ply in range(depth):
+        row = counts[ply]
+        following = {}
+        for (current, mask), paths in level.items():
+            visited += 1
+            for col in range(size):
+                move = (mask + bottoms[col]) & columns[col]
+                if not move:
+                    continue
+                stones = current | move
+                filled = mask | move
+                row[NODES] += paths
+                if four:
+                    for shift in shifts:
+                        pairs = stones & (stones >> shift)
+                        if pairs & (pairs >> 2 * shift):
+                            won = True
+                            break
+                    else:
+                        won = False
+                else:
+                    won = False
+                    for steps in runs:
+                        run = stones
+                        for step in steps:
+                            run &= run >> step
+                        if run:
+                            won = True
+                            break
+                if won:
+                    row[player] += paths
+                else:
+                    if filled == full:
+                        row[DRAW] += paths
+                    else:
+                        key = (stones ^ filled, filled)
+                        following[key] = following.get(key, 0) + paths
+        level = following
+        player = 3 - player
+        if not level:
+            break
+    return visited
+
+
+def count_subtree(task: tuple) -> tuple:
+    """
+    Count below one position in a worker process
+
+    :param task: ((columns, rows, connect), moves to the position, depth
+                  left, offset of the position's ply from the start, use merge)
+    :return: (offset, per-ply counts, positions visited)
+    """
+
+    shape, moves, depth, offset, merged = task
+    position = Position(*shape)
+    for col in moves:
+        position.play(col)
+    counts = [[0, 0, 0, 0] for _ in range(depth)]
+    visited = (merge if merged else walk)(position, depth, counts)
+    return offset, counts, visited
+
+
+def split(position: Position, depth: int, plies: int, counts: list) -> list:
+    """
+    Positions plies below the root, as the move lists reaching them
+
+    The moves above the split are counted into counts as they are made.
+    A game ending above the split is counted there and not split further.
+    """
+
+    frontier = [[]]
+    start = list(position.moves)
+    for ply in range(min(plies, depth - 1)):
+        row = counts[ply]
+        following = []
+        for moves in frontier:
+            node = Position(*position.shape)
+            for col in start + moves:
+                node.play(col)
+            player = node.turn
+            for col in node.legal_moves():
+                node.play(col)
+                row[NODES] += 1
+                if node.has_won(player):
+                    row[player] += 1
+                elif node.is_full():
+                    row[DRAW] += 1
+                else:
+                    following.append(moves + [col])
+                node.undo()
+        frontier = following
+    return [start + moves for moves in frontier]
+
+
+def perft(position: Position, depth: int, merged: bool = False, workers: int = 1, split_plies: int = 1) -> PerftResult:
+    """
+    Count the move sequences below a position
+
+    :param position: Position with the players alternating
+    :param depth: Plies to count
+    :param merged: Count with merge instead of walk
+    :param workers: Worker processes (1 counts in this process)
+    :param split_plies: Plies below the root where the work is split
+    :return: PerftResult
+    """
+
+    start = time.perf_counter()
+    counts = [[0, 0, 0, 0] for _ in range(depth)]
+    if position.has_won(1) or position.has_won(2) or position.is_full() or depth < 1:
+        return PerftResult(counts, 0, 0.0)
+    if workers <= 1:
+        visited = (merge if merged else walk)(position, depth, counts)
+        return PerftResult(counts, visited, time.perf_counter() - start)
+
+    offset = min(split_plies, depth - 1)
+    roots = split(position, depth, split_plies, counts)
+    tasks = [(position.shape, moves, depth - offset, offset, merged) for moves in roots]
+    visited = sum(row[NODES] for row in counts[:offset])
+    with ProcessPoolExecutor(workers) as pool:
+        for offset, part, done in pool.map(count_subtree, tasks):
+            visited += done
+            for ply, row in enumerate(part):
+                for index, value in enumerate(row):
+                    counts[offset + ply][index] += value
+    return PerftResult(counts, visited, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour perft', description='Count the game tree to a depth')
+    parser.add_argument('--size', type=int, default=5, help='board width [5...20]')
+    parser.add_argument('--rows', type=int, default=0, help='board height (default: the width)')
+    parser.add_argument('--connect', type=int, default=CONNECT, help='coins in a row to win')
+    parser.add_argument('--moves', default='', help='moves played before counting as 1-based columns')
+    parser.add_argument('--depth', type=int, default=6, help='plies to count (0 for to the end of every game)')
+    parser.add_argument('--merge', action='store_true', help='merge transpositions (needed for deep counts)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    parser.add_argument('--split', type=int, default=1, help='plies below the root where the work is split')
+    args = parser.parse_args(argv)
+
+    position = Position(args.size, args.rows, args.connect)
+    for col in parse_moves(args.moves):
+        position.play(col)
+    depth = args.depth or position.cells - position.count
+    result = perft(position, depth, args.merge, args.workers, args.split)
+    print(f"{'ply':>4}{'nodes':>26}{'player 1 wins':>24}{'player 2 wins':>24}{'draws':>24}")
+    for ply, (nodes, wins1, wins2, draws) in enumerate(result.plies, position.count + 1):
+        if nodes:
+            print(f"{ply:>4}{nodes:>26,}{wins1:>24,}{wins2:>24,}{draws:>24,}")
+    total = [sum(column) for column in zip(*result.plies)]
+    print(f"{'all':>4}{total[NODES]:>26,}{total[WIN1]:>24,}{total[WIN2]:>24,}{total[DRAW]:>24,}")
+    seconds = max(result.seconds, 1e-9)
+    print(f"{result.visited:,} positions expanded in {seconds:.2f}s  ({result.visited / seconds:,.0f} nodes/sec)")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Terminal renderer for the command line games
+
+TerminalRenderer remembers what is on the screen. The first frame draws
+the whole board; after that only the cells which changed since the
+previous frame are rewritten, by moving the cursor to them with ANSI
+escape codes. The coloured coin strings are built once, and every frame
+goes out in a single write, so drawing a move costs a few dozen bytes
+and no subprocess.
+"""
+
+import sys
+import termcolor
+from . import metrics
+
+GLYPH = '⬤'
+CLEAR = '\033[H\033[2J\033[3J'  # Cursor home, clear screen and scroll-back (what `clear` does)
+CLEAR_BELOW = '\033[J'
+
+
+class TerminalRenderer:
+    """
+    Draw positions (bitboard.Position) on an ANSI terminal
+
+    Attributes:
+    -----------
+    glyphs --> Coloured coin string for 0 (empty), 1 and 2
+    top --> Empty lines above the board
+    indent --> Spaces left of the board
+    stream --> File the frames are written to
+
+    Additional Info:
+    ----------------
+    The previous frame is kept as the two bitboards it showed, so the
+    cells to redraw are the set bits of (new xor old), found without
+    looking at the unchanged cells. Anything printed below the board
+    (prompts, messages) is cleared by the next frame.
+    """
+
+    def __init__(self, colors: dict, top: int = 0, indent: int = 0, spacing: str = '  ', stream=None):
+        """
+        :param colors: termcolor color for 0 (empty), 1 and 2
+        :param top: Empty lines above the board
+        :param indent: Spaces left of the board
+        :param spacing: Text between two cells
+        :param stream: File to write to, sys.stdout by default
+        """
+
+        self.glyphs = {index: termcolor.colored(GLYPH, color) for index, color in colors.items()}
+        self.top = top
+        self.indent = indent
+        self.spacing = spacing
+        self.stream = stream
+        self.last = None
+
+    def text(self, position) -> str:
+        """
+        The whole board as text, with the column numbers below it
+        """
+
+        width = len(self.spacing) + 1
+        lines = [' ' * self.indent + self.spacing.join(self.glyphs[cell] for cell in position[row]) + self.spacing
+                 for row in range(position.rows)]
+        # Numbers of two digits take the space of a coin and one character of the spacing
+        lines.append(' ' * self.indent + ''.join(str(col + 1).ljust(width) for col in range(position.size)))
+        return '\n'.join(lines) + '\n'
+
+    def draw(self, position):
+        """
+        Bring the screen up to date with a position
+        """
+
+        shape = (position.size, position.rows)
+        rows = position.rows
+        boards = (position.boards[1], position.boards[2])
+        if self.last is None or self.last[0] != shape:
+            frame = CLEAR + '\n' * self.top + self.text(position)
+        else:
+            parts = []
+            stride = position.stride
+            width = len(self.spacing) + 1
+            changed = (boards[0] ^ self.last[1]) | (boards[1] ^ self.last[2])
+            while changed:
+                low = changed & -changed
+                changed ^= low
+                bit = low.bit_length() - 1
+                col, height = divmod(bit, stride)
+                cell = 1 if boards[0] & low else 2 if boards[1] & low else 0
+                # ANSI cursor positions start at 1
+                parts.append(f'\033[{self.top + rows - height};{self.indent + col * width + 1}H{self.glyphs[cell]}')
+            parts.append(f'\033[{self.top + rows + 2};1H{CLEAR_BELOW}')
+            frame = ''.join(parts)
+        self.last = (shape,) + boards
+        stream = self.stream or sys.stdout
+        stream.write(frame)
+        stream.flush()
+
+    def reset(self):
+        """
+        Draw the whole board on the next frame, e.g. after the screen
+        was written over by something else
+        """
+
+        self.last = None
+
+
+metrics.hook(TerminalRenderer, 'draw', 'render_seconds', site='TerminalRenderer.draw')
@@ -0,0 +1,183 @@
+"""
+Game records and the binary replay archive
+
+A finished game is kept as a GameRecord: the board shape, the players
+and the columns played, one byte per move. Positions are rebuilt by
+replaying the columns, so the record of a game is a few dozen bytes
+instead of a copy of the board per move.
+
+An archive is two files written append-only:
+
+    <path>      header, then the records one after the other
+    <path>.idx  header, then the offset of every record as an unsigned 64 bit int
+
+ArchiveReader memory-maps both, so reading game k is one lookup in the
+index and one record parse, whatever the size of the archive.
+"""
+
+import os
+import mmap
+import struct
+from collections import namedtuple
+from .bitboard import Position, CONNECT
+
+DATA_MAGIC = b'C4REPLY2'  # A new number for every change of the record layout
+INDEX_MAGIC = b'C4INDEX1'
+# size, rows, connect, winner, number of moves, lengths of name 1, color 1, name 2, color 2
+RECORD = struct.Struct('<BBBBH4B')
+OFFSET = struct.Struct('<Q')
+PASS = 0xff  # Move byte of a turn given away without playing (Game.skip)
+
+GameRecord = namedtuple("GameRecord", ["size", "players", "moves", "winner", "rows", "connect"],
+                        defaults=[0, 0, CONNECT])
+GameRecord.__doc__ = """
+Move log of one game
+
+size --> Width of the board
+players --> ((name, color), (name, color)) of player 1 and 2
+moves --> Columns played (0-based), player 1 first and the players
+          alternating, PASS for a turn given away >> type = bytes
+winner --> Index of the winner, 0 for a tie or an unfinished game
+rows --> Height of the board, 0 when it is the same as the width
+connect --> Coins in a row needed to win
+"""
+
+
+def position_at(record: GameRecord, move: int = -1) -> Position:
+    """
+    Rebuild the position after a number of moves
+
+    :param record: Game to replay
+    :param move: Number of moves to replay, all of them by default
+    :return: New position
+    """
+
+    position = Position(record.size, record.rows, record.connect)
+    player = 1
+    for col in record.moves[:len(record.moves) if move < 0 else move]:
+        if col != PASS:
+            position.play(col, player)
+        player = 3 - player
+    return position
+
+
+def encode(record: GameRecord) -> bytes:
+    """
+    Binary form of a record as stored in an archive
+    """
+
+    # Names and colours are cut to 255 bytes, on a character boundary so that they still decode
+    texts = [text.encode('utf-8')[:255].decode('utf-8', 'ignore').encode('utf-8')
+             for pair in record.players for text in pair[:2]]
+    header = RECORD.pack(record.size, record.rows or record.size, record.connect, record.winner,
+                         len(record.moves), *map(len, texts))
+    return header + b''.join(texts) + bytes(record.moves)
+
+
+def decode(buffer, offset: int = 0) -> GameRecord:
+    """
+    Read a record from a buffer (bytes or a memory map)
+    """
+
+    size, rows, connect, winner, count, *lengths = RECORD.unpack_from(buffer, offset)
+    offset += RECORD.size
+    texts = []
+    for length in lengths:
+        texts.append(bytes(buffer[offset:offset + length]).decode('utf-8'))
+        offset += length
+    moves = bytes(buffer[offset:offset + count])
+    return GameRecord(size, ((texts[0], texts[1]), (texts[2], texts[3])), moves, winner,
+                      0 if rows == size else rows, connect)
+
+
+def _format_error(path: str, magic: bytes) -> str:
+    if magic[:7] == DATA_MAGIC[:7]:
+        return f"{path} is a replay archive of another format ({magic.decode('ascii', 'replace')})"
+    return f"{path} is not a replay archive"
+
+
+class ArchiveWriter:
+    """
+    Append records to an archive, creating it if needed
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = open(path, 'ab')
+        self.index = open(path + '.idx', 'ab')
+        if self.data.tell() == 0:
+            self.data.write(DATA_MAGIC)
+        else:
+            with open(path, 'rb') as file:
+                magic = file.read(len(DATA_MAGIC))
+            if magic != DATA_MAGIC:
+                self.close()
+                raise ValueError(_format_error(path, magic))
+        if self.index.tell() == 0:
+            self.index.write(INDEX_MAGIC)
+
+    def append(self, record: GameRecord) -> int:
+        """
+        :return: Offset of the record in the data file
+        """
+
+        offset = self.data.tell()
+        self.data.write(encode(record))
+        self.index.write(OFFSET.pack(offset))
+        return offset
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ArchiveReader:
+    """
+    Random access to the records of an archive
+
+    reader[k] is the k-th game, len(reader) the number of games, and
+    iterating a reader yields every game in order.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._files = [open(path, 'rb'), open(path + '.idx', 'rb')]
+        self.data, self.index = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                                 if os.fstat(f.fileno()).st_size else b'' for f in self._files)
+        magic = bytes(self.data[:len(DATA_MAGIC)])
+        if magic != DATA_MAGIC or self.index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise ValueError(_format_error(path, magic))
+
+    def __len__(self):
+        return (len(self.index) - len(INDEX_MAGIC)) // OFFSET.size
+
+    def __getitem__(self, game: int) -> GameRecord:
+        if game < 0:
+            game += len(self)
+        if not 0 <= game < len(self):
+            raise IndexError(f"There is no game {game} in {self.path}")
+        return decode(self.data, OFFSET.unpack_from(self.index, len(INDEX_MAGIC) + game * OFFSET.size)[0])
+
+    def __iter__(self):
+        for game in range(len(self)):
+            yield self[game]
+
+    def close(self):
+        for buffer in (self.data, self.index):
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+        for file in self._files:
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,244 @@
+"""
+Multiplayer game server
+
+One process hosts any number of matches over asyncio streams. Clients
+send one JSON object per line and get one JSON object per line back:
+
+    {"op": "create", "size": 7, "name": "Alice"}   --> {"ok": true, "match": "1", "player": 1, "state": {...}}
+    {"op": "join", "match": "1", "name": "Bob"}     --> {"ok": true, "match": "1", "player": 2, "state": {...}}
+    {"op": "move", "match": "1", "col": 3}          --> {"ok": true, "result": {...}, "state": {...}}
+    {"op": "state", "match": "1"}                   --> {"ok": true, "state": {...}}
+
+Columns are 0-based. A create request may also give "rows" (the height
+of the board, the same as its size by default) and "connect" (the coins
+in a row needed to win, 4 by default). A request may carry an "id",
+which is copied into its answer. Errors are answered with {"ok": false, "error": "..."}.
+When a player joins or moves, the other player of the match is sent an
+event: {"event": "join" | "move", "match": ..., ...}.
+
+The rules are played by engine.Game, the same as the command line games.
+
+    python -m connectfour server --port 8765
+"""
+
+import json
+import asyncio
+import argparse
+import itertools
+from .bitboard import CONNECT
+from .engine import Game
+
+MAX_LINE = 4096
+
+
+class Match:
+    """
+    One game on the server
+
+    Attributes:
+    -----------
+    id --> Match id
+    game --> Rules and state of the game >> type = engine.Game
+    names --> Names of player 1 and 2
+    seats --> Stream writer of the connection playing each player
+    """
+
+    __slots__ = ('id', 'game', 'names', 'seats')
+
+    def __init__(self, match_id: str, size: int, name: str, rows: int = 0, connect: int = CONNECT):
+        self.id = match_id
+        self.game = Game(size, 1, rows, connect)
+        self.names = [None, name, None]
+        self.seats = [None, None, None]
+
+    def state(self) -> dict:
+        game = self.game
+        return {
+            "match": self.id,
+            "size": game.size,
+            "rows": game.rows,
+            "connect": game.connect,
+            "players": self.names[1:],
+            "moves": game.moves,
+            "turn": game.player,
+            "outcome": game.outcome,
+            "winner": game.winner,
+            "line": game.line,
+        }
+
+
+class GameServer:
+    """
+    Registry of the matches and the handler of every connection
+    """
+
+    def __init__(self):
+        self.matches = {}
+        self._ids = itertools.count(1)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve one connection until it closes
+        """
+
+        seats = []  # (match, player) taken by this connection
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                request = {}
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("A request must be a JSON object")
+                    answer = self.dispatch(request, writer, seats)
+                except (ValueError, KeyError, TypeError, OverflowError) as exc_val:
+                    # OverflowError: a number like 1e400 given as a size or column
+                    answer = {"ok": False, "error": str(exc_val).strip('"\'')}
+                except RecursionError:
+                    answer = {"ok": False, "error": "The request is nested too deeply"}
+                if isinstance(request, dict) and "id" in request:
+                    answer["id"] = request["id"]
+                writer.write(json.dumps(answer).encode() + b'\n')
+                await writer.drain()
+        finally:
+            for match, player in seats:
+                match.seats[player] = None
+                if not any(match.seats):
+                    self.matches.pop(match.id, None)
+            writer.close()
+
+    def dispatch(self, request: dict, writer: asyncio.StreamWriter, seats: list) -> dict:
+        """
+        Answer one request
+
+        :param request: Decoded request
+        :param writer: Connection the request came from
+        :param seats: Seats taken by the connection, updated on create/join
+        :return: Answer to send back
+        """
+
+        op = request.get("op")
+        if op == "create":
+            shape = int(request.get("size", 7)), int(request.get("rows", 0)), int(request.get("connect", CONNECT))
+            match = Match(str(next(self._ids)), shape[0], str(request.get("name", "Player1")), *shape[1:])
+            match.seats[1] = writer
+            self.matches[match.id] = match
+            seats.append((match, 1))
+            return {"ok": True, "match": match.id, "player": 1, "state": match.state()}
+
+        match = self.matches.get(str(request.get("match")))
+        if match is None:
+            raise KeyError(f"There is no match {request.get('match')}")
+        if op == "join":
+            if match.names[2] is not None:
+                raise ValueError("The match is full")
+            match.names[2] = str(request.get("name", "Player2"))
+            match.seats[2] = writer
+            seats.append((match, 2))
+            self.notify(match, 1, {"event": "join", "match": match.id, "name": match.names[2]})
+            return {"ok": True, "match": match.id, "player": 2, "state": match.state()}
+        if op == "move":
+            player = match.game.player
+            if match.seats[player] is not writer:
+                raise ValueError("It is not your move")
+            if match.names[2] is None:
+                raise ValueError("Waiting for a second player")
+            result = match.game.play(int(request["col"]))
+            moved = result._asdict()
+            self.notify(match, 3 - player, {"event": "move", "match": match.id, "result": moved})
+            return {"ok": True, "result": moved, "state": match.state()}
+        if op == "state":
+            return {"ok": True, "state": match.state()}
+        raise ValueError(f"Unknown op {op!r}")
+
+    @staticmethod
+    def notify(match: Match, player: int, event: dict):
+        writer = match.seats[player]
+        if writer is not None and not writer.is_closing():
+            writer.write(json.dumps(event).encode() + b'\n')
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765):
+        """
+        Start listening
+
+        :return: asyncio.Server (use port 0 to pick a free port, see .sockets)
+        """
+
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+
+
+class Client:
+    """
+    Connection to a GameServer
+
+    request() sends a request and waits for its answer; events pushed by
+    the server (the other player joining or moving) go to the events queue.
+    """
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.events = asyncio.Queue()
+        self._pending = {}
+        self._ids = itertools.count()
+        self._task = None
+
+    async def connect(self, host: str = '127.0.0.1', port: int = 8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+        self._task = asyncio.ensure_future(self._listen())
+        return self
+
+    async def _listen(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            future = self._pending.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+            else:
+                self.events.put_nowait(message)
+        for future in self._pending.values():
+            future.set_exception(ConnectionError("Connection closed by the server"))
+
+    async def request(self, op: str, **fields) -> dict:
+        fields["op"] = op
+        fields["id"] = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[fields["id"]] = future
+        self.writer.write(json.dumps(fields).encode() + b'\n')
+        return await future
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def _run_server(host: str, port: int):
+    server = await GameServer().serve(host, port)
+    print(f"Serving Connect Four on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour server', description='Host Connect Four matches')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_run_server(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+"""
+Compact game sessions, hibernated to disk when idle
+
+A GameState is one open game in a few hundred bytes: the two bitboards,
+the columns played as a bytearray and the names of the players, with
+the masks of its board shape shared with every other game of that
+shape (see variations.geometry). An engine.Game of the same game takes
+about ten times as much, mostly for the line counters of its win
+tracker, which a game that moves once a day does not need.
+
+SessionStore keeps the games being played in memory and moves the ones
+nobody touched for a while to a dbm key-value file, in the binary
+record format of the replay archive. Asking for a hibernated game
+loads it back:
+
+    with SessionStore('games.db', idle=600) as store:
+        game_id, state = store.create(7, ('Alice', 'Bob'))
+        store.play(game_id, 3)
+        ...
+        store.get(game_id).moves
+
+    python -m connectfour sessions --games 100000 --idle 60
+"""
+
+import dbm
+import time
+import random
+import argparse
+import tracemalloc
+from collections import namedtuple, OrderedDict
+from .bitboard import CONNECT
+from .engine import Game, Result, ON, OVER, DRAW
+from .replay import GameRecord, PASS, encode, decode
+from .variations import geometry, has_run
+
+NEXT_ID = b'#next'  # Key of the next game id in the file, not a game
+
+SessionStats = namedtuple("SessionStats", ["resident", "stored", "loads", "hibernated"])
+SessionStats.__doc__ = """
+Counters of a SessionStore
+
+resident --> Games in memory
+stored --> Games in the file (a game loaded back keeps its copy there
+           until it is hibernated again or removed)
+loads --> Games loaded back from the file
+hibernated --> Games written to the file and dropped from memory
+"""
+
+
+class GameState:
+    """
+    One game in as little memory as it takes
+
+    Attributes:
+    -----------
+    shape --> Masks of the board shape, shared >> type = variations.Geometry
+    names --> (name of player 1, name of player 2), '' for a seat not taken
+    moves --> Columns played (0-based), player 1 first >> type = bytearray
+    one --> Bitboard of player 1's coins (bit layout of bitboard.Position)
+    two --> Bitboard of player 2's coins
+    winner --> Index of the winning player, 0 if there is none
+    touched --> Clock reading of the last use, kept by SessionStore
+
+    Additional Info:
+    ----------------
+    Players alternate, there is no skip(). Everything engine.Game
+    answers is worked out from these: the player to move from the
+    number of moves, a draw from a full board and the winning line by
+    replaying the moves, once, when the game is won. to_game() gives
+    the full engine.Game for the front-ends.
+    """
+
+    __slots__ = ('shape', 'names', 'moves', 'one', 'two', 'winner', 'touched')
+
+    def __init__(self, size: int = 7, names: tuple = ('', ''), rows: int = 0, connect: int = CONNECT):
+        """
+        Start a game on an empty board
+
+        :param size: Width of the board
+        :param names: Names of player 1 and 2
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win
+        """
+
+        self.shape = geometry(size, rows, connect)
+        self.names = tuple(names)
+        self.moves = bytearray()
+        self.one = 0
+        self.two = 0
+        self.winner = 0
+        self.touched = 0.0
+
+    def __repr__(self):
+        return f"GameState(size={self.shape.size}, rows={self.shape.rows}, connect={self.shape.connect}, " \
+               f"moves={list(self.moves)}, outcome={self.outcome})"
+
+    @property
+    def player(self) -> int:
+        """
+        Index of the player to move
+        """
+
+        return 1 + (len(self.moves) & 1)
+
+    @property
+    def outcome(self) -> str:
+        """
+        ON, OVER or DRAW as for engine.Game
+        """
+
+        if self.winner:
+            return OVER
+        return DRAW if len(self.moves) == self.shape.cells else ON
+
+    def can_play(self, col: int) -> bool:
+        return not self.winner and 0 <= col < self.shape.size and not (self.one | self.two) & self.shape.tops[col]
+
+    def legal_moves(self) -> list:
+        """
+        Columns a coin can be dropped in, empty once the game is over
+        """
+
+        return [col for col in range(self.shape.size) if self.can_play(col)]
+
+    def play(self, col: int) -> Result:
+        """
+        Drop a coin for the player to move
+
+        :param col: Column index (0-based)
+        :return: Result of the move, as engine.Game.play returns it
+        """
+
+        if self.outcome != ON:
+            raise ValueError("The game is over")
+        if not self.can_play(col):
+            raise ValueError(f"Column {col + 1} is not available")
+        shape = self.shape
+        player = self.player
+        # Adding the bottom bit of a column to its coins carries into the lowest empty cell
+        bit = ((self.one | self.two) + shape.bottoms[col]) & shape.columns[col]
+        if player == 1:
+            self.one |= bit
+            won = has_run(self.one, shape)
+        else:
+            self.two |= bit
+            won = has_run(self.two, shape)
+        self.moves.append(col)
+        row = shape.rows - 1 - (bit.bit_length() - 1 - col * shape.stride)
+        line = None
+        if won:
+            self.winner = player
+            line = self.to_game().line
+        return Result(row, col, player, self.outcome, line)
+
+    def cell(self, row: int, col: int) -> int:
+        """
+        Value of a cell: 0 if empty else the index of the player
+
+        :param row: Row index where 0 is the top of the board
+        :param col: Column index
+        """
+
+        bit = 1 << (col * self.shape.stride + self.shape.rows - 1 - row)
+        return 1 if self.one & bit else 2 if self.two & bit else 0
+
+    def to_game(self) -> Game:
+        """
+        engine.Game of the position, with its move list and win tracker
+        """
+
+        shape = self.shape
+        return Game.from_moves(shape.size, self.moves, 1, shape.rows, shape.connect)
+
+    def record(self) -> GameRecord:
+        """
+        replay.GameRecord of the game, the players without colours
+        """
+
+        shape = self.shape
+        return GameRecord(shape.size, tuple((name, '') for name in self.names), bytes(self.moves), self.winner,
+                          0 if shape.rows == shape.size else shape.rows, shape.connect)
+
+    @classmethod
+    def from_record(cls, record: GameRecord):
+        """
+        Game of a record, its moves played again
+
+        Raises ValueError for a record with an illegal move or a turn
+        given away
+        """
+
+        self = cls(record.size, tuple(name for name, _ in record.players), record.rows, record.connect)
+        for col in record.moves:
+            if col == PASS:
+                raise ValueError("A session game cannot give a turn away")
+            self.play(col)
+        return self
+
+    def encode(self) -> bytes:
+        return encode(self.record())
+
+    @classmethod
+    def decode(cls, data: bytes):
+        return cls.from_record(decode(data))
+
+
+class SessionStore:
+    """
+    Open games by id, the idle ones kept in a dbm file instead of memory
+
+    Attributes:
+    -----------
+    path --> dbm file of the hibernated games
+    idle --> Seconds without use after which a game is hibernated
+    clock --> Function giving the time in seconds, time.monotonic by default
+    games --> id --> GameState of the games in memory >> type =
+              OrderedDict, least recently used first
+    loads --> Games loaded back from the file
+    hibernated --> Games written to the file and dropped from memory
+
+    Additional Info:
+    ----------------
+    Using a game moves it to the end of games, so the idle ones are
+    always at the front: every create() and get() hibernates the games
+    at the front which have been idle too long, which costs nothing
+    when there are none.
+
+    A game is only written when it is hibernated, or for every game in
+    memory when the store is closed. The next id is written with every
+    new game, so a store reopened after a crash never hands out the id
+    of a game already in the file. The dbm module picks the best
+    key-value file Python was built with (gdbm, ndbm, or its own dumb
+    format).
+    """
+
+    def __init__(self, path: str, idle: float = 3600.0, clock=time.monotonic):
+        self.path = path
+        self.idle = idle
+        self.clock = clock
+        self.games = OrderedDict()
+        self.loads = 0
+        self.hibernated = 0
+        self._db = dbm.open(path, 'c')
+        self._next = int(self._db.get(NEXT_ID, b'1'))
+
+    def __len__(self):
+        return len(self.games)
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self.games or game_id.encode() in self._db
+
+    def create(self, size: int = 7, names: tuple = ('', ''), rows: int = 0, connect: int = CONNECT) -> tuple:
+        """
+        Open a new game
+
+        :return: (game id, GameState)
+        """
+
+        self.hibernate()
+        game_id = str(self._next)
+        self._next += 1
+        self._db[NEXT_ID] = str(self._next).encode()
+        state = GameState(size, names, rows, connect)
+        state.touched = self.clock()
+        self.games[game_id] = state
+        return game_id, state
+
+    def get(self, game_id: str) -> GameState:
+        """
+        Game of an id, loaded back from the file when it was hibernated
+
+        Raises KeyError for an unknown id
+        """
+
+        state = self.games.get(game_id)
+        if state is None:
+            data = self._db.get(game_id.encode())
+            if data is None:
+                raise KeyError(f"There is no game {game_id}")
+            state = GameState.decode(data)
+            self.games[game_id] = state
+            self.loads += 1
+        else:
+            self.games.move_to_end(game_id)
+        state.touched = self.clock()
+        self.hibernate()
+        return state
+
+    def play(self, game_id: str, col: int) -> Result:
+        return self.get(game_id).play(col)
+
+    def remove(self, game_id: str):
+        """
+        Forget a game, in memory and in the file
+        """
+
+        self.games.pop(game_id, None)
+        key = game_id.encode()
+        if key in self._db:
+            del self._db[key]
+
+    def hibernate(self, idle: float = None) -> int:
+        """
+        Write the games idle for too long to the file and drop them from memory
+
+        :param idle: Seconds without use, the store's idle time by default
+        :return: Number of games hibernated
+        """
+
+        limit = self.clock() - (self.idle if idle is None else idle)
+        count = 0
+        games = self.games
+        while games:
+            game_id, state = next(iter(games.items()))
+            if state.touched > limit:
+                break
+            self._db[game_id.encode()] = state.encode()
+            del games[game_id]
+            count += 1
+        self.hibernated += count
+        return count
+
+    def stats(self) -> SessionStats:
+        return SessionStats(len(self.games), len(self._db) - (NEXT_ID in self._db), self.loads, self.hibernated)
+
+    def close(self):
+        """
+        Hibernate every game and close the file
+        """
+
+        if self._db is None:
+            return
+        self.hibernate(float('-inf'))
+        self._db.close()
+        self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def footprint(games: int = 2000, moves: int = 12, size: int = 7) -> tuple:
+    """
+    Bytes per game of a GameState and of an engine.Game after a number of moves
+    """
+
+    rng = random.Random(0)
+    sizes = []
+    for make in (lambda: GameState(size, ('Alice', 'Bob')), lambda: Game(size)):
+        tracemalloc.start()
+        kept = []
+        for _ in range(games):
+            game = make()
+            for _ in range(moves):
+                if game.outcome == ON:
+                    game.play(rng.choice(game.legal_moves()))
+            kept.append(game)
+        sizes.append(tracemalloc.get_traced_memory()[0] / games)
+        tracemalloc.stop()
+        del kept
+    return tuple(sizes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour sessions',
+                                     description='Simulate many slow games through a session store')
+    parser.add_argument('--path', default='sessions.db', help='dbm file of the hibernated games')
+    parser.add_argument('--games', type=int, default=100_000, help='games to open')
+    parser.add_argument('--moves', type=int, default=300_000, help='moves to play on games picked at random')
+    parser.add_argument('--idle', type=float, default=60.0, help='simulated seconds before a game is hibernated')
+    parser.add_argument('--rate', type=float, default=1000.0, help='simulated requests per second')
+    parser.add_argument('--size', type=int, default=7, help='board width')
+    args = parser.parse_args(argv)
+
+    state_bytes, game_bytes = footprint(size=args.size)
+    print(f"{state_bytes:,.0f} bytes per GameState, {game_bytes:,.0f} per engine.Game")
+    now = [0.0]
+    rng = random.Random(1)
+    start = time.perf_counter()
+    with SessionStore(args.path, args.idle, lambda: now[0]) as store:
+        ids = []
+        for _ in range(args.games):
+            now[0] += 1 / args.rate
+            ids.append(store.create(args.size, ('Alice', 'Bob'))[0])
+        most = len(store)
+        played = 0
+        for _ in range(args.moves):
+            now[0] += 1 / args.rate
+            game_id = rng.choice(ids)
+            state = store.get(game_id)
+            if state.outcome == ON:
+                state.play(rng.choice(state.legal_moves()))
+                played += 1
+            most = max(most, len(store))
+        seconds = time.perf_counter() - start
+        stats = store.stats()
+    print(f"{args.games} games, {played} moves in {seconds:.2f}s ({(args.games + args.moves) / seconds:,.0f} "
+          f"requests/sec)")
+    print(f"in memory at most {most}, at the end {stats.resident}  loaded back {stats.loads}  "
+          f"hibernated {stats.hibernated}  in the file {stats.stored}")
+    return stats
+
+
+if __name__ == '__main__':
+    main()
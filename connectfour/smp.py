@@ -0,0 +1,269 @@
+"""
+Parallel search on every core (lazy SMP)
+
+ParallelSolver searches one position with several processes at once.
+Each runs the ordinary iterative-deepening Solver on the same root, and
+all of them read and write one transposition table kept in shared
+memory (multiprocessing.shared_memory), so what one process finds out
+about a position the others get from the table instead of searching it.
+
+The helper processes do not split the tree between them: every other
+helper starts its iterations one ply deeper, so the helpers run ahead
+of the main search and of each other and fill the table with entries
+the others are about to need. The answer is that of the deepest
+iteration any process completed within the budget.
+
+The table takes no locks. An entry is two 64 bit words (the key xor-ed
+with the data, then the data), each written with one store. A probe
+checks the two against each other, so an entry torn by two processes
+writing at once reads as missing (see solver.TranspositionTable).
+
+    python -m connectfour smp --size 8 --moves 45 --depth 12 --workers 1 2 4
+    python -m connectfour smp --size 10 --time 5
+"""
+
+import os
+import time
+import argparse
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, wait
+from .bitboard import Position, CONNECT
+from .engine import parse_moves
+from .solver import Solver, TranspositionTable, _OutOfBudget
+
+_helper = None   # Solver of a helper process
+_stop = None     # Shared word set to 1 when the helpers have to stop
+_memory = None   # Shared memory block, attached by a helper process
+
+
+def _views(memory: shared_memory.SharedMemory, bits: int) -> tuple:
+    """
+    (table words, stop word) of a shared memory block: the table comes
+    first and the stop word takes the last 8 bytes
+    """
+
+    size = 16 << bits
+    return memory.buf[:size].cast('Q'), memory.buf[size:size + 8].cast('Q')
+
+
+class _Helper(Solver):
+    """
+    Solver of a helper process, which also stops when the stop word is set
+    """
+
+    CHECK_EVERY = 255  # A finished main search waits for the helpers, so they look more often
+
+    def _check_budget(self):
+        if _stop[0]:
+            raise _OutOfBudget()
+        super()._check_budget()
+
+
+def _attach(name: str, bits: int):
+    """
+    Start a helper process: attach the shared table
+    """
+
+    global _helper, _stop, _memory
+    _memory = shared_memory.SharedMemory(name)
+    table, _stop = _views(_memory, bits)
+    _helper = _Helper(table=TranspositionTable(bits, table))
+
+
+def _helper_search(task: tuple):
+    """
+    Search a position in a helper process
+
+    :param task: (helper number, (columns, rows, connect), player 1 stones,
+                  player 2 stones, column heights, moves, player to move,
+                  seconds, deepest iteration)
+    :return: SearchResult of the helper
+    """
+
+    index, shape, board1, board2, heights, moves, player, seconds, max_depth = task
+    position = Position(*shape)
+    position.boards[1], position.boards[2] = board1, board2
+    position.heights[:] = heights
+    position.moves.extend(moves)
+    _helper.first_depth = 1 + index % 2
+    _helper.time_limit = seconds
+    _helper.max_depth = max_depth
+    return _helper.search(position, player)
+
+
+class ParallelSolver:
+    """
+    Solver searching each position on several processes sharing one
+    transposition table
+
+    Attributes:
+    -----------
+    workers --> Processes searching, the calling process included
+    solver --> Solver of the calling process, its table is the shared one
+    last --> SearchResult of the last search: the move, score and depth
+             of the deepest completed iteration, with the nodes of every
+             process added up
+    worker_nodes --> Nodes each process visited in the last search, the
+                     calling process first
+    worker_depths --> Deepest iteration each process completed
+
+    Additional Info:
+    ----------------
+    It plays wherever a Solver does: move(game) and search(position)
+    work the same, and time_limit, max_depth and tablebase are those of
+    the solver of the calling process. close() stops the helpers and
+    frees the shared memory.
+    """
+
+    def __init__(self, workers: int = 0, table_bits: int = 20, max_depth: int = 0, time_limit: float = 0,
+                 tablebase=None):
+        """
+        :param workers: Processes searching, every core by default
+        :param table_bits: log2 of the number of table entries (see
+                           solver.TranspositionTable)
+        :param max_depth: Deepest iteration to run, no limit by default
+        :param time_limit: Seconds allowed per search, no limit by default
+        :param tablebase: tablebase.Tablebase answering the positions it holds
+        """
+
+        self.workers = workers or os.cpu_count() or 1
+        self._memory = shared_memory.SharedMemory(create=True, size=(16 << table_bits) + 8)
+        table, self._stop = _views(self._memory, table_bits)
+        self.solver = Solver(max_depth=max_depth, time_limit=time_limit, table=TranspositionTable(table_bits, table),
+                             tablebase=tablebase)
+        self.last = None
+        self.worker_nodes = []
+        self.worker_depths = []
+        self._pool = None
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(self.workers - 1, initializer=_attach,
+                                             initargs=(self._memory.name, table_bits))
+            # Start the processes now rather than inside the first move's budget
+            wait([self._pool.submit(int) for _ in range(self.workers - 1)])
+
+    @property
+    def time_limit(self) -> float:
+        return self.solver.time_limit
+
+    @time_limit.setter
+    def time_limit(self, seconds: float):
+        self.solver.time_limit = seconds
+
+    @property
+    def max_depth(self) -> int:
+        return self.solver.max_depth
+
+    @max_depth.setter
+    def max_depth(self, depth: int):
+        self.solver.max_depth = depth
+
+    @property
+    def tablebase(self):
+        return self.solver.tablebase
+
+    @tablebase.setter
+    def tablebase(self, tablebase):
+        self.solver.tablebase = tablebase
+
+    def move(self, game) -> int:
+        """
+        Pick the column to play in an engine.Game
+        """
+
+        return self.search(game.position, game.player).move
+
+    def search(self, position: Position, player: int = 0):
+        """
+        Find the best move for the player to move
+
+        :param position: Position to search. It is restored before returning
+        :param player: Index of the player to move, by default the player
+                       whose turn it is when the players alternate
+        :return: SearchResult of the deepest iteration completed by any process
+        """
+
+        start = time.perf_counter()
+        player = player or position.turn
+        futures = []
+        if self._pool is not None:
+            task = (position.shape, position.boards[1], position.boards[2], list(position.heights),
+                    list(position.moves), player, self.solver.time_limit, self.solver.max_depth)
+            futures = [self._pool.submit(_helper_search, (index,) + task) for index in range(1, self.workers)]
+        results = [self.solver.search(position, player)]
+        # The main search is over (out of time, at its deepest iteration or solved): stop the helpers
+        self._stop[0] = 1
+        try:
+            results += [future.result() for future in futures]
+        finally:
+            self._stop[0] = 0
+        best = max(results, key=lambda result: result.depth)
+        nodes = sum(result.nodes for result in results)
+        seconds = time.perf_counter() - start
+        self.worker_nodes = [result.nodes for result in results]
+        self.worker_depths = [result.depth for result in results]
+        self.last = best._replace(nodes=nodes, seconds=seconds, nps=nodes / seconds if seconds else 0.0)
+        return self.last
+
+    def clear(self):
+        """
+        Empty the shared table
+        """
+
+        self.solver.table.clear()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._memory is not None:
+            # The views have to go before the block can be closed
+            self.solver.table.table.release()
+            self._stop.release()
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour smp',
+                                     description='Search a position on several processes and report the speed-up')
+    parser.add_argument('--size', type=int, default=8, help='board width [5...20]')
+    parser.add_argument('--rows', type=int, default=0, help='board height (default: the width)')
+    parser.add_argument('--connect', type=int, default=CONNECT, help='coins in a row to win')
+    parser.add_argument('--moves', default='', help='moves played so far as 1-based columns')
+    parser.add_argument('--depth', type=int, default=0, help='search to this depth and time it (0: use --time)')
+    parser.add_argument('--time', type=float, default=5.0, help='seconds per search when no depth is given')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help='process counts to compare, e.g. 1 2 4 8')
+    parser.add_argument('--table-bits', type=int, default=20, help='log2 of the transposition table entries')
+    args = parser.parse_args(argv)
+
+    position = Position(args.size, args.rows, args.connect)
+    for col in parse_moves(args.moves):
+        position.play(col)
+    seconds = 0 if args.depth else args.time
+    baseline = None
+    results = []
+    print(f"{'workers':>7} {'move':>5} {'score':>6} {'depth':>6} {'seconds':>8} {'nodes':>10} {'nodes/sec':>10} "
+          f"{'speed-up':>8}  nodes per worker")
+    for workers in args.workers:
+        with ParallelSolver(workers, args.table_bits, args.depth, seconds) as solver:
+            result = solver.search(position)
+            per_worker = solver.worker_nodes
+        # Against a fixed depth the speed-up is the time to reach it, against a fixed time the search speed
+        speed = 1 / result.seconds if args.depth else result.nps
+        baseline = baseline or speed
+        print(f"{workers:>7} {result.move + 1:>5} {result.score:>6} {result.depth:>6} {result.seconds:>8.2f} "
+              f"{result.nodes:>10} {result.nps:>10,.0f} {speed / baseline:>7.2f}x  {per_worker}")
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,457 @@
+"""
+Computer opponent and position analyser
+
+Solver runs an iterative-deepening negamax search with alpha-beta
+pruning over a bitboard.Position. Moves are tried centre first (after
+the best move remembered for the position), and results are kept in a
+fixed-size transposition table keyed by Zobrist hashes which are
+updated move by move. The heuristic score of the leaves and the winning
+moves of every node come from an evaluation.Evaluator updated move by
+move as well. A search stops when its time or node budget runs
+out and returns the answer of the deepest completed iteration.
+"""
+
+import time
+import random
+import argparse
+import functools
+from array import array
+from collections import namedtuple
+from .bitboard import Position, CONNECT
+from .evaluation import Evaluator
+from .engine import parse_moves
+
+WIN = 10000        # Score of a win on the next move, one less per extra ply
+WIN_BOUND = 9000   # Scores beyond this are forced wins/losses
+INFINITY = 32000
+MAX_DEPTH = 250    # Deepest search, the depth is stored in 8 bits
+
+# Bound stored with a score in the transposition table
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+SearchResult = namedtuple("SearchResult", ["move", "score", "depth", "nodes", "seconds", "nps"])
+SearchResult.__doc__ = """
+Answer of a search
+
+move --> Best column found (0-based)
+score --> Score of the move for the player to move. Above WIN_BOUND
+          means a forced win, below -WIN_BOUND a forced loss
+depth --> Depth of the deepest completed iteration
+nodes --> Positions visited
+seconds --> Time spent searching
+nps --> Nodes per second
+"""
+
+
+class _OutOfBudget(Exception):
+    """
+    Raised inside the search when the time or node budget is spent
+    """
+
+
+@functools.lru_cache(maxsize=None)
+def zobrist(size: int, rows: int = 0) -> tuple:
+    """
+    Random 64 bit keys for every (player, bit) of a board size
+
+    :param size: Width of the board
+    :param rows: Height of the board, the same as the width by default
+    :return: (unused, player 1 keys, player 2 keys, side to move key)
+
+    Additional Info:
+    ----------------
+    The keys come from a generator seeded with the board size so every
+    process (and every run) hashes positions the same way.
+    """
+
+    rows = rows or size
+    rng = random.Random(size if rows == size else f"{size}x{rows}")
+    bits = size * (rows + 1)
+    return (None,
+            tuple(rng.getrandbits(64) for _ in range(bits)),
+            tuple(rng.getrandbits(64) for _ in range(bits)),
+            rng.getrandbits(64))
+
+
+def position_hash(position: Position, player: int) -> int:
+    """
+    Zobrist hash of a position computed from scratch
+
+    :param position: Position to hash
+    :param player: Index of the player to move
+    :return: 64 bit hash
+    """
+
+    keys = zobrist(position.size, position.rows)
+    h = keys[3] if player == 2 else 0
+    for index in (1, 2):
+        board = position.boards[index]
+        while board:
+            low = board & -board
+            h ^= keys[index][low.bit_length() - 1]
+            board ^= low
+    return h
+
+
+@functools.lru_cache(maxsize=None)
+def centre_order(size: int) -> tuple:
+    """
+    Columns sorted from the centre of the board outwards
+    """
+
+    return tuple(sorted(range(size), key=lambda col: (abs(2 * col - size + 1), col)))
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results
+
+    Attributes:
+    -----------
+    mask --> Number of entries minus one (the size is a power of two)
+    table --> Two 64 bit words per entry >> type = array('Q')
+
+    Additional Info:
+    ----------------
+    Each entry holds the packed data and the key xor-ed with it:
+
+        data = depth + 1 | bound << 8 | move + 1 << 10 | score + 32768 << 16
+
+    An entry is only used when the stored key matches the probed key,
+    which also rejects an entry whose two words were written by
+    different stores. When two positions fall in the same slot the one
+    searched to the greater depth is kept (depth-preferred).
+    """
+
+    __slots__ = ('mask', 'table')
+
+    def __init__(self, bits: int = 20, table=None):
+        """
+        :param bits: log2 of the number of entries. 2**20 entries use 16MB
+        :param table: Buffer of 64 bit words to use instead of a new array
+        """
+
+        self.mask = (1 << bits) - 1
+        self.table = array('Q', bytes(16 << bits)) if table is None else table
+
+    def __len__(self):
+        return self.mask + 1
+
+    def probe(self, key: int) -> int:
+        """
+        :return: Packed data of the entry for key, 0 if there is none
+        """
+
+        slot = (key & self.mask) << 1
+        data = self.table[slot + 1]
+        return data if self.table[slot] ^ data == key else 0
+
+    def store(self, key: int, depth: int, bound: int, move: int, score: int):
+        slot = (key & self.mask) << 1
+        old = self.table[slot + 1]
+        if old and self.table[slot] ^ old != key and (old & 0xff) > depth + 1:
+            return
+        data = (depth + 1) | bound << 8 | (move + 1) << 10 | (score + 32768) << 16
+        self.table[slot] = key ^ data
+        self.table[slot + 1] = data
+
+    def clear(self):
+        self.table[:] = array('Q', bytes(8 * len(self.table)))
+
+
+def unpack(data: int) -> tuple:
+    """
+    Split packed entry data into (depth, bound, move, score)
+    """
+
+    return (data & 0xff) - 1, data >> 8 & 3, (data >> 10 & 0x3f) - 1, (data >> 16) - 32768
+
+
+class Solver:
+    """
+    Alpha-beta negamax search with iterative deepening
+
+    Attributes:
+    -----------
+    table --> Transposition table shared by every search of this solver
+    max_depth --> Deepest iteration to run, no limit by default
+    first_depth --> Depth of the first iteration, 1 unless the solver is
+                    a helper of a parallel search (see connectfour.smp)
+    time_limit --> Seconds allowed per search, no limit by default
+    node_limit --> Nodes allowed per search, no limit by default
+    nodes --> Nodes visited by the last search
+    last --> SearchResult of the last search
+    tablebase --> tablebase.Tablebase answering the positions it holds
+                  without a search, None by default
+
+    Additional Info:
+    ----------------
+    With neither a time, node nor depth limit a search runs until the
+    game is solved, which is only practical on the smallest boards.
+    The solver can play in a Board: move(game) returns its column.
+    """
+
+    CHECK_EVERY = 1023  # The clock is read every 1024 nodes
+
+    def __init__(self, table_bits: int = 20, max_depth: int = 0, time_limit: float = 0,
+                 node_limit: int = 0, table: TranspositionTable = None, tablebase=None):
+        self.table = table if table is not None else TranspositionTable(table_bits)
+        self.tablebase = tablebase
+        self.max_depth = max_depth
+        self.first_depth = 1
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.last = None
+        self._deadline = 0.0
+        self._position = None
+        self._evaluator = None
+
+    def move(self, game) -> int:
+        """
+        Pick the column to play in an engine.Game
+        """
+
+        return self.search(game.position, game.player).move
+
+    def search(self, position: Position, player: int = 0) -> SearchResult:
+        """
+        Find the best move for the player to move
+
+        :param position: Position to search. It is restored before returning
+        :param player: Index of the player to move, by default the player
+                       whose turn it is when the players alternate
+        :return: SearchResult of the deepest completed iteration
+        """
+
+        player = player or position.turn
+        self.nodes = 0
+        self._position = position
+        start = time.perf_counter()
+        if self.tablebase is not None and player == position.turn:
+            scores = self.tablebase.analyse(position)
+            if scores:
+                move = max(centre_order(position.size), key=lambda col: scores.get(col, -INFINITY))
+                self.last = SearchResult(move, scores[move], position.cells - position.count, 0,
+                                         time.perf_counter() - start, 0.0)
+                return self.last
+        self._deadline = start + self.time_limit if self.time_limit else 0.0
+        # Rebuilt every search, an interrupted iteration leaves it out of step with the position
+        self._evaluator = Evaluator.from_position(position)
+        key = position_hash(position, player)
+        empty = position.cells - position.count
+        limit = min(self.max_depth or empty, empty, MAX_DEPTH)
+        legal = position.legal_moves()
+        best = SearchResult(legal[0] if legal else -1, 0, 0, 0, 0.0, 0.0)
+        moves = position.count
+        for depth in range(max(1, min(self.first_depth, limit)), limit + 1):
+            try:
+                score, move = self._root(depth, player, key)
+            except _OutOfBudget:
+                # Put back the moves the interrupted iteration was in the middle of
+                while position.count > moves:
+                    position.undo()
+                break
+            best = SearchResult(move, score, depth, self.nodes, 0.0, 0.0)
+            if abs(score) > WIN_BOUND:
+                break
+        seconds = time.perf_counter() - start
+        self.last = best._replace(nodes=self.nodes, seconds=seconds,
+                                  nps=self.nodes / seconds if seconds else 0.0)
+        return self.last
+
+    def analyse(self, position: Position, player: int = 0, depth: int = 0) -> dict:
+        """
+        Score every legal column of a position
+
+        :param position: Position to analyse
+        :param player: Index of the player to move
+        :param depth: Depth to search below each column, by default max_depth
+        :return: {column: score for the player to move}
+        """
+
+        player = player or position.turn
+        if self.tablebase is not None and player == position.turn:
+            scores = self.tablebase.analyse(position)
+            if scores:
+                return scores
+        depth = depth or self.max_depth
+        scores = {}
+        for col in position.legal_moves():
+            position.play(col, player)
+            if position.has_won(player):
+                scores[col] = WIN - 1
+            elif position.is_full():
+                scores[col] = 0
+            else:
+                saved = self.max_depth
+                self.max_depth = max(1, depth - 1) if depth else 0
+                try:
+                    score = -self.search(position, 3 - player).score
+                finally:
+                    self.max_depth = saved
+                # The reply was searched from its own root, one ply further from ours
+                scores[col] = score - 1 if score > WIN_BOUND else score + 1 if score < -WIN_BOUND else score
+            position.undo()
+        return scores
+
+    def _root(self, depth: int, player: int, key: int) -> tuple:
+        """
+        Search the root position to a fixed depth
+
+        :return: (score, best column)
+        """
+
+        position = self._position
+        evaluator = self._evaluator
+        keys = zobrist(position.size, position.rows)
+        data = self.table.probe(key)
+        first = unpack(data)[2] if data else -1
+        order = [first] + [col for col in centre_order(position.size) if col != first] if first >= 0 \
+            else centre_order(position.size)
+        alpha, beta = -INFINITY, INFINITY
+        best_move = -1
+        for col in order:
+            if not position.can_play(col):
+                continue
+            bit = position.heights[col]
+            row = position.play(col, player)
+            if evaluator.place(row, col, player) is not None:
+                score = WIN - 1
+            elif position.is_full():
+                score = 0
+            else:
+                score = -self._negamax(depth - 1, -beta, -alpha, 3 - player,
+                                       key ^ keys[player][bit] ^ keys[3], 1)
+            evaluator.remove(row, col, player)
+            position.undo()
+            if score > alpha or best_move < 0:
+                alpha = score
+                best_move = col
+        self.table.store(key, depth, EXACT, best_move, alpha)
+        return alpha, best_move
+
+    def _negamax(self, depth: int, alpha: int, beta: int, player: int, key: int, ply: int) -> int:
+        """
+        Score of the position for the player to move
+
+        :param depth: Remaining depth
+        :param alpha: Lower bound of the window
+        :param beta: Upper bound of the window
+        :param player: Index of the player to move
+        :param key: Zobrist hash of the position
+        :param ply: Distance from the root, used to prefer quicker wins
+        """
+
+        self.nodes += 1
+        if not self.nodes & self.CHECK_EVERY:
+            self._check_budget()
+        position = self._position
+        evaluator = self._evaluator
+        if depth == 0:
+            return evaluator.score(player)
+
+        alpha_orig = alpha
+        first = -1
+        data = self.table.probe(key)
+        if data:
+            stored_depth, bound, first, score = unpack(data)
+            if stored_depth >= depth:
+                # Win/loss scores are stored relative to the position, not the root
+                if score > WIN_BOUND:
+                    score -= ply
+                elif score < -WIN_BOUND:
+                    score += ply
+                if bound == EXACT:
+                    return score
+                if bound == LOWER and score > alpha:
+                    alpha = score
+                elif bound == UPPER and score < beta:
+                    beta = score
+                if alpha >= beta:
+                    return score
+
+        # A move which wins right away is always best
+        if evaluator.wins(player):
+            return WIN - ply - 1
+
+        heights = position.heights
+        tops = position.tops
+        order = centre_order(position.size)
+
+        keys = zobrist(position.size, position.rows)
+        if first >= 0:
+            order = (first,) + tuple(col for col in order if col != first)
+        best = -INFINITY
+        best_move = -1
+        for col in order:
+            bit = heights[col]
+            if bit >= tops[col]:
+                continue
+            row = position.play(col, player)
+            evaluator.place(row, col, player)
+            if position.is_full():
+                score = 0
+            else:
+                score = -self._negamax(depth - 1, -beta, -alpha, 3 - player,
+                                       key ^ keys[player][bit] ^ keys[3], ply + 1)
+            evaluator.remove(row, col, player)
+            position.undo()
+            if score > best:
+                best = score
+                best_move = col
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best_move < 0:
+            return 0
+
+        stored = best + ply if best > WIN_BOUND else best - ply if best < -WIN_BOUND else best
+        bound = UPPER if best <= alpha_orig else LOWER if best >= beta else EXACT
+        self.table.store(key, depth, bound, best_move, stored)
+        return best
+
+    def _check_budget(self):
+        if self.node_limit and self.nodes >= self.node_limit:
+            raise _OutOfBudget()
+        if self._deadline and time.perf_counter() >= self._deadline:
+            raise _OutOfBudget()
+
+
+def main(argv=None):
+    """
+    Analyse a position from the command line and print the best move
+
+    python -m connectfour.solver --size 7 --moves 4435 --time 2
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m connectfour.solver', description=main.__doc__.strip())
+    parser.add_argument('--size', type=int, default=7, help='board width [5...20]')
+    parser.add_argument('--rows', type=int, default=0, help='board height (default: the width)')
+    parser.add_argument('--connect', type=int, default=CONNECT, help='coins in a row to win')
+    parser.add_argument('--moves', default='', help='moves played so far as 1-based columns')
+    parser.add_argument('--time', type=float, default=2.0, help='seconds to search (0 for no limit)')
+    parser.add_argument('--nodes', type=int, default=0, help='nodes to search (0 for no limit)')
+    parser.add_argument('--depth', type=int, default=0, help='deepest iteration (0 for no limit)')
+    parser.add_argument('--table-bits', type=int, default=20, help='log2 of the transposition table entries')
+    parser.add_argument('--tablebase', help='tablebase file to look the position up in first')
+    args = parser.parse_args(argv)
+
+    position = Position(args.size, args.rows, args.connect)
+    for col in parse_moves(args.moves):
+        position.play(col)
+    solver = Solver(args.table_bits, args.depth, args.time, args.nodes)
+    if args.tablebase:
+        from .tablebase import Tablebase
+        solver.tablebase = Tablebase(args.tablebase)
+    result = solver.search(position)
+    print(f"best column {result.move + 1}  score {result.score}  depth {result.depth}")
+    print(f"{result.nodes} nodes in {result.seconds:.3f}s  ({result.nps:,.0f} nodes/sec)")
+    return result
+
+
+if __name__ == '__main__':
+    main()
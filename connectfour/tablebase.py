@@ -0,0 +1,396 @@
+"""
+Endgame tablebase for small boards
+
+A tablebase holds the exact value of every position reachable from a
+root (the empty board by default): win, loss or draw for the player to
+move and the number of plies to the end of the game with best play.
+It is built by retrograde analysis: the reachable positions are listed
+ply by ply going forward, then valued going backward from the last ply,
+where every move ends the game, down to the root.
+
+Positions are keyed on Position.canonical_key(), a position and its
+mirror image sharing one record. The file is the records sorted by key
+and cut into blocks, with an index of the first key and the file
+offset of every block. A block holds the distance of every key from the
+block's first key, split into byte planes, then the values (one signed
+byte each), compressed with zlib:
+
+    header | root moves | first keys | block offsets | block | block | ...
+
+The index is read when the file is opened, so looking up a position
+is one read of one block. Building needs numpy; reading does not.
+
+The whole 5x5 game fits in a tablebase. 6x6 has too many positions to
+list from the empty board, so on 6x6 build from a root some moves in:
+
+    python -m connectfour tablebase build --size 5 --out c4-5x5.c4t
+    python -m connectfour tablebase build --size 6 --moves 3344 --out c4-6x6-3344.c4t
+    python -m connectfour tablebase probe --table c4-5x5.c4t --moves 33
+"""
+
+import sys
+import time
+import zlib
+import struct
+import bisect
+import argparse
+from array import array
+from collections import namedtuple, OrderedDict
+from .bitboard import Position, CONNECT
+from .engine import parse_moves
+from .solver import WIN, centre_order
+
+MAGIC = b'C4TBASE1'
+HEADER = struct.Struct('<8sBBHIQ')  # magic, board size, root moves, records per block, blocks, records
+BLOCK_RECORDS = 4096
+CACHED_BLOCKS = 64
+UNKNOWN = -1000  # Score of a column that cannot be played, below every real score
+
+TableEntry = namedtuple("TableEntry", ["value", "distance"])
+TableEntry.__doc__ = """
+Tablebase answer for a position
+
+value --> 1 the player to move wins, -1 loses, 0 draw
+distance --> Plies to the end of the game with best play
+"""
+
+
+def _levels(size: int, moves: list, report=print) -> list:
+    """
+    List the positions reachable from the root ply by ply
+
+    :return: One (sorted canonical keys, player 1 stones, all stones)
+             tuple of numpy arrays per ply, for the positions where the
+             game is not over
+    """
+
+    import numpy as np
+
+    root = Position(size)
+    for col in moves:
+        root.play(col)
+    if root.has_won(1) or root.has_won(2) or root.is_full():
+        raise ValueError("The game is already over at the root")
+    stride = size + 1
+    columns = [np.uint64(((1 << size) - 1) << (col * stride)) for col in range(size)]
+    bottoms = [np.uint64(1 << (col * stride)) for col in range(size)]
+    full = np.uint64(sum(int(column) for column in columns))
+    bottom = np.uint64(root.bottom)
+
+    def canonical(stones, mask):
+        mirrored_stones, mirrored_mask = mirror(stones, size), mirror(mask, size)
+        keys = stones + mask + bottom
+        mirrored = mirrored_stones + mirrored_mask + bottom
+        flip = mirrored < keys
+        keys = np.where(flip, mirrored, keys)
+        keys, first = np.unique(keys, return_index=True)
+        return keys, np.where(flip, mirrored_stones, stones)[first], np.where(flip, mirrored_mask, mask)[first]
+
+    levels = [canonical(np.array([root.boards[1]], np.uint64), np.array([root.boards[1] | root.boards[2]], np.uint64))]
+    player = root.turn
+    while True:
+        _, stones, mask = levels[-1]
+        children = ([], [])
+        for col in range(size):
+            move = (mask + bottoms[col]) & columns[col]
+            open_ = move != 0
+            child_mask = (mask | move)[open_]
+            child_stones = (stones | move)[open_] if player == 1 else stones[open_]
+            mover = child_stones if player == 1 else child_stones ^ child_mask
+            going = ~has_four(mover, stride) & (child_mask != full)
+            children[0].append(child_stones[going])
+            children[1].append(child_mask[going])
+        player = 3 - player
+        if not sum(len(part) for part in children[0]):
+            break
+        levels.append(canonical(np.concatenate(children[0]), np.concatenate(children[1])))
+        report(f"ply {root.count + len(levels) - 1}: {len(levels[-1][0]):,} positions")
+    return levels
+
+
+def has_four(stones, stride: int):
+    """
+    Vectorised Position.has_won for a numpy array of stone bitboards
+    """
+
+    import numpy as np
+
+    found = np.zeros(stones.shape, bool)
+    for shift in (1, stride, stride + 1, stride - 1):
+        shift = np.uint64(shift)
+        pairs = stones & (stones >> shift)
+        found |= (pairs & (pairs >> (shift + shift))) != 0
+    return found
+
+
+def mirror(boards, size: int):
+    """
+    Vectorised left-right mirror image of a numpy array of bitboards
+    """
+
+    import numpy as np
+
+    stride = size + 1
+    column = np.uint64((1 << stride) - 1)
+    mirrored = np.zeros_like(boards)
+    for col in range(size):
+        mirrored |= ((boards >> np.uint64(col * stride)) & column) << np.uint64((size - 1 - col) * stride)
+    return mirrored
+
+
+def _values(size: int, start: int, levels: list, report=print) -> list:
+    """
+    Value every position, from the last ply back to the root
+
+    :param start: Number of moves played at the root
+    :return: One int8 numpy array of values per ply, in the order of the
+             level's keys: +d the player to move wins in d plies, -d loses
+             in d plies, 0 draw
+    """
+
+    import numpy as np
+
+    stride = size + 1
+    columns = [np.uint64(((1 << size) - 1) << (col * stride)) for col in range(size)]
+    bottoms = [np.uint64(1 << (col * stride)) for col in range(size)]
+    full = np.uint64(sum(int(column) for column in columns))
+    bottom = np.uint64(sum(int(b) for b in bottoms))
+    # Scores ordered so the best is the largest: quickest win, then draw, then slowest loss
+    top = 128
+    values = [None] * len(levels)
+    following = None
+    for ply in reversed(range(len(levels))):
+        keys, stones, mask = levels[ply]
+        player = 1 + ((start + ply) & 1)
+        best = np.full(len(keys), UNKNOWN, np.int16)
+        for col in range(size):
+            move = (mask + bottoms[col]) & columns[col]
+            open_ = move != 0
+            child_mask = mask | move
+            child_stones = stones | move if player == 1 else stones
+            mover = child_stones if player == 1 else child_stones ^ child_mask
+            won = has_four(mover, stride)
+            drawn = ~won & (child_mask == full)
+            score = np.where(won, top - 1, 0).astype(np.int16)
+            going = open_ & ~won & ~drawn
+            if going.any():
+                child_keys = child_stones[going] + child_mask[going] + bottom
+                mirrored = mirror(child_keys, size)
+                child_keys = np.minimum(child_keys, mirrored)
+                next_keys, next_values = following
+                found = next_values[np.searchsorted(next_keys, child_keys)].astype(np.int16)
+                # The child's value is for the opponent, one ply further from the end
+                score[going] = np.where(found > 0, -top + found + 1, np.where(found < 0, top + found - 1, 0))
+            best = np.maximum(best, np.where(open_, score, UNKNOWN))
+        values[ply] = np.where(best > 0, top - best, np.where(best < 0, -top - best, 0)).astype(np.int8)
+        following = (keys, values[ply])
+        report(f"ply {start + ply}: valued")
+    return values
+
+
+def build(size: int, path: str, moves=(), block: int = BLOCK_RECORDS, report=print) -> int:
+    """
+    Value every position reachable from a root and write the tablebase
+
+    :param size: Width of the board
+    :param path: Tablebase file to write
+    :param moves: Moves (0-based columns) from the empty board to the root
+    :param block: Records per compressed block
+    :return: Number of records written
+    """
+
+    import numpy as np
+
+    start = time.perf_counter()
+    moves = list(moves)
+    levels = _levels(size, moves, report)
+    values = _values(size, len(moves), levels, report)
+    keys = np.concatenate([level[0] for level in levels])
+    values = np.concatenate(values)
+    levels = None
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+
+    blocks = (len(keys) + block - 1) // block
+    firsts = keys[::block].astype('<u8')
+    offsets = np.zeros(blocks + 1, '<u8')
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, size, len(moves), block, blocks, len(keys)))
+        file.write(bytes(moves))
+        position = HEADER.size + len(moves) + 8 * blocks + 8 * (blocks + 1)
+        file.seek(position)
+        for index in range(blocks):
+            part = keys[index * block:(index + 1) * block]
+            # Byte j of every delta, then byte j + 1 ...: the high bytes are mostly zero and compress away
+            planes = (part - part[0]).astype('<u8').view(np.uint8).reshape(-1, 8).T
+            data = zlib.compress(planes.tobytes() + values[index * block:(index + 1) * block].tobytes())
+            file.write(data)
+            offsets[index] = position
+            position += len(data)
+        offsets[blocks] = position
+        file.seek(HEADER.size + len(moves))
+        file.write(firsts.tobytes() + offsets.tobytes())
+    report(f"{len(keys):,} positions written to {path} ({position:,} bytes) in {time.perf_counter() - start:.1f}s")
+    return len(keys)
+
+
+class Tablebase:
+    """
+    Read-only view of a tablebase file
+
+    Attributes:
+    -----------
+    size --> Width of the board
+    shape --> (columns, rows, connect) of the board, always square with
+              four to connect
+    moves --> Moves from the empty board to the root of the tablebase
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} is not a tablebase")
+        _, self.size, count, self._block, blocks, self._count = HEADER.unpack(header)
+        self.shape = (self.size, self.size, CONNECT)
+        self.moves = list(self._file.read(count))
+        self._firsts = array('Q', self._file.read(8 * blocks))
+        self._offsets = array('Q', self._file.read(8 * (blocks + 1)))
+        if sys.byteorder == 'big':
+            self._firsts.byteswap()
+            self._offsets.byteswap()
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return self._count
+
+    def _read(self, index: int) -> tuple:
+        """
+        Keys and values of a block, the last CACHED_BLOCKS kept decoded
+        """
+
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+        self._file.seek(self._offsets[index])
+        data = zlib.decompress(self._file.read(self._offsets[index + 1] - self._offsets[index]))
+        records = len(data) // 9
+        interleaved = bytearray(8 * records)
+        for byte in range(8):
+            interleaved[byte::8] = data[byte * records:(byte + 1) * records]
+        deltas = array('Q', bytes(interleaved))
+        if sys.byteorder == 'big':
+            deltas.byteswap()
+        first = self._firsts[index]
+        block = ([first + delta for delta in deltas], data[8 * records:])
+        self._cache[index] = block
+        if len(self._cache) > CACHED_BLOCKS:
+            self._cache.popitem(last=False)
+        return block
+
+    def probe(self, position: Position):
+        """
+        Look up a position
+
+        :param position: Position with the players alternating
+        :return: TableEntry, None when the position is not in the tablebase
+        """
+
+        if position.shape != self.shape or position.count < len(self.moves) or not self._count:
+            return None
+        key = position.canonical_key()[0]
+        index = bisect.bisect_right(self._firsts, key) - 1
+        if index < 0:
+            return None
+        keys, values = self._read(index)
+        found = bisect.bisect_left(keys, key)
+        if found == len(keys) or keys[found] != key:
+            return None
+        value = values[found] - 256 if values[found] > 127 else values[found]
+        if value:
+            return TableEntry(1 if value > 0 else -1, abs(value))
+        return TableEntry(0, self.size * self.size - position.count)
+
+    def analyse(self, position: Position) -> dict:
+        """
+        Score every legal column of a position on the Solver's scale:
+        WIN - n for a win n plies away, -(WIN - n) for a loss, 0 for a draw
+
+        :return: {column: score}, empty when the position is not in the tablebase
+        """
+
+        if position.shape != self.shape or position.has_won(1) or position.has_won(2) or position.is_full():
+            return {}
+        player = position.turn
+        scores = {}
+        for col in position.legal_moves():
+            position.play(col)
+            try:
+                if position.has_won(player):
+                    scores[col] = WIN - 1
+                elif position.is_full():
+                    scores[col] = 0
+                else:
+                    entry = self.probe(position)
+                    if entry is None:
+                        return {}
+                    scores[col] = 0 if not entry.value else -entry.value * (WIN - entry.distance - 1)
+            finally:
+                position.undo()
+        return scores
+
+    def best_move(self, position: Position) -> tuple:
+        """
+        :return: (column, score) of the best move, (-1, 0) when the
+                 position is not in the tablebase
+        """
+
+        scores = self.analyse(position)
+        if not scores:
+            return -1, 0
+        col = max(centre_order(self.size), key=lambda col: scores.get(col, -2 * WIN))
+        return col, scores[col]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour tablebase', description='Build or read a tablebase')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='value every position reachable from a root')
+    build_parser.add_argument('--size', type=int, default=5, help='board size [5...10]')
+    build_parser.add_argument('--moves', default='', help='moves from the empty board to the root as 1-based columns')
+    build_parser.add_argument('--out', required=True, help='tablebase file to write')
+    probe_parser = commands.add_parser('probe', help='look up a position')
+    probe_parser.add_argument('--table', required=True, help='tablebase file')
+    probe_parser.add_argument('--moves', default='', help='moves played so far as 1-based columns')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        return build(args.size, args.out, parse_moves(args.moves))
+    with Tablebase(args.table) as table:
+        position = Position(table.size)
+        for col in parse_moves(args.moves):
+            position.play(col)
+        entry = table.probe(position)
+        if entry is None:
+            print('not in the tablebase')
+            return None
+        result = ('draw', 'win', 'loss')[entry.value]
+        print(f"{result} for player {position.turn} in {entry.distance} plies")
+        col, score = table.best_move(position)
+        print(f"best column {col + 1}  score {score}")
+        return entry
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Round-robin tournament between bots
+
+Every pair of bots plays the given number of games on every board size,
+each bot moving first in half of them. Games are played in batches
+spread over a process pool and every finished game is written to the
+results file (CSV or JSON lines, chosen by the file extension) as soon
+as its batch comes back. A win/draw/loss table and the number of games
+per second are printed at the end.
+
+python -m connectfour tournament --bots random greedy solver:2 solver:4 --sizes 5 6 7 --games 100
+"""
+
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .engine import Game, ON
+from .bots import make_bot
+
+FIELDS = ["size", "player1", "player2", "winner", "moves", "seconds", "record"]
+
+
+def play_game(size: int, bot1, bot2, opening: int = 0, rng=None) -> dict:
+    """
+    Play one game between two bots
+
+    :param size: Width of the board
+    :param bot1: Bot moving first
+    :param bot2: Bot moving second
+    :param opening: Number of random moves played before the bots take over
+    :param rng: Random number generator for the opening moves
+    :return: Row of the results file (without the bot names)
+    """
+
+    start = time.perf_counter()
+    game = Game(size)
+    bots = (None, bot1, bot2)
+    while game.outcome == ON:
+        if game.position.count < opening:
+            game.play(rng.choice(game.legal_moves()))
+        else:
+            game.play(bots[game.player].move(game))
+    return {
+        "size": size,
+        "winner": game.winner,
+        "moves": game.position.count,
+        "seconds": round(time.perf_counter() - start, 6),
+        "record": ','.join(str(col + 1) for col in game.moves),
+    }
+
+
+def play_batch(task: tuple) -> list:
+    """
+    Play a batch of games in a worker process
+
+    :param task: (size, bot1 spec, bot2 spec, seed, games, opening)
+    :return: List of rows of the results file
+    """
+
+    size, spec1, spec2, seed, games, opening = task
+    rng = random.Random(seed)
+    bot1 = make_bot(spec1, rng.random())
+    bot2 = make_bot(spec2, rng.random())
+    rows = []
+    for _ in range(games):
+        row = play_game(size, bot1, bot2, opening, rng)
+        row["player1"] = spec1
+        row["player2"] = spec2
+        rows.append(row)
+    return rows
+
+
+def schedule(bots: list, sizes: list, games: int, batch: int, seed: int, opening: int) -> list:
+    """
+    Split the tournament into batches of at most batch games
+
+    :return: List of tasks for play_batch
+    """
+
+    tasks = []
+    for size in sizes:
+        for spec1, spec2 in itertools.combinations(bots, 2):
+            # Each bot moves first in half of the games of the pair
+            for first, second, count in ((spec1, spec2, (games + 1) // 2), (spec2, spec1, games // 2)):
+                for start in range(0, count, batch):
+                    task_seed = random.Random(f"{seed}/{size}/{first}/{second}/{start}").getrandbits(32)
+                    tasks.append((size, first, second, task_seed, min(batch, count - start), opening))
+    return tasks
+
+
+class ResultWriter:
+    """
+    Append game rows to a CSV or JSON lines file as they arrive
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, 'w', newline='')
+        self.jsonl = not path.endswith('.csv')
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            self.writer.writeheader()
+
+    def write(self, rows: list):
+        if self.jsonl:
+            self.file.write(''.join(json.dumps(row) + '\n' for row in rows))
+        else:
+            self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def score_table(rows, bots: list) -> dict:
+    """
+    Win/draw/loss count of every bot
+
+    :return: {bot: [wins, draws, losses]}
+    """
+
+    table = {bot: [0, 0, 0] for bot in bots}
+    for row in rows:
+        names = (None, row["player1"], row["player2"])
+        if row["winner"]:
+            table[names[row["winner"]]][0] += 1
+            table[names[3 - row["winner"]]][2] += 1
+        else:
+            table[names[1]][1] += 1
+            table[names[2]][1] += 1
+    return table
+
+
+def run(bots: list, sizes: list, games: int, out: str, workers: int = None, batch: int = 20,
+        seed: int = 0, opening: int = 0, report=print) -> dict:
+    """
+    Play a tournament
+
+    :param bots: Bot descriptions (see bots.make_bot)
+    :param sizes: Board sizes to play on
+    :param games: Games per pair of bots per board size
+    :param out: Path of the results file (.csv or .jsonl)
+    :param workers: Worker processes, one per CPU by default
+    :param batch: Games per task sent to a worker
+    :param seed: Seed of the tournament
+    :param opening: Random moves at the start of every game
+    :param report: Function used to print the summary
+    :return: {bot: [wins, draws, losses]}
+    """
+
+    for spec in bots:
+        make_bot(spec)  # Fail before starting any process if a bot is unknown
+    tasks = schedule(bots, sizes, games, batch, seed, opening)
+    table = {bot: [0, 0, 0] for bot in bots}
+    played = 0
+    start = time.perf_counter()
+    with ResultWriter(out) as writer, ProcessPoolExecutor(workers) as pool:
+        for future in as_completed([pool.submit(play_batch, task) for task in tasks]):
+            rows = future.result()
+            writer.write(rows)
+            for bot, (wins, draws, losses) in score_table(rows, bots).items():
+                table[bot][0] += wins
+                table[bot][1] += draws
+                table[bot][2] += losses
+            played += len(rows)
+    seconds = time.perf_counter() - start
+
+    width = max(len(bot) for bot in bots) + 2
+    report(f"{'bot':<{width}}{'win':>8}{'draw':>8}{'loss':>8}")
+    for bot in sorted(bots, key=lambda b: (-table[b][0], table[b][2])):
+        report(f"{bot:<{width}}" + ''.join(f"{count:>8}" for count in table[bot]))
+    report(f"{played} games in {seconds:.2f}s ({played / seconds if seconds else 0:.1f} games/sec)")
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m connectfour tournament',
+                                     description='Round-robin tournament between bots')
+    parser.add_argument('--bots', nargs='+', default=['random', 'greedy', 'solver:2'],
+                        help='bots to play, e.g. random greedy solver:4')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[5, 6, 7, 8, 9, 10], help='board sizes')
+    parser.add_argument('--games', type=int, default=20, help='games per pair of bots per board size')
+    parser.add_argument('--out', default='tournament.jsonl', help='results file (.csv or .jsonl)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--batch', type=int, default=20, help='games per batch sent to a worker')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--opening', type=int, default=0, help='random moves at the start of every game')
+    args = parser.parse_args(argv)
+    return run(args.bots, args.sizes, args.games, args.out, args.workers, args.batch, args.seed, args.opening)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+"""
+Persistent positions and variation trees
+
+A Line is an immutable position which shares everything but the last
+move with its parent: it holds the parent, the column played and the
+two bitboards after the move. The board of the player who did not move
+is the parent's own integer, so a new position costs one small object
+and one new integer, however big the board is.
+
+A VariationTree keeps every Line an analyst has reached, numbered in
+the order they were made. Going to any of them, taking moves back and
+playing them again only moves a pointer:
+
+    tree = VariationTree(7)
+    for col in (3, 3, 2):
+        tree.play(col)
+    tree.undo()                 # back to 4 4
+    tree.play(4)                # a second variation, 4 4 5
+    tree.goto(3)                # back to 4 4 3 at once
+"""
+
+import functools
+from array import array
+from collections import namedtuple
+from .bitboard import Position, CONNECT, mirror_key
+
+Geometry = namedtuple("Geometry", ["size", "rows", "connect", "stride", "bottoms", "columns", "tops", "shifts", "runs",
+                                   "cells"])
+Geometry.__doc__ = """
+Bit masks of a board shape, shared by every Line on it
+
+bottoms --> Bit of the bottom cell of each column
+columns --> Bits of the cells of each column
+tops --> Bit of the top cell of each column
+shifts --> Bit distance between neighbouring cells in the four directions
+runs --> Shifts which reduce a board to its runs of connect coins (see
+         bitboard.run_steps)
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def geometry(size: int, rows: int = 0, connect: int = CONNECT) -> Geometry:
+    """
+    Masks of a board shape, made once per shape
+
+    Raises ValueError for a shape bitboard.Position does not play
+    """
+
+    shape = Position(size, rows, connect)
+    stride = shape.stride
+    bottoms = tuple(1 << (col * stride) for col in range(size))
+    return Geometry(size, shape.rows, connect, stride, bottoms,
+                    tuple(((1 << shape.rows) - 1) << (col * stride) for col in range(size)),
+                    tuple(1 << (col * stride + shape.rows - 1) for col in range(size)),
+                    shape.shifts, shape.runs, shape.cells)
+
+
+def has_run(board: int, shape: Geometry) -> bool:
+    """
+    Check if a bitboard holds connect coins in a row (see Position.has_won)
+    """
+
+    if shape.connect == CONNECT:
+        for shift in shape.shifts:
+            pairs = board & (board >> shift)
+            if pairs & (pairs >> 2 * shift):
+                return True
+        return False
+    for steps in shape.runs:
+        run = board
+        for step in steps:
+            run &= run >> step
+        if run:
+            return True
+    return False
+
+
+class Line(namedtuple("Line", ["parent", "col", "player", "one", "two", "count", "winner", "shape"])):
+    """
+    Immutable position reached by a line of play
+
+    Attributes:
+    -----------
+    parent --> Line before the last move, None for the empty board
+    col --> Column of the last move (0-based), -1 for the empty board
+    player --> Index of the player who made the last move, 0 for the
+               empty board
+    one --> Bitboard of player 1's coins (bit layout of bitboard.Position)
+    two --> Bitboard of player 2's coins
+    count --> Coins on the board
+    winner --> Index of the player who has connect in a row, 0 if none
+    shape --> Geometry of the board
+
+    Additional Info:
+    ----------------
+    play() returns a new Line and leaves this one as it is, so a Line
+    can be kept, shared and gone back to without copying anything.
+    Players alternate, player 1 first.
+
+    Two lines are equal when they hold the same coins on the same board
+    shape, whatever order the moves were played in, so a dict or set of
+    lines merges transpositions.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def empty(cls, size: int = 7, rows: int = 0, connect: int = CONNECT):
+        """
+        Line of the empty board
+
+        :param size: Width of the board
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win
+        """
+
+        return cls(None, -1, 0, 0, 0, 0, 0, geometry(size, rows, connect))
+
+    @classmethod
+    def from_moves(cls, moves, size: int = 7, rows: int = 0, connect: int = CONNECT):
+        """
+        Line reached by playing columns (0-based) from the empty board
+        """
+
+        line = cls.empty(size, rows, connect)
+        for col in moves:
+            line = line.play(col)
+        return line
+
+    def __repr__(self):
+        return f"Line(moves={''.join(str(col + 1) for col in self.moves())!r}, winner={self.winner})"
+
+    def __eq__(self, other):
+        return isinstance(other, Line) and self.one == other.one and self.two == other.two \
+            and self.shape == other.shape
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.one, self.two, self.shape.size, self.shape.rows))
+
+    @property
+    def turn(self) -> int:
+        """
+        Index of the player to move
+        """
+
+        return 2 if self.player == 1 else 1
+
+    def can_play(self, col: int) -> bool:
+        """
+        Check if a coin can be dropped in a column: the game is not over
+        and the column exists and is not full
+        """
+
+        return not self.winner and 0 <= col < self.shape.size and not (self.one | self.two) & self.shape.tops[col]
+
+    def legal_moves(self) -> list:
+        return [col for col in range(self.shape.size) if self.can_play(col)]
+
+    def is_full(self) -> bool:
+        return self.count == self.shape.cells
+
+    def play(self, col: int):
+        """
+        Drop a coin for the player to move
+
+        :param col: Column index (0-based)
+        :return: New Line, this one is not changed
+        """
+
+        if not self.can_play(col):
+            raise ValueError("The game is over" if self.winner else f"Column {col + 1} is not available")
+        shape = self.shape
+        # Adding the bottom bit of a column to its coins carries into the lowest empty cell
+        bit = ((self.one | self.two) + shape.bottoms[col]) & shape.columns[col]
+        if self.player == 1:
+            two = self.two | bit
+            return Line(self, col, 2, self.one, two, self.count + 1, 2 if has_run(two, shape) else 0, shape)
+        one = self.one | bit
+        return Line(self, col, 1, one, self.two, self.count + 1, 1 if has_run(one, shape) else 0, shape)
+
+    def moves(self) -> list:
+        """
+        Columns played from the empty board to this position, in order
+        """
+
+        moves = []
+        line = self
+        while line.parent is not None:
+            moves.append(line.col)
+            line = line.parent
+        moves.reverse()
+        return moves
+
+    def cell(self, row: int, col: int) -> int:
+        """
+        Value of a cell: 0 if empty else the index of the player
+
+        :param row: Row index where 0 is the top of the board
+        :param col: Column index
+        """
+
+        bit = 1 << (col * self.shape.stride + self.shape.rows - 1 - row)
+        return 1 if self.one & bit else 2 if self.two & bit else 0
+
+    def key(self) -> int:
+        """
+        Position.key() of the position
+        """
+
+        return self.one + (self.one | self.two) + sum(self.shape.bottoms)
+
+    def canonical_key(self) -> tuple:
+        key = self.key()
+        mirrored = mirror_key(key, self.shape.size, self.shape.rows)
+        return (mirrored, True) if mirrored < key else (key, False)
+
+    def to_position(self) -> Position:
+        """
+        bitboard.Position of this line, with its move list, for the engines
+        """
+
+        shape = self.shape
+        position = Position(shape.size, shape.rows, shape.connect)
+        for col in self.moves():
+            position.play(col)
+        return position
+
+
+class VariationTree:
+    """
+    Every position explored from one starting position, with undo, redo
+    and any number of variations
+
+    Attributes:
+    -----------
+    lines --> Line of every node, by node number. Node 0 is the root
+    parents --> Node number of the parent of every node, -1 for the
+                root >> type = array
+    children --> Node numbers of the children of every node, the main
+                 line first, None while the node has none
+    current --> Node number of the position being looked at
+    nexts --> Child redo() goes to from every node, -1 for none: the last
+              child left by undo(), or else the main line >> type = array
+
+    Additional Info:
+    ----------------
+    A node is a Line, which shares its board with its parent, plus a few
+    numbers in flat arrays, so thousands of sidelines cost a few hundred
+    bytes each and no board is ever copied. Playing a move the current
+    node already has a child for goes to that child instead of adding
+    the same position twice.
+    """
+
+    def __init__(self, size: int = 7, rows: int = 0, connect: int = CONNECT, moves=()):
+        """
+        Start a tree at the empty board, or at the end of a line of moves
+
+        :param size: Width of the board
+        :param rows: Height of the board, the same as the width by default
+        :param connect: Coins in a row needed to win
+        :param moves: Columns (0-based) played from the empty board, they
+                      become the main line
+        """
+
+        self.lines = [Line.empty(size, rows, connect)]
+        self.parents = array('i', [-1])
+        self.children = [None]
+        self.nexts = array('i', [-1])
+        self.current = 0
+        for col in moves:
+            self.play(col)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def line(self) -> Line:
+        """
+        Line of the current node
+        """
+
+        return self.lines[self.current]
+
+    def play(self, col: int) -> int:
+        """
+        Play a move from the current node, adding a variation if it is new
+
+        :param col: Column index (0-based)
+        :return: Node number of the position reached, now the current node
+        """
+
+        node = self.current
+        for child in self.children[node] or ():
+            if self.lines[child].col == col:
+                break
+        else:
+            line = self.lines[node].play(col)
+            child = len(self.lines)
+            self.lines.append(line)
+            self.parents.append(node)
+            self.children.append(None)
+            self.nexts.append(-1)
+            if self.children[node] is None:
+                self.children[node] = [child]
+            else:
+                self.children[node].append(child)
+        self.nexts[node] = child
+        self.current = child
+        return child
+
+    def undo(self) -> int:
+        """
+        Go back to the parent of the current node
+
+        :return: Column of the move taken back
+        """
+
+        node = self.current
+        if not node:
+            raise ValueError("There is no move to take back")
+        self.current = self.parents[node]
+        self.nexts[self.current] = node
+        return self.lines[node].col
+
+    def redo_column(self) -> int:
+        """
+        Column redo() would play, -1 when there is none
+        """
+
+        child = self.nexts[self.current]
+        if child < 0 and self.children[self.current]:
+            child = self.children[self.current][0]
+        return self.lines[child].col if child >= 0 else -1
+
+    def redo(self) -> int:
+        """
+        Play again the move last taken back from the current node, or the
+        main line move when none was
+
+        :return: Column of the move played
+        """
+
+        col = self.redo_column()
+        if col < 0:
+            raise ValueError("There is no move to play again")
+        self.play(col)
+        return col
+
+    def goto(self, node: int) -> Line:
+        """
+        Make any node the current one
+
+        :return: Its line
+        """
+
+        if not 0 <= node < len(self.lines):
+            raise IndexError(f"There is no node {node}")
+        self.current = node
+        return self.lines[node]
+
+    def variations(self, node: int = -1) -> list:
+        """
+        Columns of the moves explored from a node (the current one by
+        default), the main line first
+        """
+
+        node = self.current if node < 0 else node
+        return [self.lines[child].col for child in self.children[node] or ()]
+
+    def promote(self, node: int = -1):
+        """
+        Make the line to a node (the current one by default) the main line
+        """
+
+        node = self.current if node < 0 else node
+        while node > 0:
+            parent = self.parents[node]
+            siblings = self.children[parent]
+            siblings.remove(node)
+            siblings.insert(0, node)
+            node = parent
+
+    def main_line(self, node: int = 0) -> list:
+        """
+        Columns of the main line from a node (the root by default) to its end
+        """
+
+        moves = []
+        while self.children[node]:
+            node = self.children[node][0]
+            moves.append(self.lines[node].col)
+        return moves
@@ -0,0 +1,278 @@
+"""
+Win detection with precomputed lines
+
+For every board shape (width, height and the coins in a row needed to
+win) the lines of connect cells are listed once, along with the lines
+that pass through each cell. A WinTracker keeps, for both players, how
+many coins they have in every line. Dropping a coin only touches the
+lines through that cell, and the player has won as soon as one of
+those lines is full of their coins.
+
+Running this module checks the tracker against a brute-force scan of
+random games:  python -m connectfour.wincheck
+"""
+
+import random
+import functools
+from . import metrics
+from .bitboard import Position, CONNECT
+
+# Directions a line can run in, as (row step, column step) in mapping
+# coordinates where row 0 is the top of the board
+LEFT_RIGHT = 0
+UP_DOWN = 1
+LEFT_DIAGONAL = 2   # bottom-left --> top-right
+RIGHT_DIAGONAL = 3  # bottom-right --> top-left
+STEPS = ((0, 1), (1, 0), (1, -1), (1, 1))
+
+# (columns, rows, connect) of the boards other than the square ones checked by selfcheck
+VARIANTS = ((7, 6, 4), (9, 7, 5), (5, 12, 3), (12, 10, 6), (20, 20, 6), (20, 14, 10))
+
+
+class LineTable:
+    """
+    All the lines on a board of a given shape
+
+    Attributes:
+    -----------
+    size --> Width of the board
+    rows --> Height of the board
+    connect --> Cells in a line
+    lines --> Tuple of lines, each a tuple of connect (row, col) cells
+    direction --> Direction of each line (LEFT_RIGHT ... RIGHT_DIAGONAL)
+    through --> For every cell (row * size + col) the ids of the lines
+                containing it
+    through_dir --> For every cell the ids of the lines containing it,
+                    split by direction
+
+    Additional Info:
+    ----------------
+    A cell is part of at most connect lines per direction, so a move
+    never has to look at more than 4 * connect lines (16 for four in a
+    row) whatever the size of the board.
+    """
+
+    def __init__(self, size: int, rows: int = 0, connect: int = CONNECT):
+        rows = rows or size
+        self.size = size
+        self.rows = rows
+        self.connect = connect
+        lines = []
+        direction = []
+        through = [[] for _ in range(size * rows)]
+        through_dir = [[[] for _ in STEPS] for _ in range(size * rows)]
+        for way, (dr, dc) in enumerate(STEPS):
+            for row in range(rows):
+                for col in range(size):
+                    cells = tuple((row + k * dr, col + k * dc) for k in range(connect))
+                    if not all(0 <= r < rows and 0 <= c < size for r, c in cells):
+                        continue
+                    for r, c in cells:
+                        through[r * size + c].append(len(lines))
+                        through_dir[r * size + c][way].append(len(lines))
+                    lines.append(cells)
+                    direction.append(way)
+        self.lines = tuple(lines)
+        self.direction = tuple(direction)
+        self.through = tuple(tuple(ids) for ids in through)
+        self.through_dir = tuple(tuple(tuple(ids) for ids in ways) for ways in through_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def line_table(size: int, rows: int = 0, connect: int = CONNECT) -> LineTable:
+    """
+    Line table for a board shape, built once and shared by every game
+    """
+
+    return LineTable(size, rows or size, connect)
+
+
+class WinTracker:
+    """
+    Per-line coin counters for both players of one game
+
+    Attributes:
+    -----------
+    size --> Width of the board
+    connect --> Coins in a row needed to win
+    table --> Shared LineTable for the board shape
+    counts --> [unused, player 1 counts, player 2 counts] with one
+               counter per line >> type = list
+    """
+
+    __slots__ = ('size', 'connect', 'table', 'counts')
+
+    def __init__(self, size: int, rows: int = 0, connect: int = CONNECT):
+        self.size = size
+        self.connect = connect
+        self.table = line_table(size, rows, connect)
+        self.counts = [None, [0] * len(self.table.lines), [0] * len(self.table.lines)]
+
+    def place(self, row: int, col: int, player: int):
+        """
+        Record a coin and report if it completed a line
+
+        :param row: Row index (mapping coordinates) of the coin
+        :param col: Column index of the coin
+        :param player: Index of the player owning the coin
+        :return: The completed line as a tuple of (row, col) cells, else None
+        """
+
+        counts = self.counts[player]
+        connect = self.connect
+        won = -1
+        for line in self.table.through[row * self.size + col]:
+            counts[line] += 1
+            if counts[line] == connect:
+                won = line
+        return self.table.lines[won] if won >= 0 else None
+
+    def remove(self, row: int, col: int, player: int):
+        """
+        Forget a coin, used when a move is taken back
+        """
+
+        counts = self.counts[player]
+        for line in self.table.through[row * self.size + col]:
+            counts[line] -= 1
+
+    def winning_line(self, row: int, col: int, player: int, direction: int = -1):
+        """
+        Look for a complete line through a cell without changing anything
+
+        :param row: Row index (mapping coordinates) of the cell
+        :param col: Column index of the cell
+        :param player: Index of the player
+        :param direction: Only look at lines in this direction. All
+                          directions are checked by default
+        :return: The complete line as a tuple of (row, col) cells, else None
+        """
+
+        counts = self.counts[player]
+        cell = row * self.size + col
+        ids = self.table.through[cell] if direction < 0 else self.table.through_dir[cell][direction]
+        for line in ids:
+            if counts[line] == self.connect:
+                return self.table.lines[line]
+        return None
+
+    @classmethod
+    def from_position(cls, position: Position):
+        """
+        Build the counters for every coin already on a position
+        """
+
+        self = cls(position.size, position.rows, position.connect)
+        for row in range(position.rows):
+            for col in range(position.size):
+                player = position.cell(row, col)
+                if player:
+                    self.place(row, col, player)
+        return self
+
+
+def line_through(mapping, row: int, col: int, player: int, direction: int = -1):
+    """
+    Look for a complete line through a cell by reading the board
+
+    :param mapping: Position (or anything with a cell(row, col) method)
+    :param row: Row index (mapping coordinates) of the cell
+    :param col: Column index of the cell
+    :param player: Index of the player
+    :param direction: Only look at lines in this direction. All
+                      directions are checked by default
+    :return: The complete line as a tuple of (row, col) cells, else None
+
+    Additional Info:
+    ----------------
+    Used when no WinTracker is kept for the game. It still reads only
+    the cells of the lines through (row, col) and stops at the first
+    cell of a line that does not belong to the player.
+    """
+
+    table = line_table(mapping.size, len(mapping), getattr(mapping, 'connect', CONNECT))
+    cell = row * mapping.size + col
+    ids = table.through[cell] if direction < 0 else table.through_dir[cell][direction]
+    for line in ids:
+        for r, c in table.lines[line]:
+            if mapping.cell(r, c) != player:
+                break
+        else:
+            return table.lines[line]
+    return None
+
+
+def brute_force_winner(mapping: list, connect: int = CONNECT) -> set:
+    """
+    Reference check: scan every cell in every direction
+
+    :param mapping: 2-dimensional list of 0/1/2 values
+    :param connect: Coins in a row needed to win
+    :return: Set of the players who have connect in a row
+    """
+
+    rows, size = len(mapping), len(mapping[0])
+    winners = set()
+    for row in range(rows):
+        for col in range(size):
+            player = mapping[row][col]
+            if not player:
+                continue
+            for dr, dc in STEPS:
+                run = 0
+                r, c = row, col
+                while 0 <= r < rows and 0 <= c < size and mapping[r][c] == player:
+                    run += 1
+                    r, c = r + dr, c + dc
+                if run >= connect:
+                    winners.add(player)
+    return winners
+
+
+def selfcheck(games: int = 2000, seed: int = 0):
+    """
+    Play random games on every square board size and a few other
+    shapes, and compare the tracker, the board reading check and the
+    bitboard check with brute_force_winner
+
+    :param games: Number of games per board size (a tenth of that on
+                  the other shapes, which are slower to brute-force)
+    :param seed: Seed of the random number generator
+    """
+
+    rng = random.Random(seed)
+    shapes = [(size, size, CONNECT, games) for size in range(5, 11)]
+    shapes += [(size, rows, connect, max(1, games // 10)) for size, rows, connect in VARIANTS]
+    for size, rows, connect, count in shapes:
+        for _ in range(count):
+            position = Position(size, rows, connect)
+            tracker = WinTracker(size, rows, connect)
+            while True:
+                col = rng.choice(position.legal_moves())
+                player = position.turn
+                row = position.play(col)
+                line = tracker.place(row, col, player)
+                expected = player in brute_force_winner(position.to_mapping(), connect)
+                assert (line is not None) == expected, (size, rows, connect, position.moves)
+                assert (line_through(position, row, col, player) is not None) == expected
+                assert position.has_won(player) == expected
+                if line is not None:
+                    assert all(position.cell(r, c) == player for r, c in line)
+                if expected or position.is_full():
+                    break
+            # Taking every move back must leave all the counters at zero
+            while position.moves:
+                col = position.moves[-1]
+                row = position.top_row(col)
+                tracker.remove(row, col, position.cell(row, col))
+                position.undo()
+            assert not any(tracker.counts[1]) and not any(tracker.counts[2])
+    return True
+
+
+metrics.hook(WinTracker, 'place', 'win_check_seconds', site='WinTracker.place')
+
+
+if __name__ == '__main__':
+    selfcheck()
+    print('WinTracker agrees with the brute-force reference on all board shapes')